@@ -0,0 +1,163 @@
+# analysis_cache.py
+"""
+按 (班级, 小组, 轮次) 缓存比较结果的 LRU。
+评分只会在 rate_round 提交时变化，提交后只让对应的那一组失效。
+缓存只在本进程内，其它 worker 的 rate_round 不会调用这里的 invalidate，
+所以每个条目同时记下写入时该组的共享评分版本号（version_func），版本号变了就当作未命中。
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from analysis_engine import all_group_comparisons, group_comparison, rated_groups
+
+# 每个条目除 numpy 数组外的固定开销估计（字典项、对象头等）
+ENTRY_OVERHEAD = 512
+
+
+def entry_size(comparison):
+    ids = comparison.reviewers + comparison.targets
+    return comparison.nbytes + sum(sys.getsizeof(x) for x in ids) + ENTRY_OVERHEAD
+
+
+class AnalysisCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, version_func=None):
+        """version_func(班级, 小组, 轮次) 返回该组当前的评分版本号，None 表示只靠 invalidate 失效"""
+        self.max_bytes = max_bytes
+        self.version_func = version_func
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (comparison, size)
+        self._bytes = 0
+        # 每次失效 +1；重建期间发生失效时丢弃重建结果，避免把旧数据放回缓存
+        self._generations = {}
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.rebuild_seconds = 0.0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def version(self, key):
+        return None if self.version_func is None else self.version_func(*key)
+
+    def get(self, key, version=None):
+        """version 为调用方读到的当前版本号，不传时在这里读取"""
+        if version is None:
+            version = self.version(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] != version:
+                # 其它 worker 写入了评分
+                self._entries.pop(key)
+                self._bytes -= entry[1]
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def generation(self, key):
+        return self._generations.get(key, 0)
+
+    def put(self, key, comparison, generation=None, version=None):
+        """version 应是重建之前读到的版本号，重建期间的写入会让下次读取重新构建"""
+        size = entry_size(comparison)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(key, 0):
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (comparison, size, version)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def record_rebuild(self, seconds, count=1):
+        with self._lock:
+            self.rebuilds += count
+            self.rebuild_seconds += seconds
+
+    def get_or_build(self, key, builder):
+        version = self.version(key)
+        comparison = self.get(key, version)
+        if comparison is None:
+            generation = self.generation(key)
+            start = time.perf_counter()
+            comparison = builder()
+            self.record_rebuild(time.perf_counter() - start)
+            self.put(key, comparison, generation, version)
+        return comparison
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "rebuilds": self.rebuilds,
+                "rebuild_ms_total": round(self.rebuild_seconds * 1000, 3),
+                "rebuild_ms_avg": round(self.rebuild_seconds * 1000 / self.rebuilds, 3) if self.rebuilds else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale": self.stale,
+            }
+
+
+def cached_group_comparison(cache, class_id, group, round_num):
+    return cache.get_or_build(
+        (class_id, group, round_num),
+        lambda: group_comparison(class_id, group, round_num),
+    )
+
+
+def cached_all_group_comparisons(cache, round_num):
+    """命中的组直接取缓存，未命中的组合并成一次查询重建"""
+    result = {}
+    missing = []
+    generations = {}
+    versions = {}
+    for cls_id, grp in rated_groups(round_num):
+        key = (cls_id, grp, round_num)
+        versions[(cls_id, grp)] = version = cache.version(key)
+        comparison = cache.get(key, version)
+        if comparison is None:
+            missing.append((cls_id, grp))
+            generations[(cls_id, grp)] = cache.generation(key)
+        else:
+            result[(cls_id, grp)] = comparison
+    if missing:
+        start = time.perf_counter()
+        built = all_group_comparisons(round_num, groups=missing)
+        cache.record_rebuild(time.perf_counter() - start, count=len(built))
+        for (cls_id, grp), comparison in built.items():
+            cache.put((cls_id, grp, round_num), comparison, generations.get((cls_id, grp), 0),
+                      versions.get((cls_id, grp), cache.version((cls_id, grp, round_num))))
+            result[(cls_id, grp)] = comparison
+    return result
@@ -0,0 +1,142 @@
+# analysis_engine.py
+"""
+两两作品比较的向量化实现。
+每个 (班级, 小组) 的评分加载成 评审人×作品 的 total_score 矩阵，
+所有作品对的比较结果一次算成符号矩阵：1 表示 i>j，-1 表示 j>i，0 表示相等。
+"""
+import numpy as np
+from sqlalchemy import tuple_
+
+from instrumentation import stage
+from models import db, Rating
+
+
+class GroupComparison:
+    """一个评审小组在某一轮的比较结果"""
+
+    def __init__(self, reviewers, targets, scores, rated):
+        self.reviewers = reviewers          # 排好序的评审人学号
+        self.targets = targets              # 排好序的被评作品学号
+        self.scores = scores                # float64 (评审人数, 作品数)，未评分为 0
+        self.rated = rated                  # bool (评审人数, 作品数)，是否有评分记录
+        # 与 combinations(targets, 2) 相同顺序的作品对下标
+        self.pair_i, self.pair_j = np.triu_indices(len(targets), k=1)
+        # (作品对数, 评审人数) 的 int8 符号矩阵
+        self.signs = np.sign(scores[:, self.pair_i] - scores[:, self.pair_j]).T.astype(np.int8)
+
+    @property
+    def nbytes(self):
+        return (self.scores.nbytes + self.rated.nbytes + self.signs.nbytes
+                + self.pair_i.nbytes + self.pair_j.nbytes)
+
+    def to_table(self):
+        """与原来逐格拼字符串的 JSON 完全一致"""
+        reviewer_keys = [str(rid) for rid in self.reviewers]
+        table_data = []
+        for p, (a, b) in enumerate(zip(self.pair_i.tolist(), self.pair_j.tolist())):
+            i, j = self.targets[a], self.targets[b]
+            # 每个作品对只格式化三种字符串，按符号取用
+            comps = {1: f"{i}>{j}", -1: f"{j}>{i}", 0: f"{i}={j}"}
+            row = {"pair": (i, j)}
+            row.update(zip(reviewer_keys, [comps[s] for s in self.signs[p].tolist()]))
+            table_data.append(row)
+        return {
+            "reviewers": self.reviewers,
+            "data": table_data
+        }
+
+    def to_compact(self):
+        """只返回符号矩阵，signs[p][r] 对应 pairs[p] 和 reviewers[r]"""
+        return {
+            "reviewers": self.reviewers,
+            "targets": self.targets,
+            "pairs": np.column_stack((self.pair_i, self.pair_j)).tolist(),
+            "signs": self.signs.tolist()
+        }
+
+
+def total_scores(professional, innovation):
+    # 与 app.total_score 相同的公式
+    P = np.asarray(professional, dtype=np.float64)
+    I = np.asarray(innovation, dtype=np.float64)
+    return (1 - (P - 1) / 4) * P + ((P - 1) / 4) * I
+
+
+def build_group(reviewer_ids, target_ids, scores):
+    """reviewer_ids/target_ids/scores 为等长数组；同一 (评审人, 作品) 多条记录时后者生效"""
+    reviewers, r_idx = np.unique(np.asarray(reviewer_ids, dtype=str), return_inverse=True)
+    targets, t_idx = np.unique(np.asarray(target_ids, dtype=str), return_inverse=True)
+    matrix = np.zeros((len(reviewers), len(targets)), dtype=np.float64)
+    matrix[r_idx, t_idx] = scores
+    rated = np.zeros(matrix.shape, dtype=bool)
+    rated[r_idx, t_idx] = True
+    return GroupComparison(reviewers.tolist(), targets.tolist(), matrix, rated)
+
+
+def rated_groups(round_num):
+    """该轮有评分记录的所有 (班级, 小组)"""
+    rows = (
+        db.session.query(Rating.reviewer_class, Rating.reviewer_group)
+        .filter(Rating.round == round_num)
+        .distinct()
+        .all()
+    )
+    return sorted((int(c), int(g)) for c, g in rows)
+
+
+def _query_rows(round_num, class_id=None, group=None, groups=None):
+    query = db.session.query(
+        Rating.reviewer_class,
+        Rating.reviewer_group,
+        Rating.reviewer_id,
+        Rating.target_id,
+        Rating.professional_score,
+        Rating.innovation_score,
+    ).filter(Rating.round == round_num)
+    if class_id is not None:
+        query = query.filter(Rating.reviewer_class == class_id, Rating.reviewer_group == group)
+    if groups is not None:
+        query = query.filter(tuple_(Rating.reviewer_class, Rating.reviewer_group).in_(groups))
+    return query.order_by(Rating.id).all()
+
+
+def group_comparison(class_id, group, round_num=1):
+    with stage("analysis_query"):
+        rows = _query_rows(round_num, class_id, group)
+    if not rows:
+        return build_group([], [], np.zeros(0))
+    with stage("analysis_compute"):
+        _, _, reviewer_ids, target_ids, P, I = zip(*rows)
+        return build_group(reviewer_ids, target_ids, total_scores(P, I))
+
+
+def all_group_comparisons(round_num=1, groups=None):
+    """
+    一次查询全部评分（或 groups 指定的若干组），排序后按 (班级, 小组) 切分，
+    返回 {(class_id, group): GroupComparison}
+    """
+    with stage("analysis_query"):
+        rows = _query_rows(round_num, groups=groups)
+    if not rows:
+        return {}
+    with stage("analysis_compute"):
+        return _split_groups(rows)
+
+
+def _split_groups(rows):
+    classes, groups, reviewer_ids, target_ids, P, I = (np.asarray(col) for col in zip(*rows))
+    scores = total_scores(P, I)
+
+    # 稳定排序，保留同组内的插入顺序（重复评分后者生效）
+    order = np.lexsort((groups, classes))
+    classes, groups = classes[order], groups[order]
+    reviewer_ids, target_ids, scores = reviewer_ids[order], target_ids[order], scores[order]
+    boundaries = np.flatnonzero((np.diff(classes) != 0) | (np.diff(groups) != 0)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(order)]))
+
+    result = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        key = (int(classes[start]), int(groups[start]))
+        result[key] = build_group(reviewer_ids[start:end], target_ids[start:end], scores[start:end])
+    return result
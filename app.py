@@ -1,29 +1,146 @@
 # app.py
-from collections import defaultdict
-from itertools import combinations
-import random
-from flask import Flask, request, jsonify, Response, session
-import os, shutil, zipfile, io, csv
+from flask import Flask, request, jsonify, Response, session, g, stream_with_context
+import os
 from datetime import datetime, timedelta
 
-from sqlalchemy import func
+from sqlalchemy import func, insert, or_
+from sqlalchemy.exc import IntegrityError
 from models import db, Student, Project, GroupAssignment, Rating
+from blobstore import BlobStore
+import sqlite_profile
+from rating_writer import RatingWriter
+from ingest import ExtractLimits, IngestError, StageTimer, ingest_archive
+from manifest import preview_path, replace_files, search as search_manifests
+from jobs import QueueFull, submission_queue
+from uploads import UploadError, chunked_uploads
+from progress import event_stream, progress_tracker
+from recorder import request_recorder
+from preview import send_preview
+from state import SECOND_ROUND_OPEN, SUBMISSION_DEADLINE, shared_state
+from identity import current_student, get_student, identity_cache
+from versions import (assignments_version, bump_ratings, bump_submissions, etag_versioned,
+                      ratings_version, roster_version, submissions_version)
+import instrumentation
+from instrumentation import query_budget, record_stage, stage
+from assignments import (
+    RoundNotGenerated, assigned_targets, ensure_round_generated, generate_assignments, round_generated,
+    sample_targets,
+)
+from analysis_cache import AnalysisCache, cached_all_group_comparisons, cached_group_comparison
+from scoring import score_round, to_csv
+from leaderboard import REVIEWER_SORTS, TARGET_SORTS, clamp_page, paginate, reviewer_query, target_query
+from export import csv_stream, iter_comparison_rows, iter_rating_rows, iter_score_rows, xlsx_stream
 from functools import wraps
 
 app = Flask(__name__)
 app.secret_key = "REPLACE_WITH_RANDOM_SECRET_STRING"
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
+# 可用环境变量覆盖，压测和回放时指向临时数据库
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///app.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SUBMISSION_DEADLINE'] = datetime(2025, 5, 25, 23, 59, 59)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024 
+# 解压限制（防 zip 炸弹）：解压后总大小、单个文件大小、条目数、压缩比
+app.config['INGEST_MAX_TOTAL_BYTES'] = 200 * 1024 * 1024
+app.config['INGEST_MAX_FILE_BYTES'] = 50 * 1024 * 1024
+app.config['INGEST_MAX_ENTRIES'] = 2000
+app.config['INGEST_MAX_RATIO'] = 100
 app.secret_key = 'CHANGE_ME_TO_A_RANDOM_SECURE_STRING'
 app.permanent_session_lifetime = timedelta(hours=6)  # 设置session过期时间为6小时
 
-db.init_app(app)  # 将数据库绑定到Flask应用
+# 并发写入设置：WAL、synchronous=NORMAL、忙等待，以及连接池大小
+app.config['SQLITE_JOURNAL_MODE'] = 'WAL'
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = 5000
+app.config['DB_POOL_SIZE'] = 10
+app.config['DB_POOL_MAX_OVERFLOW'] = 20
+sqlite_profile.init_app(app, db)  # 将数据库绑定到Flask应用
+instrumentation.init_app(app)  # SQL 计数与接口查询预算、请求耗时、/metrics
+# 响应中附带 Server-Timing 头（浏览器开发者工具可直接查看各阶段耗时）
+app.config['SERVER_TIMING'] = False
+# 允许用 ?_profile=1 或 X-Profile: 1 对单个请求采样调用栈
+app.config['PROFILER_ENABLED'] = False
+
+# 异步提交队列，SUBMIT_ASYNC 为 True 时 /submit 返回 202 和任务号
+app.config['SUBMIT_ASYNC'] = False
+app.config['SUBMIT_WORKERS'] = 4
+app.config['SUBMIT_QUEUE_DEPTH'] = 64
+app.config['SUBMIT_DEDUPE'] = True  # 同一学生的新上传取代还在排队的旧上传
+submission_queue.init_app(app)
+
+# 分块续传：块大小、总大小上限、会话闲置多久后过期（秒）
+app.config['SUBMIT_UPLOAD_CHUNK_BYTES'] = 4 * 1024 * 1024
+app.config['SUBMIT_UPLOAD_MAX_BYTES'] = app.config['MAX_CONTENT_LENGTH']
+app.config['SUBMIT_UPLOAD_TTL_SECONDS'] = 2 * 3600
+chunked_uploads.init_app(app)
+
+# 轮次开关、截止时间等跨进程共享的状态：'database'（app_state 表）或 redis:// 地址
+app.config['STATE_BACKEND'] = os.environ.get('STATE_BACKEND', 'database')
+app.config['STATE_CACHE_TTL'] = 2.0  # 其它 worker 的修改最多这么多秒后生效
+shared_state.init_app(app)
+
+# 作品网页部署目录：static_pages/class_X/group_Y/<学号>
+app.config['STATIC_PAGES_DIR'] = os.environ.get(
+    'STATIC_PAGES_DIR', os.path.join(app.root_path, "static", "static_pages"))
 
 # 确保静态目录存在，用于部署作品网页
-os.makedirs(os.path.join(app.root_path, "static", "static_pages"), exist_ok=True)
+os.makedirs(app.config['STATIC_PAGES_DIR'], exist_ok=True)
+
+# 按内容哈希去重的文件仓库，作品目录中的文件都是指向这里的硬链接
+# 需与 STATIC_PAGES_DIR 在同一文件系统上，否则退化为复制
+app.config['BLOB_STORE_DIR'] = os.environ.get('BLOB_STORE_DIR', os.path.join(app.root_path, "blobs"))
+blob_store = BlobStore(app.config['BLOB_STORE_DIR'])
+# 提交截止后预览文件的缓存时间（秒）
+app.config['PREVIEW_CACHE_MAX_AGE'] = 7 * 24 * 3600
+
+# 磁盘清理（python lifecycle.py run，由 cron 定期执行）
+app.config['LIFECYCLE_UPLOAD_RETENTION_DAYS'] = 14  # 上传暂存目录中的压缩包保留天数
+app.config['LIFECYCLE_RECORD_RETENTION_DAYS'] = None  # 录制保存的压缩包，None 为一直保留
+app.config['LIFECYCLE_GRACE_SECONDS'] = 3600  # 最近改动过的作品目录不处理
+app.config['LIFECYCLE_BATCH_SIZE'] = 200
+app.config['LIFECYCLE_BATCH_PAUSE_MS'] = 50
+app.config['LIFECYCLE_MAX_SECONDS'] = 300  # 单次运行上限，没处理完的下次继续
+# 整班都不在名单中（已结课）的作品默认保留；打开后先打包到归档目录再删除
+app.config['LIFECYCLE_REMOVE_CLOSED_CLASSES'] = False
+app.config['LIFECYCLE_ARCHIVE_DIR'] = os.environ.get('LIFECYCLE_ARCHIVE_DIR', os.path.join(app.root_path, 'archives'))
+
+# 比较结果缓存，按 (班级, 小组, 轮次) 存放，rate_round 提交后失效对应的组
+app.config['ANALYSIS_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+# 条目带上共享的评分版本号，其它 worker 写入评分后本进程的缓存也会失效
+analysis_cache = AnalysisCache(app.config['ANALYSIS_CACHE_MAX_BYTES'], version_func=ratings_version)
+
+# 评分合并提交：并发的 rate_round 由后台线程合并成一个事务写入
+app.config['RATING_GROUP_COMMIT'] = False
+app.config['RATING_BATCH_MAX'] = 64
+app.config['RATING_BATCH_WAIT_MS'] = 5
+rating_writer = None
+
+# 请求录制（回放用 benchmarks/replay.py），设置路径后开启；UPLOADS 目录保存上传的压缩包
+app.config['REQUEST_RECORD_PATH'] = os.environ.get('REQUEST_RECORD_PATH')
+app.config['REQUEST_RECORD_UPLOADS'] = os.environ.get('REQUEST_RECORD_UPLOADS')
+request_recorder.init_app(app, state_func=lambda: {
+    "deadline_passed": datetime.now() > submission_deadline(),
+    "round": current_round(),
+})
+
+# 老师端进度推送：空闲时的保活间隔、多 worker 下从数据库重新同步的间隔（秒）
+app.config['PROGRESS_KEEPALIVE_SECONDS'] = 15
+app.config['PROGRESS_RESYNC_SECONDS'] = 30
+
+def get_rating_writer():
+    global rating_writer
+    if rating_writer is None:
+        rating_writer = RatingWriter(
+            db.engine, app.config['RATING_BATCH_MAX'], app.config['RATING_BATCH_WAIT_MS'] / 1000
+        )
+    return rating_writer
+
+def submission_deadline():
+    # 管理员通过 /admin/rounds 设置的截止时间优先于配置
+    return shared_state.get(SUBMISSION_DEADLINE) or app.config['SUBMISSION_DEADLINE']
+
+def submission_dir(class_id, group, student_id):
+    return os.path.join(app.config['STATIC_PAGES_DIR'], f"class_{class_id}", f"group_{group}", str(student_id))
 
 # 登录装饰校验器
 def login_required(func):
@@ -31,6 +148,8 @@ def login_required(func):
     def wrapper(*args, **kwargs):
         if 'user_id' not in session:
             return jsonify({"error": "User not logged in"}), 401
+        # 当前学生放在 g.student（身份缓存命中时不查库），处理函数不必再查 Student
+        g.student = current_student()
         return func(*args, **kwargs)
     return wrapper
 
@@ -43,7 +162,7 @@ def login():
     if not stu_id:
         return jsonify({"error": "student_id is required"}), 400
     
-    student = Student.query.get(stu_id)
+    student = get_student(stu_id)
     if not student:
         return jsonify({"error": "Student not found"}), 401
     
@@ -81,9 +200,10 @@ def logout():
 
 @app.route('/student/info', methods=['GET'])
 @login_required
+@query_budget(1)
 def get_student_info():
     student_id = session.get('user_id')
-    student = Student.query.get(student_id)
+    student = g.student
     
     if not student:
         return jsonify({"error": "Student not found"}), 404
@@ -108,7 +228,7 @@ def get_student_info():
 @login_required
 def submit_work():
     # ---------- 0) 截止日期检查 ----------
-    if datetime.now() > app.config['SUBMISSION_DEADLINE']:
+    if datetime.now() > submission_deadline():
         return jsonify({"error": "Submission deadline has passed"}), 400
     
     # ---------- 1) 基本校验 ----------
@@ -120,77 +240,227 @@ def submit_work():
         return jsonify({"error": "File must be a zip archive"}), 400
     
     student_id = session['user_id']
-    student = Student.query.get(student_id)
-    class_id = student.class_id
-    group = student.group
-
+    student = g.student
     # 验证学生是否存在
-    student = Student.query.get(student_id)
     if not student:
         print("student not found")
         return jsonify({"error": "Student_id not found"}), 404
 
-    # ---------- 2) 保存 zip到/uoload ----------
-    upload_dir = os.path.join(app.root_path, 'uploads')
-    os.makedirs(upload_dir, exist_ok=True)
-    zip_path = os.path.join(upload_dir, f"{student_id}.zip")
-    file.save(zip_path)
-
-    # ---------- 3) 解压前安全与完整性检查 ----------
-    dest_dir = os.path.join(app.root_path, 'static', 'static_pages', f"class_{class_id}", f"group_{group}", str(student_id))
-    # 如果该学生已有提交，先删除旧文件（覆盖提交）
-    if os.path.exists(dest_dir):
-        shutil.rmtree(dest_dir)
-    os.makedirs(dest_dir, exist_ok=True)
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        for member in zip_ref.namelist():
-            if member.startswith('/') or '..' in member:
-                continue  # 防止路径穿越
-            zip_ref.extract(member, dest_dir)
-
-    # 检查解压后是否有html css js文件
-    required_suffix = {'.html': False,'.css': False,'.js': False
-    }
-
-    for root, dirs, files in os.walk(dest_dir):
-        for file in files:
-            if file.endswith('.html'):
-                required_suffix['.html'] = True
-            elif file.endswith('.css'):
-                required_suffix['.css'] = True
-            elif file.endswith('.js'):
-                required_suffix['.js'] = True
-    
-    if not all(required_suffix.values()):
-        shutil.rmtree(dest_dir)
-        return jsonify({
-            "error": "Missing required file types",
-            "detail": {k: v for k, v in required_suffix.items()}
-        }), 400
+    # ---------- 2) 异步模式：落盘后入队，立即返回任务号 ----------
+    if app.config['SUBMIT_ASYNC']:
+        spool_path = submission_queue.spool_path()
+        file.save(spool_path)
+        return enqueue_spooled(student_id, spool_path)
 
-    # ---------- 4) 保存并更新作品 ----------
-    project = Project.query.get(student_id)
-    if not project:
-        project = Project(student_id=student_id, submitted=True, submitted_at=datetime.now())
-        db.session.add(project)
-    else:
+    # ---------- 3) 同步模式：直接处理上传流 ----------
+    return publish_response(student_id, file.stream)
+
+
+def enqueue_spooled(student_id, spool_path):
+    try:
+        job = submission_queue.enqueue(student_id, spool_path, publish_submission)
+    except QueueFull:
+        os.remove(spool_path)
+        return queue_full_response()
+    return accepted_response(student_id, job)
+
+
+def queue_full_response():
+    return jsonify({"error": "Submission queue is full, please retry later"}), 503
+
+
+def accepted_response(student_id, job):
+    return jsonify({
+        "message": "Submission accepted",
+        "student_id": str(student_id),
+        "job_id": job.id,
+        "status_url": f"/submit/status/{job.id}"
+    }), 202
+
+
+def publish_response(student_id, fileobj):
+    try:
+        timings = publish_submission(student_id, fileobj, StageTimer())
+    except IngestError as e:
+        return jsonify(e.to_dict()), e.status
+
+    # 返回提交成功消息
+    return jsonify({
+        "message": "Submission successful",
+        "student_id": str(student_id),
+        "timings_ms": timings
+    }), 200
+
+
+def publish_submission(student_id, fileobj, timer):
+    """
+    解压校验并发布作品、更新 Project，同步请求和异步队列共用。
+    成功返回各阶段耗时，失败抛 IngestError。
+    """
+    student = get_student(student_id)
+    if not student:
+        raise IngestError("Student_id not found", status=404)
+
+    # 直接从上传流读取 zip，校验后解压到暂存目录再原子替换
+    dest_dir = submission_dir(student.class_id, student.group, student_id)
+    manifest = ingest_archive(
+        fileobj, dest_dir, timer, blob_store=blob_store, limits=ExtractLimits.from_config(app.config))
+
+    # 保存并更新作品，连同文件清单
+    with timer.stage("commit"):
+        project = Project.query.get(student_id)
+        if not project:
+            project = Project(student_id=student_id)
+            db.session.add(project)
         project.submitted = True
         project.submitted_at = datetime.now()
-    db.session.commit()
+        project.entry_page = manifest.entry_page
+        project.total_bytes = manifest.total_bytes
+        project.file_count = len(manifest.files)
+        db.session.flush()
+        replace_files(student_id, manifest)
+        db.session.commit()
+    bump_submissions(student.class_id)
+    progress_tracker.record_submission(student.class_id, student.group, student_id)
+    for name, ms in timer.timings.items():
+        record_stage(f"submit_{name}", ms / 1000)
+    app.logger.info("submission %s ingested: %s", student_id, timer.timings)
+    return timer.timings
+
+
+# 异步提交任务状态
+@app.route('/submit/status/<job_id>', methods=['GET'])
+@login_required
+def submit_status(job_id):
+    job = submission_queue.get(job_id)
+    # 只能查看自己的任务
+    if not job or job.student_id != session['user_id']:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
 
-    # 返回提交成功消息
-    return jsonify({"message": "Submission successful", "student_id": str(student_id)}), 200
+
+# 分块续传（协议见 uploads.py）：开始一次上传
+@app.route('/submit/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    if datetime.now() > submission_deadline():
+        return jsonify({"error": "Submission deadline has passed"}), 400
+    if not g.student:
+        return jsonify({"error": "Student_id not found"}), 404
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    if not filename.lower().endswith('.zip'):
+        return jsonify({"error": "File must be a zip archive"}), 400
+    try:
+        upload = chunked_uploads.initiate(session['user_id'], filename, data.get('size'), data.get('sha256'))
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status
+    upload["chunk_url"] = f"/submit/uploads/{upload['upload_id']}/chunks/<n>"
+    return jsonify(upload), 201
+
+# 上传第 n 块，重复上传同一块是安全的
+@app.route('/submit/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id, index):
+    if datetime.now() > submission_deadline():
+        return jsonify({"error": "Submission deadline has passed"}), 400
+    try:
+        status = chunked_uploads.put_chunk(
+            upload_id, session['user_id'], index,
+            request.get_data(cache=False), request.headers.get('X-Chunk-Sha256'))
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status
+    return jsonify(status), 200
+
+# 查看已收到 / 缺少的块（断线后续传用）；DELETE 放弃这次上传
+@app.route('/submit/uploads/<upload_id>', methods=['GET', 'DELETE'])
+@login_required
+def upload_status(upload_id):
+    try:
+        if request.method == 'DELETE':
+            chunked_uploads.cancel(upload_id, session['user_id'])
+            return jsonify({"message": "Upload cancelled"}), 200
+        return jsonify(chunked_uploads.status(upload_id, session['user_id'])), 200
+    except UploadError as e:
+        return jsonify(e.to_dict()), e.status
+
+# 块齐全后拼成压缩包，走与 /submit 相同的发布流程
+@app.route('/submit/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    if datetime.now() > submission_deadline():
+        return jsonify({"error": "Submission deadline has passed"}), 400
+    student_id = session['user_id']
+    if not g.student:
+        return jsonify({"error": "Student_id not found"}), 404
+    spool_path = submission_queue.spool_path()
+    # 入队或发布成功后才删除上传会话；队列满等可以重试的错误会把压缩包放回会话，重试 complete 即可
+    try:
+        with chunked_uploads.claim(upload_id, student_id, spool_path):
+            if app.config['SUBMIT_ASYNC']:
+                job = submission_queue.enqueue(student_id, spool_path, publish_submission)
+                return accepted_response(student_id, job)
+            with open(spool_path, 'rb') as f:
+                timings = publish_submission(student_id, f, StageTimer())
+    except QueueFull:
+        return queue_full_response()
+    except IngestError as e:  # 包括 UploadError
+        return jsonify(e.to_dict()), e.status
+    finally:
+        # 异步入队后暂存文件归任务所有；其余情况下它已发布、已移回会话，或压缩包无效不再需要
+        if not app.config['SUBMIT_ASYNC'] and os.path.exists(spool_path):
+            os.remove(spool_path)
+    return jsonify({
+        "message": "Submission successful",
+        "student_id": str(student_id),
+        "timings_ms": timings
+    }), 200
+
+
+# 作品预览文件：覆盖 Flask 默认的 /static 处理，URL 不变
+@app.route('/static/static_pages/<path:filename>', methods=['GET'])
+def serve_preview(filename):
+    # 截止后作品不会再变，可以让浏览器长期缓存；截止前每次用 ETag 重新验证
+    if datetime.now() > submission_deadline():
+        max_age = app.config['PREVIEW_CACHE_MAX_AGE']
+    else:
+        max_age = 0
+    return send_preview(app.config['STATIC_PAGES_DIR'], filename, blob_store, max_age)
 
 
+# 作品状态取决于本班提交的版本号，预览链接还取决于名单（换组后路径变了）；还在异步处理中时不缓存
+def pending_job(student_id):
+    """该学生还在异步处理中的任务；任务记录在共享后端里，一次请求只读一次"""
+    if 'pending_job' not in g:
+        g.pending_job = submission_queue.pending_for(student_id)
+    return g.pending_job
+
+def history_etag_parts():
+    student = g.student
+    if student is None or pending_job(student.id):
+        return None
+    return (student.id, submissions_version(student.class_id), roster_version())
+
 # 2. 作品展示接口
 @app.route('/submit/history', methods=['GET'])
 @login_required
+@etag_versioned(history_etag_parts)
+@query_budget(1)
 def show_work():
     student_id = session['user_id']
-    student = Student.query.get(student_id)
+    student = g.student
     project = Project.query.get(student_id)
     group = student.group
     class_id = student.class_id
+    # 异步模式下还在处理的提交
+    job = pending_job(student_id)
+    if job:
+        return jsonify({
+            "student_id": student_id,
+            "status": "处理中",
+            "job_id": job.id,
+            "job_state": job.state
+        }), 200
     if not project or not project.submitted:
         return jsonify({
             "student_id": student_id,
@@ -199,170 +469,212 @@ def show_work():
 
     # 获取请求的主机URL前缀，构建完整预览链接
     base_url = request.host_url.rstrip('/')
-    link = f"{base_url}/static/static_pages/class_{class_id}/group_{group}/{student.id}/index.html"
+    link = base_url + preview_path(class_id, group, student.id, project.entry_page)
     
     # 返回JSON对象
     return jsonify({
         "student_id": student_id,
         "status": "已提交",
-        "preview_url": link
+        "preview_url": link,
+        "entry_page": project.entry_page,
+        "total_bytes": project.total_bytes,
+        "file_count": project.file_count
     }), 200
 
 
 # 展示所有已提交作品的列表
 @app.route('/works', methods=['GET'])
 @login_required
+@etag_versioned(lambda: (submissions_version(), roster_version()))
+@query_budget(1)
 def list_works():
-    # 查询所有已提交作品的列表
-    projects = Project.query.filter_by(submitted=True).all()
+    # 查询所有已提交作品的列表，连同学生信息一次取回
+    students = (
+        db.session.query(Student.id, Student.name, Student.class_id, Student.group,
+                         Project.entry_page, Project.total_bytes)
+        .join(Project, Project.student_id == Student.id)
+        .filter(Project.submitted == True)
+        .all()
+    )
     result = []
     # 获取请求的主机URL前缀，构建完整预览链接
     base_url = request.host_url.rstrip('/')  # 去除结尾的/
-    for project in projects:
-        student = project.student
+    for student in students:
         group = student.group
         class_id = student.class_id
-        link = f"{base_url}/static/static_pages/class_{class_id}/group_{group}/{student.id}/index.html"
+        link = base_url + preview_path(class_id, group, student.id, student.entry_page)
         result.append({
             "student_id": student.id,
             "name": student.name,
-            "preview_url": link
+            "preview_url": link,
+            "entry_page": student.entry_page,
+            "total_bytes": student.total_bytes
         })
     # 返回JSON数组
     return jsonify(result), 200
 
 def sample_targets_for(student, target_group, k=4):
-    student = Student.query.get(student.id)
-    class_id = student.class_id
-    group_id = student.group
-    random.seed(f"group-{class_id}-{group_id}")
-    # 1) 目标组已提交的作品
-    target_group_project = (
-        Student.query.join(Project, Project.student_id == Student.id).filter(
+    # 一次取出本班除本组外所有已提交的学生（连同入口页面和大小），按学号排序保证抽样可复现
+    submitted = (
+        db.session.query(Student.id, Student.group, Project.entry_page, Project.total_bytes)
+        .join(Project, Project.student_id == Student.id).filter(
             Student.class_id == student.class_id,
-            Student.group == target_group,
-            Project.submitted == True
-            ).all()
-        )
-    # 2) 如果不足 k，就到“其它组”里补齐
-    if len(target_group_project) < k:
-        need = k - len(target_group_project)
-        pool = (
-            Student.query.join(Project, Project.student_id == Student.id).filter(
-                Student.class_id == student.class_id,
-                Project.submitted == True,
-                Student.group.notin_([student.group, target_group])
-        ).all()
-        )
-        if pool:
-            if len(pool) >= need:
-                fillers = random.sample(pool, need)
-            else:
-                fillers = random.choices(pool, k=need)
-            target_group_project.extend(fillers)
-    return target_group_project
+            Project.submitted == True,
+            or_(Student.group != student.group, Student.group == target_group)
+        ).order_by(Student.id).all()
+    )
+    return sample_targets(student.class_id, student.group, target_group, submitted, k)
+
+def review_targets(student, round_num):
+    """
+    返回 (被评组别, [(作品学号, 作品所在组别, 入口页面, 作品大小), ...])，没有互评分组时返回 (None, None)。
+    截止后只查该轮预先生成的分配，还没生成时抛 RoundNotGenerated；截止前作品还在变化，实时抽样。
+    """
+    if datetime.now() > submission_deadline():
+        rows = assigned_targets(round_num, student.class_id, student.group)
+        if rows:
+            return rows[0].assigned_group, [
+                (r.target_id, r.target_group, r.entry_page, r.total_bytes) for r in rows
+            ]
+        # 本组没有分配：区分“这一轮还没生成”和“本组没有互评分组”
+        if not round_generated(round_num):
+            raise RoundNotGenerated(round_num)
+        return None, None
+
+    group_assignment = GroupAssignment.query.filter_by(
+        class_id=student.class_id, reviewer_group=student.group
+    ).first()
+    if not group_assignment:
+        return None, None
+    target_students = sample_targets_for(student, group_assignment.target_group)
+    return group_assignment.target_group, [
+        (t.id, t.group, t.entry_page, t.total_bytes) for t in target_students
+    ]
+
+def current_round():
+    return 2 if shared_state.get(SECOND_ROUND_OPEN, False) else 1
+
+# 截止后取决于预先生成的分配，截止前取决于本班的提交和名单
+def target_etag_parts():
+    student = g.student
+    if student is None:
+        return None
+    round_num = request.args.get('round', type=int) or current_round()
+    if datetime.now() > submission_deadline():
+        return (student.class_id, student.group, round_num, assignments_version(round_num))
+    return (student.class_id, student.group, round_num,
+            submissions_version(student.class_id), roster_version())
 
 # 获取当前登录用户要评分的目标组成员列表
 @app.route('/target', methods=['GET'])
 @login_required
+@etag_versioned(target_etag_parts)
+@query_budget(2)
 def get_target():
-    student = Student.query.get(session['user_id'])
-
-    # 1. 获取目标组
-    group_assignment = GroupAssignment.query.filter_by(class_id=student.class_id, reviewer_group=student.group).first()
-    if not group_assignment:
+    student = g.student
+    round_num = request.args.get('round', type=int) or current_round()
+
+    # 1. 获取目标组成员列表（预先分配或实时抽样）
+    try:
+        target_group, targets = review_targets(student, round_num)
+    except RoundNotGenerated as e:
+        return jsonify({"error": str(e)}), 409
+    if target_group is None:
         return jsonify({"error": "No group assignment found"}), 404
-    
-    # 2. 获取目标组成员列表
-    target_students = sample_targets_for(student, group_assignment.target_group)
 
-    # 3. 返回作品链接
+    # 2. 返回作品链接（抽到的都是已提交的作品）
     base = request.host_url.rstrip('/')
     out = []
-    for target_student in target_students:
-        project = Project.query.get(target_student.id)
-        submitted = project.submitted
-        if not submitted:
-            link = ''
-        else:
-            link = f"{base}/static/static_pages/class_{student.class_id}/group_{target_student.group}/{target_student.id}/index.html"
+    for target_id, group, entry_page, total_bytes in targets:
+        link = base + preview_path(student.class_id, group, target_id, entry_page)
         out.append({
-            "student_id": target_student.id,
-            "preview_url": link
+            "student_id": target_id,
+            "preview_url": link,
+            "entry_page": entry_page,
+            "total_bytes": total_bytes
         })
     return jsonify(out), 200
 
 
-
 # 评分函数
 grade_map = {'A': 5, 'B': 4, 'C': 3, 'D': 2, 'E': 1}
-second_round_open = False
+@query_budget(4)  # 含评分版本号自增
 def rate_round(round_num):
-    global second_round_open
-    if round_num == 2 and not second_round_open:
+    # 轮次状态走进程内缓存，不产生查询
+    if round_num == 2 and not shared_state.get(SECOND_ROUND_OPEN, False):
         return jsonify({"error": "Second round not open yet"}), 400
     
     stu_id = session.get('user_id')
     if not stu_id:
         return jsonify({"error": "User not logged in"}), 401
-    student = Student.query.get(stu_id)
+    student = g.student
     
     # 这里我不知道怎么判断学生还是老师
     # stu_role = session.get('role')
     # if stu_role != 'student':
     #     return jsonify({"error": "User not a student"}), 401
 
-    # ------ 1) 获取要评分的目标组 ------
-    groupassignment = GroupAssignment.query.filter_by(
-        class_id = student.class_id, reviewer_group = student.group
-    ).first()
-    if not groupassignment:
+    # ------ 1) 获取要评分的目标组成员（预先分配或实时抽样） ------
+    try:
+        target_group, targets = review_targets(student, round_num)
+    except RoundNotGenerated as e:
+        return jsonify({"error": str(e)}), 409
+    if target_group is None:
         return jsonify({"error": "no assignmet"}), 404
     
-    # ------ 2) 获取目标组成员 不够则补齐四份 ------
-    target_students = sample_targets_for(student, groupassignment.target_group)
-    
-    # ------ 3) 解析json数据 ------
+    # ------ 2) 解析json数据 ------
     ratings_map = request.get_json(silent=True)
     if ratings_map is None or not isinstance(ratings_map, dict):
         return jsonify({"error": "data is None or is not dict"}), 400
     
-    # ------ 4) 重复提交 以及判断提交是否足够 ------
-    if Rating.query.filter_by(
-        reviewer_id = stu_id, round = round_num
-    ).first():
-        return jsonify({"error": "repeat submmit"}), 400
-    
-    for target_student in target_students:
-        target_student_id = str(target_student.id)
+    # ------ 3) 判断提交是否足够（重复提交由唯一索引在插入时拦截） ------
+    for target_id, *_ in targets:
+        target_student_id = str(target_id)
         if target_student_id not in ratings_map:
             return jsonify({"error": f"Missing rating for student {target_student_id}"}), 400
     
-    # ------ 5) 评分 ------
-    for target_student in target_students:
-        target_student_id = str(target_student.id)
-        project = Project.query.get(target_student_id)
-        if project and project.submitted:
-            innovation_score = ratings_map[target_student_id].get('innovation')
-            professional_score = ratings_map[target_student_id].get('professional')
-            if innovation_score not in grade_map or professional_score not in grade_map:
-                return jsonify({"error": f"{target_student_id} rate must from A-E"}), 400
-            I, P = grade_map[innovation_score], grade_map[professional_score]
-        else:
-            I, P = 0, 0
-
-        
-        db.session.add(Rating(
+    # ------ 4) 评分（抽到的都是已提交的作品），一条 executemany 批量插入 ------
+    rows = []
+    seen = set()
+    for target_id, *_ in targets:
+        target_student_id = str(target_id)
+        # 补齐时可能重复抽到同一作品，每个作品只记一条
+        if target_student_id in seen:
+            continue
+        seen.add(target_student_id)
+        innovation_score = ratings_map[target_student_id].get('innovation')
+        professional_score = ratings_map[target_student_id].get('professional')
+        if innovation_score not in grade_map or professional_score not in grade_map:
+            return jsonify({"error": f"{target_student_id} rate must from A-E"}), 400
+        I, P = grade_map[innovation_score], grade_map[professional_score]
+
+        rows.append(dict(
             reviewer_id = stu_id,
             reviewer_class = student.class_id,
             reviewer_group = student.group,
-            target_group = groupassignment.target_group,
-            target_id = target_student.id,
+            target_group = target_group,
+            target_id = target_id,
             innovation_score = I,
             professional_score = P,
             round = round_num
         ))
-    db.session.commit()
+    # 只有这一组这一轮的比较结果受影响
+    cache_key = (student.class_id, student.group, round_num)
+    try:
+        if app.config['RATING_GROUP_COMMIT']:
+            # 结束本请求的读事务，再交给合并写入线程
+            db.session.rollback()
+            get_rating_writer().submit(rows)
+        else:
+            if rows:
+                db.session.execute(insert(Rating), rows)
+            db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "repeat submmit"}), 400
+    analysis_cache.invalidate(cache_key)
+    bump_ratings(*cache_key)
+    progress_tracker.record_rating(round_num, student.class_id, student.group, stu_id)
     return jsonify({"message": "sucessful rate"}), 200
 
 @app.route('/rate/first', methods=['POST'])
@@ -380,55 +692,30 @@ def rate_second():
 def total_score(P: int, I: int) -> float:
     return (1 - (P - 1) / 4) * P + ((P - 1) / 4) * I
 
+# 本组第一轮评分的版本号
+def analysis_etag_parts():
+    student = g.student
+    if student is None:
+        return None
+    return (student.class_id, student.group, ratings_version(student.class_id, student.group, 1),
+            request.args.get('compact'))
+
 @app.route('/analysis', methods=['GET'])
 @login_required
+@etag_versioned(analysis_etag_parts)
 def analysis():
     # 当前同学所在的班级和小组
-    student = Student.query.get(session['user_id'])
-    class_id = student.class_id
-    group_id = student.group
-
-    # 1. 拉出这一组里，所有第一轮评分记录
-    ratings = Rating.query.filter_by(
-        reviewer_class=class_id,
-        reviewer_group=group_id,
-        round=1
-    ).all()
-
-    # 2. 找到组内所有评审人（学号）和所有被评作品ID
-    reviewer_ids = sorted({r.reviewer_id for r in ratings})
-    target_ids   = sorted({r.target_id   for r in ratings})
-
-    # 3. 聚合到一个 dict：id_grade[reviewer_id][target_id] = 总分
-    id_grade = defaultdict(dict)
-    for r in ratings:
-        T = total_score(r.professional_score, r.innovation_score)
-        id_grade[r.reviewer_id][r.target_id] = T
-
-    # 4. 准备所有两两作品对
-    pairs = list(combinations(target_ids, 2))
-
-    # 5. 构造表格数据：每一行一个 (i,j)，列名就是各个 reviewer_id
-    table_data = []
-    for i, j in pairs:
-        row = {"pair": (i, j)}
-        for rid in reviewer_ids:
-            Ti = id_grade[rid].get(i, 0)
-            Tj = id_grade[rid].get(j, 0)
-            if Ti > Tj:
-                comp = f"{i}>{j}"
-            elif Tj > Ti:
-                comp = f"{j}>{i}"
-            else:
-                comp = f"{i}={j}"
-            row[str(rid)] = comp
-        table_data.append(row)
-
-    # 6. 返回 JSON，前端直接用 keys 渲染表头
-    return jsonify({
-        "reviewers": reviewer_ids,  # 前端可以读这个数组来做 <th>，也可直接从每行 keys 里取
-        "data":      table_data
-    })
+    student = g.student
+
+    # 这一组第一轮的评分 → 评审人×作品矩阵 → 所有作品对的比较
+    comparison = cached_group_comparison(analysis_cache, student.class_id, student.group, 1)
+
+    # compact=1 时只返回符号矩阵，不拼 "i>j" 字符串
+    with stage("analysis_serialize"):
+        if request.args.get('compact') == '1':
+            return jsonify(comparison.to_compact())
+        # 返回 JSON，前端直接用 keys 渲染表头
+        return jsonify(comparison.to_table())
 
 @app.route('/analysis/all_groups', methods=['GET'])
 # @login_required
@@ -437,57 +724,165 @@ def analysis_all_groups():
     # if session.get('role') != 'teacher':
     #     return jsonify({"error": "User not authorized"}), 403
 
-    # 取出所有第一轮评分记录（不按班级过滤）
-    all_ratings = Rating.query.filter_by(round=1).all()
-
-    # 找出所有(班级, 小组)组合
-    class_group_pairs = sorted({
-        (r.reviewer_class, r.reviewer_group)
-        for r in all_ratings
-    })
+    # 第一轮所有组的比较结果，缓存未命中的组一次查询重建
+    comparisons = cached_all_group_comparisons(analysis_cache, 1)
+    compact = request.args.get('compact') == '1'
 
     result = {}
-    for cls_id, grp in class_group_pairs:
-        # 该班级里该小组的所有 Rating
-        ratings = [
-            r for r in all_ratings
-            if r.reviewer_class == cls_id and r.reviewer_group == grp
-        ]
-
-        # 提取评审人和被评作品
-        reviewer_ids = sorted({r.reviewer_id for r in ratings})
-        target_ids   = sorted({r.target_id   for r in ratings})
-
-        # 聚合每个评审人的总分
-        id_grade = defaultdict(dict)
-        for r in ratings:
-            T = total_score(r.professional_score, r.innovation_score)
-            id_grade[r.reviewer_id][r.target_id] = T
-
-        # 两两作品对比较
-        pairs = list(combinations(target_ids, 2))
-        table_data = []
-        for i, j in pairs:
-            row = {"pair": (i, j)}
-            for rid in reviewer_ids:
-                Ti = id_grade[rid].get(i, 0)
-                Tj = id_grade[rid].get(j, 0)
-                if Ti > Tj:
-                    comp = f"{i}>{j}"
-                elif Tj > Ti:
-                    comp = f"{j}>{i}"
-                else:
-                    comp = f"{i}={j}"
-                row[str(rid)] = comp
-            table_data.append(row)
-
-        # 嵌套到 result[class_id][group_id]
-        result.setdefault(str(cls_id), {})[str(grp)] = {
-            "reviewers": reviewer_ids,
-            "data":      table_data
-        }
-
-    return jsonify({"by_class": result}), 200
+    with stage("analysis_serialize"):
+        for (cls_id, grp), comparison in sorted(comparisons.items()):
+            # 嵌套到 result[class_id][group_id]
+            result.setdefault(str(cls_id), {})[str(grp)] = (
+                comparison.to_compact() if compact else comparison.to_table()
+            )
+        return jsonify({"by_class": result}), 200
+
+# 共识排名、作品平均分/方差、评审人逆序对数
+@app.route('/analysis/scores', methods=['GET'])
+# @login_required
+def analysis_scores():
+    round_num = request.args.get('round', 1, type=int)
+    class_id = request.args.get('class_id', type=int)
+
+    comparisons = cached_all_group_comparisons(analysis_cache, round_num)
+    if class_id is not None:
+        comparisons = {k: v for k, v in comparisons.items() if k[0] == class_id}
+    by_class = score_round(comparisons)
+
+    # format=csv 时输出与 analysis.csv 相同的表格
+    if request.args.get('format') == 'csv':
+        return Response(
+            to_csv(by_class),
+            mimetype='text/csv',
+            headers={"Content-Disposition": f"attachment; filename=analysis_round{round_num}.csv"}
+        )
+    return jsonify({"round": round_num, "by_class": by_class}), 200
+
+# 跨轮次排行榜：每个作品两轮的平均分和变化，数据库内聚合、分页
+# ?class_id=&sort=delta&order=desc&page=1&per_page=50
+@app.route('/analysis/leaderboard', methods=['GET'])
+# @login_required
+def analysis_leaderboard():
+    return paged_scores(target_query, TARGET_SORTS, default_sort='round1_avg')
+
+# 评审人两轮之间的偏差漂移
+@app.route('/analysis/reviewer_drift', methods=['GET'])
+# @login_required
+def analysis_reviewer_drift():
+    return paged_scores(reviewer_query, REVIEWER_SORTS, default_sort='drift')
+
+def paged_scores(build_query, sorts, default_sort):
+    # 回显的是实际使用的页码和每页条数
+    page, per_page = clamp_page(request.args.get('page', 1, type=int), request.args.get('per_page', 50, type=int))
+    sort = request.args.get('sort', default_sort)
+    order = request.args.get('order', 'desc')
+    try:
+        rows, total = paginate(
+            db.session, build_query(request.args.get('class_id', type=int)),
+            sort, order, page, per_page, sorts,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "sort": sort,
+        "order": order,
+        "items": rows
+    }), 200
+
+# 导出：评分原始数据 / 各组两两比较表 / 最终得分，format=csv（默认）或 xlsx
+EXPORTS = {
+    'ratings': lambda round_num: iter_rating_rows(round_num),
+    'comparisons': lambda round_num: iter_comparison_rows(round_num or 1),
+    'scores': lambda round_num: iter_score_rows(round_num or 1),
+}
+
+@app.route('/export/<kind>', methods=['GET'])
+@login_required
+def export(kind):
+    if kind not in EXPORTS:
+        return jsonify({"error": f"Unknown export {kind}"}), 404
+    round_num = request.args.get('round', type=int)
+    fmt = request.args.get('format', 'csv')
+    rows = EXPORTS[kind](round_num)
+    suffix = f"_round{round_num}" if round_num else ""
+
+    if fmt == 'xlsx':
+        body = xlsx_stream(rows, title=kind)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    elif fmt == 'csv':
+        body = csv_stream(rows)
+        mimetype = 'text/csv'
+    else:
+        return jsonify({"error": "format must be csv or xlsx"}), 400
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={kind}{suffix}.{fmt}"}
+    )
+
+# 提交和评分进度的当前快照
+@app.route('/progress', methods=['GET'])
+@login_required
+def progress():
+    # if session.get('role') != 'teacher':
+    #     return jsonify({"error": "User not authorized"}), 403
+    progress_tracker.ensure_loaded(max_age=app.config['PROGRESS_RESYNC_SECONDS'])
+    return jsonify(progress_tracker.snapshot()), 200
+
+# 进度实时推送（Server-Sent Events）：连上先收到 snapshot，之后是 submission / rating 增量事件
+@app.route('/progress/stream', methods=['GET'])
+@login_required
+def progress_stream():
+    # if session.get('role') != 'teacher':
+    #     return jsonify({"error": "User not authorized"}), 403
+    progress_tracker.ensure_loaded(max_age=app.config['PROGRESS_RESYNC_SECONDS'])
+    listener = progress_tracker.listen()
+    body = event_stream(
+        progress_tracker, listener,
+        app.config['PROGRESS_KEEPALIVE_SECONDS'], app.config['PROGRESS_RESYNC_SECONDS'],
+    )
+    return Response(
+        stream_with_context(body),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 比较结果缓存的命中率和重建耗时
+@app.route('/analysis/cache/stats', methods=['GET'])
+@login_required
+def analysis_cache_stats():
+    return jsonify(analysis_cache.stats()), 200
+
+# Prometheus 文本格式的指标（当前进程）
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(instrumentation.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# 采样结果，collapsed stack 格式，可用 flamegraph.pl / speedscope 打开
+@app.route('/metrics/profile/<profile_id>', methods=['GET'])
+def metrics_profile(profile_id):
+    profile = instrumentation.get_profile(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return Response(profile, mimetype='text/plain')
+
+@instrumentation.register_collector
+def collect_app_gauges():
+    cache = analysis_cache.stats()
+    yield 'judge_analysis_cache_bytes', {}, cache["bytes"]
+    yield 'judge_analysis_cache_entries', {}, cache["entries"]
+    yield 'judge_analysis_cache_hits_total', {}, cache["hits"]
+    yield 'judge_analysis_cache_misses_total', {}, cache["misses"]
+    identities = identity_cache.stats()
+    yield 'judge_identity_cache_entries', {}, identities["entries"]
+    yield 'judge_identity_cache_hits_total', {}, identities["hits"]
+    yield 'judge_identity_cache_misses_total', {}, identities["misses"]
+    yield 'judge_progress_listeners', {}, progress_tracker.listener_count()
+    for state, n in sorted(submission_queue.state_counts().items()):
+        yield 'judge_submit_jobs', {"state": state}, n
 
 # 开启第二轮测试
 @app.route('/open_second_round', methods=['POST'])
@@ -495,11 +890,68 @@ def analysis_all_groups():
 def open_second_round():
     # if session.get('role') != 'teacher':
     #     return jsonify({"error": "User not authorized"}), 403
-    global second_round_open
-    second_round_open = True
+    shared_state.set(SECOND_ROUND_OPEN, True)
+    # 第二轮开始，预先生成全年级的评审目标
+    generate_assignments(2)
     return jsonify({"message": "Second round has been opened."}), 200
 
-        
+# 查看 / 修改轮次状态：{"second_round_open": bool, "submission_deadline": "2025-05-25T23:59:59"}
+@app.route('/admin/rounds', methods=['GET', 'POST'])
+@login_required
+def admin_rounds():
+    # if session.get('role') != 'teacher':
+    #     return jsonify({"error": "User not authorized"}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        if 'submission_deadline' in data:
+            try:
+                deadline = datetime.fromisoformat(data['submission_deadline'])
+            except (TypeError, ValueError):
+                return jsonify({"error": "submission_deadline must be an ISO datetime"}), 400
+            shared_state.set(SUBMISSION_DEADLINE, deadline)
+            # 截止即第一轮开始，在这里生成分配，/target 和评分只查表
+            if deadline <= datetime.now():
+                ensure_round_generated(1)
+        if 'second_round_open' in data:
+            opening = bool(data['second_round_open'])
+            was_open = shared_state.get(SECOND_ROUND_OPEN, False)
+            shared_state.set(SECOND_ROUND_OPEN, opening)
+            if opening and not was_open:
+                generate_assignments(2)
+    return jsonify({
+        "second_round_open": shared_state.get(SECOND_ROUND_OPEN, False),
+        "submission_deadline": submission_deadline().isoformat(),
+        "current_round": current_round(),
+    }), 200
+
+# 重新生成某一轮的评审目标（如截止后补交了作品）
+@app.route('/admin/assignments/regenerate', methods=['POST'])
+@login_required
+def regenerate_assignments():
+    # if session.get('role') != 'teacher':
+    #     return jsonify({"error": "User not authorized"}), 403
+    round_num = (request.get_json(silent=True) or {}).get('round') or request.args.get('round', type=int)
+    if round_num not in (1, 2):
+        return jsonify({"error": "round must be 1 or 2"}), 400
+    count = generate_assignments(round_num)
+    return jsonify({"message": f"Round {round_num} assignments regenerated", "assignments": count}), 200
+
+# 按文件路径或 sha256 查找作品（如查重、找出包含某个文件的提交），只查清单表，不扫描作品目录
+@app.route('/admin/submissions/search', methods=['GET'])
+@login_required
+def search_submissions():
+    # if session.get('role') != 'teacher':
+    #     return jsonify({"error": "User not authorized"}), 403
+    term = (request.args.get('q') or '').strip()
+    if not term:
+        return jsonify({"error": "q is required"}), 400
+    matches = search_manifests(term)
+    return jsonify([
+        {"student_id": student_id, "path": path, "size": size}
+        for student_id, path, size in matches
+    ]), 200
+
+
 # 仅在直接运行app.py时启动Flask开发服务器
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,135 @@
+# assignments.py
+"""
+评审目标的预先分配。
+每轮开始时一次性为全体评审小组抽样并写入 review_assignment 表，
+之后 /target 和 rate_round 只需按 (轮次, 班级, 评审组) 查一次主键索引，
+评分过程中即使有人新提交作品，目标列表也不会变。
+分配在显式的步骤里生成，读路径只查表：
+    - /admin/rounds 把截止时间设为已过去的时间时生成第一轮，开启第二轮时生成第二轮
+    - /admin/assignments/regenerate 重新生成某一轮（如截止后补交了作品）
+    - 截止时间来自配置、没有经过 /admin/rounds 时，由 cron 在截止时运行：
+        python assignments.py generate 1 --if-missing
+"""
+import random
+import sys
+from collections import defaultdict
+
+from sqlalchemy import delete, insert
+
+from models import db, GroupAssignment, Project, ReviewAssignment, Student
+from versions import bump_assignments
+
+
+def sample_targets(class_id, group_id, target_group, submitted, k=4):
+    """
+    submitted: 本班已提交的学生（按学号排序），元素需有 id / group 属性。
+    目标组已提交的作品全部入选，不足 k 份时从其它组（不含本组）补齐。
+    """
+    rng = random.Random(f"group-{class_id}-{group_id}")
+    # 1) 目标组已提交的作品
+    targets = [s for s in submitted if s.group == target_group]
+    # 2) 如果不足 k，就到“其它组”里补齐
+    if len(targets) < k:
+        need = k - len(targets)
+        pool = [s for s in submitted if s.group not in (group_id, target_group)]
+        if pool:
+            if len(pool) >= need:
+                fillers = rng.sample(pool, need)
+            else:
+                fillers = rng.choices(pool, k=need)
+            targets.extend(fillers)
+    return targets
+
+
+class RoundNotGenerated(Exception):
+    """截止后该轮还没有生成分配"""
+
+    def __init__(self, round_num):
+        super().__init__(f"Round {round_num} review targets have not been generated yet")
+        self.round_num = round_num
+
+
+def generate_assignments(round_num, k=4):
+    """
+    为整个年级生成某一轮的评审目标，覆盖该轮已有的分配，返回写入的行数。
+    删除和插入在同一个事务里提交；抽样只取决于名单和已提交的作品，
+    多个进程同时生成时写入的是同样的行，后提交的覆盖先提交的，结果不变。
+    """
+    group_assignments = GroupAssignment.query.all()
+    submitted_by_class = defaultdict(list)
+    for row in (
+        db.session.query(Student.id, Student.class_id, Student.group)
+        .join(Project, Project.student_id == Student.id)
+        .filter(Project.submitted == True)
+        .order_by(Student.id)
+    ):
+        submitted_by_class[row.class_id].append(row)
+
+    rows = []
+    for ga in group_assignments:
+        targets = sample_targets(
+            ga.class_id, ga.reviewer_group, ga.target_group, submitted_by_class[ga.class_id], k
+        )
+        for position, target in enumerate(targets):
+            rows.append(dict(
+                round=round_num,
+                class_id=ga.class_id,
+                reviewer_group=ga.reviewer_group,
+                position=position,
+                assigned_group=ga.target_group,
+                target_id=target.id,
+                target_group=target.group,
+            ))
+
+    db.session.execute(delete(ReviewAssignment).where(ReviewAssignment.round == round_num))
+    if rows:
+        db.session.execute(insert(ReviewAssignment), rows)
+    db.session.commit()
+    bump_assignments(round_num)
+    return len(rows)
+
+
+def ensure_round_generated(round_num):
+    """该轮还没有生成过分配时生成一次，返回写入的行数（已生成时返回 0）"""
+    if round_generated(round_num):
+        return 0
+    return generate_assignments(round_num)
+
+
+def assigned_targets(round_num, class_id, reviewer_group):
+    """预先分配的目标，连同作品的入口页面和大小一次取回"""
+    return (
+        db.session.query(
+            ReviewAssignment.assigned_group, ReviewAssignment.target_id, ReviewAssignment.target_group,
+            Project.entry_page, Project.total_bytes,
+        )
+        .outerjoin(Project, Project.student_id == ReviewAssignment.target_id)
+        .filter(
+            ReviewAssignment.round == round_num,
+            ReviewAssignment.class_id == class_id,
+            ReviewAssignment.reviewer_group == reviewer_group,
+        )
+        .order_by(ReviewAssignment.position)
+        .all()
+    )
+
+
+def round_generated(round_num):
+    return db.session.query(
+        ReviewAssignment.query.filter_by(round=round_num).exists()
+    ).scalar()
+
+
+if __name__ == '__main__':
+    from app import app
+
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] != 'generate' or args[1] not in ('1', '2'):
+        print(__doc__)
+        sys.exit(1)
+    with app.app_context():
+        if '--if-missing' in args:
+            count = ensure_round_generated(int(args[1]))
+        else:
+            count = generate_assignments(int(args[1]))
+    print(f"Round {args[1]} assignments: {count}")
@@ -0,0 +1,95 @@
+# benchmarks/bench_rating_indexes.py
+"""
+Rating 热点查询在加索引前后的查询计划与耗时对比。
+
+用法：python benchmarks/bench_rating_indexes.py [评分条数，默认 200000]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, insert, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import db, Rating  # noqa: E402
+
+REPEAT = 200
+
+# (名称, SQL, 参数)：对应 rate_round、get_student_info 和分析接口
+QUERIES = [
+    ("rate_round repeat check",
+     "SELECT id FROM rating WHERE reviewer_id = :rid AND round = :round LIMIT 1",
+     lambda rnd: {"rid": f"S{rnd.randrange(N_STUDENTS)}", "round": 1}),
+    ("student info max(round)",
+     "SELECT max(round) FROM rating WHERE reviewer_id = :rid",
+     lambda rnd: {"rid": f"S{rnd.randrange(N_STUDENTS)}"}),
+    ("analysis by class/group/round",
+     "SELECT reviewer_id, target_id, professional_score, innovation_score FROM rating "
+     "WHERE reviewer_class = :c AND reviewer_group = :g AND round = :round ORDER BY id",
+     lambda rnd: {"c": rnd.randrange(N_CLASSES), "g": rnd.randrange(GROUPS_PER_CLASS), "round": 1}),
+    ("all groups distinct",
+     "SELECT DISTINCT reviewer_class, reviewer_group FROM rating WHERE round = :round",
+     lambda rnd: {"round": 1}),
+]
+
+N_CLASSES = 20
+GROUPS_PER_CLASS = 10
+N_STUDENTS = 0  # 根据评分条数计算
+
+
+def populate(engine, n_ratings):
+    global N_STUDENTS
+    N_STUDENTS = n_ratings // 8  # 两轮、每轮 4 条
+    rnd = random.Random(0)
+    rows = []
+    for s in range(N_STUDENTS):
+        cls, grp = s % N_CLASSES, (s // N_CLASSES) % GROUPS_PER_CLASS
+        for round_num in (1, 2):
+            for t in rnd.sample(range(N_STUDENTS), 4):
+                rows.append(dict(
+                    reviewer_id=f"S{s}", reviewer_class=cls, reviewer_group=grp,
+                    target_group=(grp + 1) % GROUPS_PER_CLASS, target_id=f"S{t}",
+                    innovation_score=rnd.randint(1, 5), professional_score=rnd.randint(1, 5),
+                    round=round_num,
+                ))
+    with engine.begin() as conn:
+        conn.execute(insert(Rating), rows)
+
+
+def run(engine, label):
+    print(f"\n== {label} ==")
+    rnd = random.Random(1)
+    with engine.connect() as conn:
+        for name, sql, params in QUERIES:
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params(rnd)).fetchall()
+            start = time.perf_counter()
+            for _ in range(REPEAT):
+                conn.execute(text(sql), params(rnd)).fetchall()
+            elapsed = (time.perf_counter() - start) / REPEAT * 1000
+            print(f"{name:32s} {elapsed:9.3f} ms/query   plan: {' | '.join(row[-1] for row in plan)}")
+
+
+def main():
+    n_ratings = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine, tables=[Rating.__table__])
+    # 先去掉索引，模拟迁移前的表结构
+    with engine.begin() as conn:
+        for index in Rating.__table__.indexes:
+            index.drop(conn)
+    populate(engine, n_ratings)
+    print(f"{n_ratings} ratings in {path}")
+
+    run(engine, "before (primary key only)")
+    with engine.begin() as conn:
+        for index in Rating.__table__.indexes:
+            index.create(conn)
+        conn.execute(text("ANALYZE"))
+    run(engine, "after (composite indexes)")
+
+
+if __name__ == '__main__':
+    main()
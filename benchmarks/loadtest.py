@@ -0,0 +1,280 @@
+# benchmarks/loadtest.py
+"""
+截止日规模的压测：生成模拟年级 → 并发跑 login → submit → target → rate/first → rate/second →
+统计每个接口的 p50/p95/p99 延迟、吞吐、SQL 条数和峰值 RSS，结果存成 JSON 便于对比。
+
+用法：
+    python benchmarks/loadtest.py generate --out /tmp/cohort --classes 4 --students 60 --groups 10
+    python benchmarks/loadtest.py run --data /tmp/cohort --concurrency 16 --report result.json
+    python benchmarks/loadtest.py compare before.json after.json
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROSTER_FILE = 'roster.csv'
+ARCHIVE_DIR = 'archives'
+PHASES = ['login', 'submit', 'target', 'rate_first', 'rate_second']
+
+
+# ---------------- 1) 生成模拟数据 ----------------
+
+def make_archive(rnd, student_id, shared_lib, asset_kb):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('index.html', f"<html><head><link rel='stylesheet' href='style.css'></head>"
+                                  f"<body><h1>{student_id}</h1><script src='app.js'></script></body></html>")
+        zf.writestr('style.css', f"h1 {{ color: #{rnd.randrange(0xffffff):06x}; }}\n" * 20)
+        zf.writestr('app.js', f"console.log('{student_id}');\n" * 20)
+        # 同组共用的库文件，用来体现去重存储的效果
+        zf.writestr('lib/shared.js', shared_lib)
+        zf.writestr('assets/image.bin', rnd.randbytes(asset_kb * 1024))
+    return buf.getvalue()
+
+
+def generate(out_dir, classes, students, groups, asset_kb, seed):
+    rnd = random.Random(seed)
+    os.makedirs(os.path.join(out_dir, ARCHIVE_DIR), exist_ok=True)
+    lines = ['id,姓名,class,group_id,assign_work']
+    for cls in range(1, classes + 1):
+        libs = {g: f"/* group {g} lib */\n".encode() + rnd.randbytes(4096).hex().encode() for g in range(groups)}
+        for i in range(students):
+            sid = f"{cls:02d}{i:05d}"
+            group = i % groups
+            lines.append(f"{sid},Student{sid},{cls},{group},{(group + 1) % groups}")
+            with open(os.path.join(out_dir, ARCHIVE_DIR, f"{sid}.zip"), 'wb') as f:
+                f.write(make_archive(rnd, sid, libs[group], asset_kb))
+    with open(os.path.join(out_dir, ROSTER_FILE), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    print(f"generated {classes * students} students in {out_dir}")
+
+
+# ---------------- 2) 并发驱动 ----------------
+
+def rss_kb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)   # endpoint -> [(秒, SQL 条数, 状态码)]
+        self.peak_rss = defaultdict(int)
+        self.wall = {}
+
+    def record(self, endpoint, seconds, response):
+        queries = int(response.headers.get('X-Query-Count', 0))
+        rss = rss_kb()
+        with self.lock:
+            self.samples[endpoint].append((seconds, queries, response.status_code))
+            self.peak_rss[endpoint] = max(self.peak_rss[endpoint], rss)
+
+
+def timed(recorder, endpoint, call):
+    start = time.perf_counter()
+    response = call()
+    recorder.record(endpoint, time.perf_counter() - start, response)
+    return response
+
+
+class SimulatedStudent:
+    def __init__(self, app, student_id, archive_path):
+        self.client = app.test_client()
+        self.student_id = student_id
+        self.archive_path = archive_path
+        self.targets = []
+
+    def login(self, rec):
+        timed(rec, 'login', lambda: self.client.post('/login', json={'student_id': self.student_id}))
+
+    def submit(self, rec):
+        with open(self.archive_path, 'rb') as f:
+            data = f.read()
+        timed(rec, 'submit', lambda: self.client.post(
+            '/submit', data={'file': (io.BytesIO(data), f"{self.student_id}.zip")},
+            content_type='multipart/form-data'))
+
+    def target(self, rec, round_num):
+        resp = timed(rec, 'target', lambda: self.client.get(f'/target?round={round_num}'))
+        self.targets = [t['student_id'] for t in resp.get_json() or []] if resp.status_code == 200 else []
+
+    def rate(self, rec, round_num):
+        grades = 'ABCDE'
+        body = {t: {'innovation': random.choice(grades), 'professional': random.choice(grades)} for t in self.targets}
+        path = '/rate/first' if round_num == 1 else '/rate/second'
+        timed(rec, path.strip('/').replace('/', '_'), lambda: self.client.post(path, json=body))
+
+
+def run(data_dir, concurrency, report_path, async_submit=False):
+    work_dir = tempfile.mkdtemp(prefix='judge-loadtest-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'app.db')}"
+    os.environ['STATIC_PAGES_DIR'] = os.path.join(work_dir, 'static_pages')
+    os.environ['BLOB_STORE_DIR'] = os.path.join(work_dir, 'blobs')
+
+    import app as app_module
+    from app import app, db
+    from roster import import_roster, read_roster
+
+    app.config['SUBMIT_ASYNC'] = async_submit
+    app.config['SUBMIT_SPOOL_DIR'] = os.path.join(work_dir, 'spool')
+    with app.app_context():
+        db.create_all()
+        roster = read_roster(os.path.join(data_dir, ROSTER_FILE))
+        import_roster(roster)
+
+    students = [
+        SimulatedStudent(app, sid, os.path.join(data_dir, ARCHIVE_DIR, f"{sid}.zip"))
+        for sid in roster['id'].tolist()
+    ]
+    rec = Recorder()
+
+    def phase(name, func):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(func, s) for s in students]:
+                future.result()
+        rec.wall[name] = time.perf_counter() - start
+
+    app.config['SUBMISSION_DEADLINE'] = datetime(2999, 1, 1)
+    phase('login', lambda s: s.login(rec))
+    phase('submit', lambda s: s.submit(rec))
+    if async_submit:
+        # 等异步队列处理完（任务记录在共享状态后端里，读取需要 app context）
+        with app.app_context():
+            while any(app_module.submission_queue.pending_for(s.student_id) for s in students):
+                time.sleep(0.05)
+    # 截止后开始互评，评审目标改为预先分配（与 cron 在截止时运行 assignments.py 一样先生成第一轮）
+    app.config['SUBMISSION_DEADLINE'] = datetime(2000, 1, 1)
+    with app.app_context():
+        app_module.generate_assignments(1)
+    phase('target', lambda s: s.target(rec, 1))
+    phase('rate_first', lambda s: s.rate(rec, 1))
+    with app.app_context():
+        app_module.shared_state.set(app_module.SECOND_ROUND_OPEN, True)
+        app_module.generate_assignments(2)
+    phase('rate_second', lambda s: (s.target(rec, 2), s.rate(rec, 2)))
+
+    report = build_report(rec, concurrency, len(students))
+    report["work_dir"] = work_dir
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"report written to {report_path}")
+
+
+# ---------------- 3) 报告 ----------------
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def build_report(rec, concurrency, n_students):
+    endpoints = {}
+    total_wall = sum(rec.wall.values())
+    for endpoint, samples in sorted(rec.samples.items()):
+        latencies = sorted(s[0] * 1000 for s in samples)
+        statuses = defaultdict(int)
+        for _, _, status in samples:
+            statuses[str(status)] += 1
+        endpoints[endpoint] = {
+            "requests": len(samples),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "max_ms": round(latencies[-1], 3),
+            "mean_queries": round(sum(s[1] for s in samples) / len(samples), 2),
+            "max_queries": max(s[1] for s in samples),
+            "status": dict(statuses),
+            "peak_rss_kb": rec.peak_rss[endpoint],
+        }
+    return {
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "students": n_students,
+        "concurrency": concurrency,
+        "phases_s": {k: round(v, 3) for k, v in rec.wall.items()},
+        "throughput_rps": {
+            k: round(len(rec.samples.get(k, [])) / v, 1) for k, v in rec.wall.items() if v and rec.samples.get(k)
+        },
+        "total_s": round(total_wall, 3),
+        "process_peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report):
+    print(f"{'endpoint':12s} {'n':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'queries':>8s} {'rss MB':>8s}  status")
+    for name, e in report["endpoints"].items():
+        print(f"{name:12s} {e['requests']:6d} {e['p50_ms']:9.2f} {e['p95_ms']:9.2f} {e['p99_ms']:9.2f} "
+              f"{e['mean_queries']:8.2f} {e['peak_rss_kb'] / 1024:8.1f}  {e['status']}")
+    print("throughput (req/s):", report["throughput_rps"])
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'endpoint':12s} {'p50 before':>11s} {'p50 after':>10s} {'p95 before':>11s} {'p95 after':>10s} {'change':>8s}")
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        b, a = before["endpoints"].get(name), after["endpoints"].get(name)
+        if not b or not a:
+            print(f"{name:12s} only in {'after' if a else 'before'}")
+            continue
+        change = (a["p95_ms"] - b["p95_ms"]) / b["p95_ms"] * 100 if b["p95_ms"] else 0.0
+        print(f"{name:12s} {b['p50_ms']:11.2f} {a['p50_ms']:10.2f} {b['p95_ms']:11.2f} {a['p95_ms']:10.2f} {change:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    g = sub.add_parser('generate')
+    g.add_argument('--out', required=True)
+    g.add_argument('--classes', type=int, default=2)
+    g.add_argument('--students', type=int, default=40, help='每班人数')
+    g.add_argument('--groups', type=int, default=8, help='每班组数')
+    g.add_argument('--asset-kb', type=int, default=64, help='每份作品中随机二进制文件的大小')
+    g.add_argument('--seed', type=int, default=0)
+
+    r = sub.add_parser('run')
+    r.add_argument('--data', required=True)
+    r.add_argument('--concurrency', type=int, default=16)
+    r.add_argument('--report', default='loadtest_report.json')
+    r.add_argument('--async-submit', action='store_true')
+
+    c = sub.add_parser('compare')
+    c.add_argument('before')
+    c.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'generate':
+        generate(args.out, args.classes, args.students, args.groups, args.asset_kb, args.seed)
+    elif args.command == 'run':
+        run(args.data, args.concurrency, args.report, args.async_submit)
+    else:
+        compare(args.before, args.after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+# benchmarks/replay.py
+"""
+回放 recorder.py 录下的请求：用同一份名单建一个全新的数据库，按原来的时间间隔（可加速）重放，
+记录每个请求的状态码、延迟和响应结构，结果存成 JSON；两次构建的结果可以对比。
+
+用法：
+    REQUEST_RECORD_PATH=rec.jsonl REQUEST_RECORD_UPLOADS=rec_uploads python app.py   # 录制
+    python benchmarks/replay.py run --log rec.jsonl --roster grouped_result.xlsx --uploads rec_uploads \\
+        --speed 10 --report replay_a.json
+    python benchmarks/replay.py compare replay_a.json replay_b.json
+
+--speed 1 为原速，10 为十倍速，0 为不等待（同一学生的请求仍按顺序执行）。
+录制时没有保存的上传文件，用同样大小的合成压缩包代替；没有保存的分块用同样大小的随机字节代替
+（这样的分块上传拼不出有效的压缩包，complete 的状态码会与录制时不同）。
+录制时服务端生成的 id（分块上传的 upload_id、异步提交的 job_id）换成回放时响应里的新 id 再放进后续请求的路径。
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadtest import percentile  # noqa: E402
+
+FAR_FUTURE = datetime(2999, 1, 1)
+LONG_AGO = datetime(2000, 1, 1)
+
+
+def load_records(path):
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def synthetic_archive(size):
+    """满足必需文件类型、总大小接近原文件的压缩包"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf:
+        zf.writestr('index.html', '<html><body>replay</body></html>')
+        zf.writestr('style.css', 'body {}')
+        zf.writestr('app.js', '// replay')
+        padding = max(0, size - buf.tell() - 200)
+        if padding:
+            zf.writestr('assets/padding.bin', os.urandom(padding))
+    return buf.getvalue()
+
+
+def shape(value):
+    """响应结构：只保留键名和值的类型，列表只看第一个元素"""
+    if isinstance(value, dict):
+        return {k: shape(v) for k, v in sorted(value.items())}
+    if isinstance(value, list):
+        return [shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def shape_hash(response):
+    if response.is_json:
+        text = json.dumps(shape(response.get_json(silent=True)), sort_keys=True)
+    else:
+        text = response.mimetype
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+class Replayer:
+    def __init__(self, app, uploads_dir):
+        self.app = app
+        self.uploads_dir = uploads_dir
+        self.clients = {}
+        self.executors = {}
+        self.lock = threading.Lock()
+        self.results = []
+        self.synthesized = 0
+        # 录制时的 id → 回放时服务端返回的 id
+        self.ids = {}
+
+    def client_for(self, user):
+        with self.lock:
+            if user not in self.clients:
+                client = self.app.test_client()
+                if user is not None:
+                    # 录制开始前就已登录的学生，先补一次登录（不计入结果）
+                    client.post('/login', json={'student_id': user})
+                self.clients[user] = client
+                self.executors[user] = ThreadPoolExecutor(max_workers=1)
+            return self.clients[user], self.executors[user]
+
+    def upload_bytes(self, meta):
+        if self.uploads_dir:
+            path = os.path.join(self.uploads_dir, f"{meta['sha256']}.zip")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        self.synthesized += 1
+        return synthetic_archive(meta["size"])
+
+    def chunk_bytes(self, meta):
+        if self.uploads_dir:
+            path = os.path.join(self.uploads_dir, f"{meta['sha256']}.chunk")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        self.synthesized += 1
+        return os.urandom(meta["size"])
+
+    def map_path(self, path):
+        with self.lock:
+            return '/'.join(self.ids.get(part, part) for part in path.split('/'))
+
+    def remember_ids(self, record, response):
+        if not record.get("ids") or not response.is_json:
+            return
+        body = response.get_json(silent=True)
+        if not isinstance(body, dict):
+            return
+        with self.lock:
+            for key, recorded in record["ids"].items():
+                if key in body:
+                    self.ids[recorded] = body[key]
+
+    def execute(self, index, record, client):
+        kwargs = {"query_string": record.get("query") or None}
+        if "chunk" in record:
+            data = self.chunk_bytes(record["chunk"])
+            kwargs["data"] = data
+            kwargs["headers"] = {"X-Chunk-Sha256": hashlib.sha256(data).hexdigest()}
+        elif "json" in record:
+            kwargs["json"] = record["json"]
+        elif record.get("files"):
+            data = dict(record.get("form") or {})
+            for meta in record["files"]:
+                data[meta["field"]] = (io.BytesIO(self.upload_bytes(meta)), meta["filename"])
+            kwargs["data"] = data
+            kwargs["content_type"] = 'multipart/form-data'
+        elif "form" in record:
+            kwargs["data"] = record["form"]
+
+        start = time.perf_counter()
+        response = client.open(self.map_path(record["path"]), method=record["method"], **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        self.remember_ids(record, response)
+        result = {
+            "i": index,
+            "endpoint": record.get("endpoint") or record["path"],
+            "status": response.status_code,
+            "ms": round(elapsed, 3),
+            "original_ms": record.get("duration_ms"),
+            "original_status": record.get("status"),
+            "shape": shape_hash(response),
+        }
+        response.close()
+        with self.lock:
+            self.results.append(result)
+
+
+def run(log_path, roster_path, uploads_dir, speed, report_path):
+    work_dir = tempfile.mkdtemp(prefix='judge-replay-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(work_dir, 'app.db')}"
+    os.environ['STATIC_PAGES_DIR'] = os.path.join(work_dir, 'static_pages')
+    os.environ['BLOB_STORE_DIR'] = os.path.join(work_dir, 'blobs')
+    os.environ.pop('REQUEST_RECORD_PATH', None)
+
+    import app as app_module
+    from app import app, db
+    from migrate import migrate
+    from roster import import_roster, read_roster
+
+    app.config['SUBMIT_SPOOL_DIR'] = os.path.join(work_dir, 'spool')
+    app.config['SUBMIT_UPLOAD_DIR'] = os.path.join(work_dir, 'chunks')
+    with app.app_context():
+        migrate(db.engine)
+        import_roster(read_roster(roster_path))
+
+    records = load_records(log_path)
+    if not records:
+        print("no records")
+        return
+    replayer = Replayer(app, uploads_dir)
+    pending = []
+    deadline_passed = None
+    second_round = False
+    t0 = records[0]["ts"]
+    start = time.perf_counter()
+
+    for index, record in enumerate(records):
+        # 截止时间和第二轮开启按录制时的状态切换，切换前等已发出的请求全部完成
+        passed = bool(record.get("deadline_passed"))
+        if passed != deadline_passed:
+            wait(pending)
+            app.config['SUBMISSION_DEADLINE'] = LONG_AGO if passed else FAR_FUTURE
+            deadline_passed = passed
+            if passed:
+                with app.app_context():
+                    app_module.ensure_round_generated(1)
+        if record.get("round") == 2 and not second_round:
+            wait(pending)
+            with app.app_context():
+                app_module.shared_state.set(app_module.SECOND_ROUND_OPEN, True)
+                app_module.generate_assignments(2)
+            second_round = True
+
+        if speed > 0:
+            delay = (record["ts"] - t0) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        client, executor = replayer.client_for(record.get("user"))
+        pending.append(executor.submit(replayer.execute, index, record, client))
+
+    wait(pending)
+    for future in pending:
+        future.result()
+    wall = time.perf_counter() - start
+    for executor in replayer.executors.values():
+        executor.shutdown()
+
+    report = build_report(replayer, log_path, speed, wall)
+    report["work_dir"] = work_dir
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"report written to {report_path}")
+
+
+def build_report(replayer, log_path, speed, wall):
+    results = sorted(replayer.results, key=lambda r: r["i"])
+    by_endpoint = defaultdict(list)
+    for r in results:
+        by_endpoint[r["endpoint"]].append(r)
+    endpoints = {}
+    for name, rows in sorted(by_endpoint.items()):
+        latencies = sorted(r["ms"] for r in rows)
+        original = sorted(r["original_ms"] for r in rows if r["original_ms"] is not None)
+        endpoints[name] = {
+            "requests": len(rows),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "original_p95_ms": round(percentile(original, 95), 3) if original else None,
+            "status_changed": sum(1 for r in rows if r["original_status"] not in (None, r["status"])),
+        }
+    return {
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "log": os.path.abspath(log_path),
+        "speed": speed,
+        "wall_s": round(wall, 3),
+        "synthesized_uploads": replayer.synthesized,
+        "endpoints": endpoints,
+        "requests": results,
+    }
+
+
+def print_report(report):
+    print(f"{'endpoint':24s} {'n':>6s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'orig p95':>9s} {'status!=':>9s}")
+    for name, e in report["endpoints"].items():
+        orig = f"{e['original_p95_ms']:9.2f}" if e['original_p95_ms'] is not None else f"{'-':>9s}"
+        print(f"{name:24s} {e['requests']:6d} {e['p50_ms']:9.2f} {e['p95_ms']:9.2f} {e['p99_ms']:9.2f} "
+              f"{orig} {e['status_changed']:9d}")
+    print(f"wall {report['wall_s']}s, synthesized uploads: {report['synthesized_uploads']}")
+
+
+def compare(before_path, after_path, show=10):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"{'endpoint':24s} {'p50 before':>11s} {'p50 after':>10s} {'p95 before':>11s} {'p95 after':>10s} {'change':>8s}")
+    for name in sorted(set(before["endpoints"]) | set(after["endpoints"])):
+        b, a = before["endpoints"].get(name), after["endpoints"].get(name)
+        if not b or not a:
+            print(f"{name:24s} only in {'after' if a else 'before'}")
+            continue
+        change = (a["p95_ms"] - b["p95_ms"]) / b["p95_ms"] * 100 if b["p95_ms"] else 0.0
+        print(f"{name:24s} {b['p50_ms']:11.2f} {a['p50_ms']:10.2f} {b['p95_ms']:11.2f} {a['p95_ms']:10.2f} {change:+7.1f}%")
+
+    # 同一条录制请求在两次回放中的状态码和响应结构
+    after_by_index = {r["i"]: r for r in after["requests"]}
+    diffs = []
+    for r in before["requests"]:
+        other = after_by_index.get(r["i"])
+        if other is None:
+            continue
+        if r["status"] != other["status"]:
+            diffs.append((r["i"], r["endpoint"], f"status {r['status']} -> {other['status']}"))
+        elif r["shape"] != other["shape"]:
+            diffs.append((r["i"], r["endpoint"], "response shape changed"))
+    print(f"{len(diffs)} of {len(before['requests'])} requests differ")
+    for index, endpoint, what in diffs[:show]:
+        print(f"  #{index} {endpoint}: {what}")
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    r = sub.add_parser('run')
+    r.add_argument('--log', required=True)
+    r.add_argument('--roster', required=True)
+    r.add_argument('--uploads')
+    r.add_argument('--speed', type=float, default=1.0)
+    r.add_argument('--report', default='replay_report.json')
+
+    c = sub.add_parser('compare')
+    c.add_argument('before')
+    c.add_argument('after')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args.log, args.roster, args.uploads, args.speed, args.report)
+    else:
+        sys.exit(1 if compare(args.before, args.after) else 0)
+
+
+if __name__ == '__main__':
+    main()
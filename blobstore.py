@@ -0,0 +1,204 @@
+# blobstore.py
+"""
+按内容哈希去重的文件存储。
+作品目录中的文件都是指向 blobs/<前两位>/<sha256> 的硬链接：
+重复提交时内容没变的文件不再写盘，同组共用的库和图片只存一份。
+硬链接数就是引用计数，st_nlink == 1 的 blob 已无作品引用，可被回收。
+"""
+import errno
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，没有安装时只生成 gzip
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+# 不超过该大小的文件先在内存中算哈希，blob 已存在时完全不写盘
+MEMORY_BUFFER_LIMIT = 1024 * 1024
+# 新写入或刚被复用的 blob 在这段时间内不回收，避免与正在进行的入库竞争
+GC_GRACE_SECONDS = 3600
+
+# 入库时为这些文本类型预先生成压缩副本 <sha256>.gz / <sha256>.br
+COMPRESSIBLE_SUFFIXES = ('.html', '.htm', '.css', '.js', '.mjs', '.json', '.svg', '.txt', '.xml', '.map')
+VARIANT_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+VARIANT_EXTENSIONS = {'gzip': '.gz', 'br': '.br'}
+
+
+def is_compressible(name):
+    return name.lower().endswith(COMPRESSIBLE_SUFFIXES)
+
+
+class BlobStore:
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def variant_path(self, digest, encoding):
+        return self.path(digest) + VARIANT_EXTENSIONS[encoding]
+
+    def put_stream(self, src, compress=False):
+        """
+        把文件流存入仓库，返回 (sha256, 字节数)。
+        compress 为 True 时顺带生成预压缩副本（已存在则跳过）。
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        buf = io.BytesIO()
+        spill = None  # 超过内存上限后改写临时文件
+        try:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                size += len(chunk)
+                if spill is not None:
+                    spill.write(chunk)
+                    continue
+                buf.write(chunk)
+                if size > MEMORY_BUFFER_LIMIT:
+                    fd, spill_path = tempfile.mkstemp(dir=self.tmp_dir)
+                    spill = os.fdopen(fd, 'wb')
+                    spill.write(buf.getvalue())
+                    buf = None
+            digest = hasher.hexdigest()
+            if spill is not None:
+                spill.close()
+                self._commit_file(spill_path, digest)
+                spill = None
+            else:
+                self._commit_bytes(buf.getvalue(), digest)
+        finally:
+            if spill is not None:
+                spill.close()
+                _remove(spill_path)
+        if compress:
+            self.ensure_variants(digest)
+        return digest, size
+
+    def ensure_variants(self, digest):
+        """生成 gzip（以及可选的 brotli）副本；压缩后不变小的不保存"""
+        pending = [enc for enc in VARIANT_ENCODINGS if not os.path.exists(self.variant_path(digest, enc))]
+        if not pending:
+            return
+        with open(self.path(digest), 'rb') as f:
+            data = f.read()
+        for encoding in pending:
+            if encoding == 'br':
+                compressed = brotli.compress(data)
+            else:
+                # mtime=0 保证同一内容的输出逐字节一致
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) >= len(data):
+                continue
+            fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            self._install(tmp_path, self.variant_path(digest, encoding))
+
+    def link_into(self, digest, dest_path):
+        """在作品目录中建立指向 blob 的硬链接，跨文件系统等情况退化为复制"""
+        blob_path = self.path(digest)
+        try:
+            os.link(blob_path, dest_path)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copyfile(blob_path, dest_path)
+
+    def _commit_bytes(self, data, digest):
+        blob_path = self.path(digest)
+        if self._reuse(blob_path):
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        self._install(tmp_path, blob_path)
+
+    def _commit_file(self, tmp_path, digest):
+        blob_path = self.path(digest)
+        if self._reuse(blob_path):
+            _remove(tmp_path)
+            return
+        self._install(tmp_path, blob_path)
+
+    def _reuse(self, blob_path):
+        # 已存在的 blob 只刷新 mtime，让回收器知道它刚被用过
+        try:
+            os.utime(blob_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _install(self, tmp_path, blob_path):
+        os.chmod(tmp_path, 0o644)  # mkstemp 默认 0600
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        # 并发写入同一内容时后者覆盖前者，内容相同所以无害
+        os.replace(tmp_path, blob_path)
+
+    def iter_blobs(self):
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix == 'tmp' or not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if '.' in name:  # 压缩副本随原 blob 一起回收
+                    continue
+                yield os.path.join(prefix_dir, name)
+
+    def gc(self, dry_run=False, grace_seconds=GC_GRACE_SECONDS):
+        """删除没有任何作品引用（硬链接数为 1）的 blob"""
+        cutoff = time.time() - grace_seconds
+        stats = {"scanned": 0, "removed": 0, "bytes_freed": 0}
+        for blob_path in self.iter_blobs():
+            stats["scanned"] += 1
+            try:
+                st = os.stat(blob_path)
+            except FileNotFoundError:
+                continue
+            if st.st_nlink > 1 or st.st_mtime > cutoff:
+                continue
+            stats["removed"] += 1
+            stats["bytes_freed"] += st.st_size
+            if not dry_run:
+                _remove(blob_path)
+                for ext in VARIANT_EXTENSIONS.values():
+                    _remove(blob_path + ext)
+        # 清理中断入库遗留的临时文件
+        for name in os.listdir(self.tmp_dir):
+            tmp_path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.stat(tmp_path).st_mtime < cutoff and not dry_run:
+                    _remove(tmp_path)
+            except FileNotFoundError:
+                pass
+        return stats
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+if __name__ == '__main__':
+    # python blobstore.py gc [--dry-run]
+    import sys
+    from app import blob_store
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'gc':
+        print("usage: python blobstore.py gc [--dry-run]")
+        sys.exit(1)
+    print(blob_store.gc(dry_run='--dry-run' in sys.argv))
@@ -0,0 +1,117 @@
+# export.py
+"""
+评分与分析结果导出。
+数据库用服务端游标（yield_per）分批读取，行由生成器逐条写出，内存占用与数据量无关。
+"""
+import csv
+import io
+import os
+import tempfile
+
+from openpyxl import Workbook
+from sqlalchemy import select
+
+from analysis_engine import build_group, total_scores
+from models import db, Rating
+from scoring import score_group
+
+YIELD_PER = 1000
+XLSX_CHUNK_SIZE = 64 * 1024
+
+RATING_HEADER = [
+    "Rating ID", "Round", "Reviewer ID", "Reviewer Class", "Reviewer Group",
+    "Target Group", "Target ID", "Innovation", "Professional", "Total Score", "Timestamp",
+]
+COMPARISON_HEADER = ["Class", "Group", "Target I", "Target J", "Reviewer ID", "Comparison"]
+SCORE_HEADER = ["Class", "Group", "Student ID", "Average Score", "Variance", "Rank", "Ratings"]
+
+
+def _stream(stmt):
+    return db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+
+def iter_rating_rows(round_num=None):
+    stmt = select(
+        Rating.id, Rating.round, Rating.reviewer_id, Rating.reviewer_class, Rating.reviewer_group,
+        Rating.target_group, Rating.target_id, Rating.innovation_score, Rating.professional_score,
+        Rating.timestamp,
+    ).order_by(Rating.id)
+    if round_num is not None:
+        stmt = stmt.where(Rating.round == round_num)
+    yield RATING_HEADER
+    for row in _stream(stmt):
+        total = float(total_scores(row.professional_score, row.innovation_score))
+        yield [
+            row.id, row.round, row.reviewer_id, row.reviewer_class, row.reviewer_group,
+            row.target_group, row.target_id, row.innovation_score, row.professional_score,
+            total, row.timestamp.isoformat(sep=' ') if row.timestamp else "",
+        ]
+
+
+def iter_group_comparisons(round_num):
+    """按 (班级, 小组) 顺序读取评分，每读完一组产出一个 GroupComparison，只在内存中保留一组"""
+    stmt = select(
+        Rating.reviewer_class, Rating.reviewer_group, Rating.reviewer_id, Rating.target_id,
+        Rating.professional_score, Rating.innovation_score,
+    ).where(Rating.round == round_num).order_by(Rating.reviewer_class, Rating.reviewer_group, Rating.id)
+
+    current, buffered = None, []
+    for row in _stream(stmt):
+        key = (row.reviewer_class, row.reviewer_group)
+        if key != current and buffered:
+            yield current, _build(buffered)
+            buffered = []
+        current = key
+        buffered.append(row)
+    if buffered:
+        yield current, _build(buffered)
+
+
+def _build(rows):
+    _, _, reviewer_ids, target_ids, P, I = zip(*rows)
+    return build_group(reviewer_ids, target_ids, total_scores(P, I))
+
+
+def iter_comparison_rows(round_num):
+    yield COMPARISON_HEADER
+    for (cls_id, grp), comparison in iter_group_comparisons(round_num):
+        table = comparison.to_table()
+        for row in table["data"]:
+            i, j = row["pair"]
+            for rid in table["reviewers"]:
+                yield [cls_id, grp, i, j, rid, row[str(rid)]]
+
+
+def iter_score_rows(round_num):
+    yield SCORE_HEADER
+    for (cls_id, grp), comparison in iter_group_comparisons(round_num):
+        targets, _ = score_group(comparison)
+        for t in targets:
+            yield [cls_id, grp, t["student_id"], t["average"], t["variance"], t["rank"], t["ratings"]]
+
+
+def csv_stream(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def xlsx_stream(rows, title):
+    """openpyxl 只写模式逐行写入临时文件，写完后分块读出"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=title)
+    for row in rows:
+        ws.append(row)
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        wb.save(path)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(XLSX_CHUNK_SIZE), b''):
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,93 @@
+# identity.py
+"""
+学生身份缓存：班级、组别、姓名在一个学期内基本不变，不必每个请求都查 Student。
+    - 请求级：g 上的字典，同一请求内多次取同一学生只查一次
+    - 进程级：学号 → StudentIdentity，名单导入后通过 invalidate_students() 失效
+其它 worker 通过共享状态中的 roster_version 得知名单已变化，最多延迟 STATE_CACHE_TTL 秒。
+"""
+import threading
+from collections import namedtuple
+
+from flask import g, has_request_context, session
+
+from models import db, Student
+from state import shared_state
+
+ROSTER_VERSION = 'roster_version'
+
+# 只读的学生信息，字段名与 Student 一致，可直接替换原来的 ORM 对象
+StudentIdentity = namedtuple('StudentIdentity', ['id', 'name', 'class_id', 'group'])
+
+
+class IdentityCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._students = {}
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self):
+        # 共享状态本身有进程内 TTL 缓存，这里不产生 I/O
+        version = shared_state.get(ROSTER_VERSION, 0) if shared_state.backend is not None else 0
+        if version != self._version:
+            with self._lock:
+                self._students.clear()
+                self._version = version
+
+    def get(self, student_id):
+        self._check_version()
+        identity = self._students.get(student_id)
+        if identity is not None:
+            self.hits += 1
+            return identity
+        self.misses += 1
+        row = (
+            db.session.query(Student.id, Student.name, Student.class_id, Student.group)
+            .filter(Student.id == student_id)
+            .first()
+        )
+        if row is None:
+            return None
+        identity = StudentIdentity(*row)
+        with self._lock:
+            self._students[student_id] = identity
+        return identity
+
+    def invalidate(self, student_ids=None):
+        with self._lock:
+            if student_ids is None:
+                self._students.clear()
+            else:
+                for student_id in student_ids:
+                    self._students.pop(student_id, None)
+
+    def stats(self):
+        return {"entries": len(self._students), "hits": self.hits, "misses": self.misses}
+
+
+identity_cache = IdentityCache()
+
+
+def get_student(student_id):
+    """先查本请求已取过的，再查进程缓存，最后查库；不存在返回 None"""
+    if student_id is None:
+        return None
+    if not has_request_context():
+        return identity_cache.get(student_id)
+    students = g.setdefault('_students', {})
+    if student_id not in students:
+        students[student_id] = identity_cache.get(student_id)
+    return students[student_id]
+
+
+def current_student():
+    return get_student(session.get('user_id'))
+
+
+def invalidate_students():
+    """名单导入后调用：清空本进程缓存，并通知其它 worker（需要已初始化的 shared_state）"""
+    identity_cache.invalidate()
+    if has_request_context():
+        g.pop('_students', None)
+    shared_state.incr(ROSTER_VERSION)
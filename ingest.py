@@ -0,0 +1,333 @@
+# ingest.py
+"""
+作品压缩包入库流程：
+    打开上传流 → 根据中央目录校验文件类型和大小 → 解压到暂存目录 → 原子替换到正式目录
+任何一步失败都不会动到学生之前的提交。
+正式目录 <学号> 是指向同目录下版本目录 .<学号>.v-<随机> 的符号链接，发布新版本只替换这个链接，
+任何时刻访问 <学号>/ 都能看到一份完整的作品（旧版本或新版本）。
+解压时按块读取并累计实际字节数，超过 ExtractLimits 中的任一限制立即中止（防 zip 炸弹）。
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+import zlib
+from contextlib import contextmanager
+
+from blobstore import is_compressible
+from manifest import Manifest
+
+# 提交的作品必须同时包含这三种文件
+REQUIRED_SUFFIXES = ('.html', '.css', '.js')
+
+CHUNK_SIZE = 64 * 1024
+
+# 版本目录和替换用的临时链接的命名：.<学号>.v-<随机>、.<学号>.link-<随机>
+VERSION_MARK = '.v-'
+LINK_MARK = '.link-'
+
+# 被换下的版本目录保留的秒数
+RETIRED_VERSION_SECONDS = 60
+
+# 小于这个大小的文件不检查压缩比，文本文件压缩比本来就高
+RATIO_MIN_BYTES = 1024 * 1024
+
+
+class IngestError(Exception):
+    """入库失败，message/detail 直接返回给前端"""
+
+    def __init__(self, message, detail=None, status=400):
+        super().__init__(message)
+        self.message = message
+        self.detail = detail
+        self.status = status
+
+    def to_dict(self):
+        out = {"error": self.message}
+        if self.detail is not None:
+            out["detail"] = self.detail
+        return out
+
+
+class ExtractLimits:
+    """解压限制，None 表示不限制"""
+
+    def __init__(self, max_total_bytes=200 * 1024 * 1024, max_file_bytes=50 * 1024 * 1024,
+                 max_entries=2000, max_ratio=100):
+        self.max_total_bytes = max_total_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_entries = max_entries
+        self.max_ratio = max_ratio
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_total_bytes=config.get('INGEST_MAX_TOTAL_BYTES'),
+            max_file_bytes=config.get('INGEST_MAX_FILE_BYTES'),
+            max_entries=config.get('INGEST_MAX_ENTRIES'),
+            max_ratio=config.get('INGEST_MAX_RATIO'),
+        )
+
+
+def limit_error(limit, maximum, value, name=None):
+    detail = {"limit": limit, "max": maximum, "value": value}
+    if name is not None:
+        detail["file"] = name
+    return IngestError("Archive exceeds extraction limits", detail=detail, status=413)
+
+
+def check_declared_sizes(members, limits):
+    """先用中央目录里声明的大小做一遍检查，明显超限的包不用开始解压"""
+    files = [info for info in members if not info.is_dir()]
+    if limits.max_entries is not None and len(members) > limits.max_entries:
+        raise limit_error("max_entries", limits.max_entries, len(members))
+    total = 0
+    for info in files:
+        if limits.max_file_bytes is not None and info.file_size > limits.max_file_bytes:
+            raise limit_error("max_file_bytes", limits.max_file_bytes, info.file_size, info.filename)
+        check_ratio(info.filename, info.file_size, info.compress_size, limits)
+        total += info.file_size
+    if limits.max_total_bytes is not None and total > limits.max_total_bytes:
+        raise limit_error("max_total_bytes", limits.max_total_bytes, total)
+
+
+def check_ratio(name, size, compressed, limits):
+    if limits.max_ratio is None or size < RATIO_MIN_BYTES:
+        return
+    ratio = size / max(compressed, 1)
+    if ratio > limits.max_ratio:
+        raise limit_error("max_ratio", limits.max_ratio, round(ratio, 1), name)
+
+
+class LimitedReader:
+    """
+    包装 zip 成员的读取流，按实际解压出的字节数计数（不相信头部声明的大小），
+    超过单文件、总量或压缩比限制时抛 IngestError。
+    """
+
+    def __init__(self, src, info, limits, budget):
+        self.src = src
+        self.info = info
+        self.limits = limits
+        self.budget = budget   # 本次解压的累计字节数，{"total": n}
+        self.size = 0
+
+    def read(self, n=CHUNK_SIZE):
+        chunk = self.src.read(n)
+        if chunk:
+            self.size += len(chunk)
+            self.budget["total"] += len(chunk)
+            limits = self.limits
+            if limits.max_file_bytes is not None and self.size > limits.max_file_bytes:
+                raise limit_error("max_file_bytes", limits.max_file_bytes, self.size, self.info.filename)
+            if limits.max_total_bytes is not None and self.budget["total"] > limits.max_total_bytes:
+                raise limit_error("max_total_bytes", limits.max_total_bytes, self.budget["total"])
+            check_ratio(self.info.filename, self.size, self.info.compress_size, limits)
+        return chunk
+
+
+class StageTimer:
+    """记录每个阶段的耗时（毫秒）"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 3)
+
+
+def is_safe_member(name):
+    # 防止路径穿越
+    return not (name.startswith('/') or '..' in name)
+
+
+def check_required_suffixes(names):
+    """只看文件名即可判断，不需要先解压"""
+    found = {suffix: False for suffix in REQUIRED_SUFFIXES}
+    for name in names:
+        for suffix in REQUIRED_SUFFIXES:
+            if name.endswith(suffix):
+                found[suffix] = True
+                break
+    return found
+
+
+def ingest_archive(fileobj, dest_dir, timer=None, blob_store=None, limits=None):
+    """
+    把上传的 zip（可 seek 的文件对象）发布到 dest_dir。
+    传入 blob_store 时文件内容存入去重仓库，作品目录由硬链接组成。
+    成功返回 Manifest（每个文件的路径、大小、sha256），各阶段耗时记录在 timer 中；
+    失败抛 IngestError，dest_dir 保持原样。
+    """
+    timer = timer or StageTimer()
+    limits = limits or ExtractLimits()
+
+    with timer.stage("open"):
+        try:
+            zip_ref = zipfile.ZipFile(fileobj)
+        except (zipfile.BadZipFile, OSError):
+            raise IngestError("File is not a valid zip archive")
+
+    with zip_ref:
+        # ---------- 1) 用中央目录校验，不写任何文件 ----------
+        with timer.stage("validate"):
+            members = [info for info in zip_ref.infolist() if is_safe_member(info.filename)]
+            found = check_required_suffixes(info.filename for info in members if not info.is_dir())
+            if not all(found.values()):
+                raise IngestError("Missing required file types", detail=found)
+            check_declared_sizes(members, limits)
+
+        # ---------- 2) 解压到同目录下的暂存目录 ----------
+        with timer.stage("extract"):
+            staging = make_staging_dir(dest_dir)
+            budget = {"total": 0}
+            manifest = Manifest()
+            try:
+                for info in members:
+                    if blob_store is None:
+                        extract_member(zip_ref, info, staging, limits, budget, manifest)
+                    else:
+                        extract_to_blob_store(zip_ref, info, staging, blob_store, limits, budget, manifest)
+            except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+                # CRC 不符、数据截断，或头部声明的大小与实际不一致
+                shutil.rmtree(staging, ignore_errors=True)
+                raise IngestError("File is not a valid zip archive", detail=str(e))
+            except Exception:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+    # ---------- 3) 替换正式目录的链接 ----------
+    with timer.stage("publish"):
+        swap_into_place(staging, dest_dir)
+
+    return manifest
+
+
+def member_target(info, staging):
+    """
+    返回 (相对路径, 暂存目录中的路径)；目录成员直接创建并返回 (None, None)
+    """
+    parts = [p for p in info.filename.split('/') if p not in ('', '.')]
+    if not parts:
+        return None, None
+    target = os.path.join(staging, *parts)
+    if info.is_dir():
+        os.makedirs(target, exist_ok=True)
+        return None, None
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    return '/'.join(parts), target
+
+
+def extract_member(zip_ref, info, staging, limits, budget, manifest):
+    rel, target = member_target(info, staging)
+    if target is None:
+        return
+    hasher = hashlib.sha256()
+    with zip_ref.open(info) as src, open(target, 'wb') as dst:
+        reader = LimitedReader(src, info, limits, budget)
+        while True:
+            chunk = reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            dst.write(chunk)
+    manifest.add(rel, reader.size, hasher.hexdigest())
+
+
+def extract_to_blob_store(zip_ref, info, staging, blob_store, limits, budget, manifest):
+    rel, target = member_target(info, staging)
+    if target is None:
+        return
+    with zip_ref.open(info) as src:
+        reader = LimitedReader(src, info, limits, budget)
+        digest, size = blob_store.put_stream(reader, compress=is_compressible(info.filename))
+    manifest.add(rel, size, digest)
+    # 压缩包里有同名文件时后者覆盖前者，与 ZipFile.extract 一致
+    if os.path.lexists(target):
+        os.remove(target)
+    blob_store.link_into(digest, target)
+
+
+def make_staging_dir(dest_dir):
+    # 暂存目录与正式目录在同一父目录下，保证 rename 不跨文件系统
+    parent = os.path.dirname(dest_dir)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(dest_dir)}.staging-", dir=parent)
+    os.chmod(staging, 0o755)  # mkdtemp 默认 0700，静态服务器读不到
+    return staging
+
+
+def version_owner(name):
+    """版本目录 .<学号>.v-<随机> 属于哪个作品目录，不是版本目录时返回 None"""
+    if not name.startswith('.') or VERSION_MARK not in name:
+        return None
+    return name[1:name.rindex(VERSION_MARK)]
+
+
+def swap_into_place(staging, dest_dir):
+    """
+    把 staging 发布到 dest_dir：staging 改名为新的版本目录，在旁边建一个指向它的临时链接，
+    再用 os.replace 把临时链接换成 dest_dir。替换链接是一次 rename，不存在 dest_dir 缺失的时刻。
+    被换下的版本目录刷新 mtime 后保留 RETIRED_VERSION_SECONDS 秒，已经解析到旧版本路径的请求仍能读完，
+    下次发布时再删除更早换下的版本。
+    """
+    parent, name = os.path.split(dest_dir)
+    version = os.path.join(parent, f".{name}{VERSION_MARK}{uuid.uuid4().hex}")
+    link = os.path.join(parent, f".{name}{LINK_MARK}{uuid.uuid4().hex}")
+    previous = None
+    legacy = False
+    try:
+        os.rename(staging, version)
+        os.symlink(os.path.basename(version), link)
+        if os.path.islink(dest_dir):
+            previous = os.path.join(parent, os.readlink(dest_dir))
+        elif os.path.isdir(dest_dir):
+            # 改为符号链接之前发布的真实目录不能被链接原子替换，先改名为版本目录（只在这一次有短暂空档）
+            previous = os.path.join(parent, f".{name}{VERSION_MARK}{uuid.uuid4().hex}")
+            os.rename(dest_dir, previous)
+            legacy = True
+        os.replace(link, dest_dir)
+    except OSError:
+        if legacy and not os.path.lexists(dest_dir):
+            os.rename(previous, dest_dir)
+        _remove(link)
+        shutil.rmtree(version, ignore_errors=True)
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if previous is not None:
+        try:
+            os.utime(previous)
+        except FileNotFoundError:
+            pass
+    prune_retired_versions(parent, name, keep=(version, previous))
+
+
+def prune_retired_versions(parent, name, keep):
+    """
+    删除 name 的换下超过 RETIRED_VERSION_SECONDS 秒的版本目录。
+    刚解压完、还没换上的版本（并发发布）mtime 也是新的，不会被删；其余遗留由 lifecycle.py 清理。
+    """
+    cutoff = time.time() - RETIRED_VERSION_SECONDS
+    for entry in os.scandir(parent):
+        if entry.path in keep or version_owner(entry.name) != name:
+            continue
+        try:
+            if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,50 +1,29 @@
-from flask import Flask
-from models import db, Student, Project, GroupAssignment, Rating
-import pandas as pd
+import sys
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+from sqlalchemy.exc import OperationalError
 
+from app import app
+from models import db
+from roster import import_roster, read_roster
+from state import shared_state
+from versions import carry_forward
+
+# 使用 app.py 中的 app：同一个数据库（DATABASE_URL）和同一个共享状态后端，
+# 导入名单时 roster_version 自增，运行中的 worker 才会丢掉旧的身份缓存。
+# python init_db.py           增量导入 grouped_result.xlsx，保留已有提交和评分
+# python init_db.py --reset   清空所有表后重新导入
 with app.app_context():
-    db.drop_all()
+    if '--reset' in sys.argv:
+        try:
+            previous = shared_state.all()
+        except OperationalError:  # 还没有 app_state 表
+            previous = {}
+        db.drop_all()
+        db.create_all()
+        shared_state.refresh()
+        carry_forward(previous)
     db.create_all()
 
-    df = pd.read_excel('grouped_result.xlsx')
-
-    for _, row in df.iterrows():
-        student = Student(
-            id=str(row['id']),
-            name= str(row['姓名']),
-            group= int(row['group_id']),
-            class_id = int(row['class']),
-        )
-        project = Project(student_id=student.id, submitted=False)
-
-        db.session.add(student)
-        db.session.add(project)
-
-    seen = set()
-    for _, row in df.iterrows():
-        class_id = int(row['class'])
-        reviewer_group = int(row['group_id'])
-        target_group = int(row['assign_work'])
-
-        key = (class_id, reviewer_group, target_group)
-        if key in seen:
-            continue
-        seen.add(key)
-
-        groupassignment = GroupAssignment(
-            class_id=class_id,
-            reviewer_group=reviewer_group,
-            target_group=target_group
-        )
-        db.session.add(groupassignment)
-    
-    db.session.commit()
-    print("Database initialized and populated with data from grouped_result.csv")
-
-
-
+    df = read_roster('grouped_result.xlsx')
+    stats = import_roster(df)
+    print(f"Database populated with data from grouped_result.xlsx: {stats}")
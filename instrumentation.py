@@ -0,0 +1,266 @@
+# instrumentation.py
+"""
+请求级别的性能观测：
+    - SQL 条数与耗时（SQLAlchemy 事件），以及每个接口的查询预算
+    - 每个接口的请求耗时直方图
+    - submit_work、分析函数内部的阶段计时
+    - 可按请求开启的采样分析器
+数据通过 /metrics（Prometheus 文本格式）和可选的 Server-Timing 响应头输出。
+指标保存在当前进程内存中。
+"""
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 秒为单位的直方图分桶
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 保留最近多少份采样结果
+PROFILES_KEPT = 20
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+# ---------------- SQL 计数与计时 ----------------
+
+# 开始时间放在本条语句的 context 上：语句出错时 after_cursor_execute 不会触发，
+# 放在连接上的话会一直留着，之后的语句取到的就是别人的开始时间
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g._query_count = g.get('_query_count', 0) + 1
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _time_query(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_query_start', None)
+    if start is not None and has_app_context():
+        g._query_time = g.get('_query_time', 0.0) + time.perf_counter() - start
+
+
+def query_count():
+    return g.get('_query_count', 0) if has_app_context() else 0
+
+
+def query_time():
+    return g.get('_query_time', 0.0) if has_app_context() else 0.0
+
+
+def query_budget(limit):
+    """限制被装饰接口在一次请求中执行的 SQL 条数，与目标数、作品数无关"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = query_count()
+            result = func(*args, **kwargs)
+            used = query_count() - start
+            if used > limit:
+                message = f"{func.__name__} ran {used} queries, budget is {limit}"
+                if current_app.config.get('QUERY_BUDGET_STRICT'):
+                    raise QueryBudgetExceeded(message)
+                current_app.logger.warning(message)
+            return result
+        wrapper.query_budget = limit
+        return wrapper
+    return decorator
+
+
+# ---------------- 指标 ----------------
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.request_seconds = defaultdict(Histogram)   # (endpoint, method) -> Histogram
+        self.requests_total = Counter()                 # (endpoint, method, status)
+        self.db_queries_total = Counter()               # endpoint
+        self.db_seconds_total = defaultdict(float)      # endpoint
+        self.stage_seconds = defaultdict(Histogram)     # stage -> Histogram
+        self.collectors = []                            # 额外的 gauge，返回 [(name, labels, value)]
+
+    def observe_request(self, endpoint, method, status, seconds, queries, db_seconds):
+        with self.lock:
+            self.request_seconds[(endpoint, method)].observe(seconds)
+            self.requests_total[(endpoint, method, status)] += 1
+            self.db_queries_total[endpoint] += queries
+            self.db_seconds_total[endpoint] += db_seconds
+
+    def observe_stage(self, name, seconds):
+        with self.lock:
+            self.stage_seconds[name].observe(seconds)
+
+    def render(self):
+        out = []
+        with self.lock:
+            out.append('# TYPE judge_http_request_duration_seconds histogram')
+            for (endpoint, method), hist in sorted(self.request_seconds.items()):
+                out.extend(hist.lines('judge_http_request_duration_seconds',
+                                      f'endpoint="{endpoint}",method="{method}"'))
+            out.append('# TYPE judge_http_requests_total counter')
+            for (endpoint, method, status), n in sorted(self.requests_total.items()):
+                out.append(f'judge_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {n}')
+            out.append('# TYPE judge_db_queries_total counter')
+            for endpoint, n in sorted(self.db_queries_total.items()):
+                out.append(f'judge_db_queries_total{{endpoint="{endpoint}"}} {n}')
+            out.append('# TYPE judge_db_query_seconds_total counter')
+            for endpoint, seconds in sorted(self.db_seconds_total.items()):
+                out.append(f'judge_db_query_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+            out.append('# TYPE judge_stage_duration_seconds histogram')
+            for stage_name, hist in sorted(self.stage_seconds.items()):
+                out.extend(hist.lines('judge_stage_duration_seconds', f'stage="{stage_name}"'))
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                out.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return '\n'.join(out) + '\n'
+
+
+metrics = Metrics()
+
+
+def register_collector(func):
+    metrics.collectors.append(func)
+    return func
+
+
+# ---------------- 阶段计时 ----------------
+
+def record_stage(name, seconds):
+    metrics.observe_stage(name, seconds)
+    if has_request_context():
+        stages = g.setdefault('_stages', {})
+        stages[name] = stages.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+# ---------------- 采样分析器 ----------------
+
+class SamplingProfiler:
+    """后台线程定时抓取目标线程的调用栈，输出 collapsed stack（可直接生成火焰图）"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {n}" for stack, n in self.stacks.most_common()) + '\n'
+
+
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def get_profile(profile_id):
+    with _profiles_lock:
+        return _profiles.get(profile_id)
+
+
+def _profiling_requested():
+    return (current_app.config['PROFILER_ENABLED']
+            and (request.args.get('_profile') == '1' or request.headers.get('X-Profile') == '1'))
+
+
+# ---------------- 接入 Flask ----------------
+
+def init_app(app):
+    app.config.setdefault('QUERY_BUDGET_STRICT', False)
+    app.config.setdefault('SERVER_TIMING', False)
+    app.config.setdefault('PROFILER_ENABLED', False)
+    app.config.setdefault('PROFILER_INTERVAL', 0.005)
+
+    @app.before_request
+    def start_request_timer():
+        g._request_start = time.perf_counter()
+        if _profiling_requested():
+            g._profiler = SamplingProfiler(threading.get_ident(), app.config['PROFILER_INTERVAL'])
+            g._profiler.start()
+
+    @app.after_request
+    def finish_request_timer(response):
+        elapsed = time.perf_counter() - g.get('_request_start', time.perf_counter())
+        queries, db_seconds = query_count(), query_time()
+        endpoint = request.endpoint or 'unknown'
+        metrics.observe_request(endpoint, request.method, response.status_code, elapsed, queries, db_seconds)
+
+        response.headers['X-Query-Count'] = str(queries)
+        if app.config['SERVER_TIMING']:
+            parts = [f'app;dur={elapsed * 1000:.2f}', f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries"']
+            parts += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in g.get('_stages', {}).items()]
+            response.headers['Server-Timing'] = ', '.join(parts)
+
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.stop()
+            profile_id = uuid.uuid4().hex
+            with _profiles_lock:
+                _profiles[profile_id] = profiler.collapsed()
+                while len(_profiles) > PROFILES_KEPT:
+                    _profiles.popitem(last=False)
+            response.headers['X-Profile-Id'] = profile_id
+        return response
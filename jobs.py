@@ -0,0 +1,266 @@
+# jobs.py
+"""
+异步作品处理队列：/submit 只负责把上传落盘并入队，解压、校验、更新 Project 在线程池里完成。
+任务记录存在共享状态后端（state.py）里，任何一个 worker 都能回答 /submit/status 和 /submit/history：
+    job:<任务号>          任务记录
+    job_latest:<学号>     该学生最近一次任务的任务号
+线程池和暂存文件属于接收上传的进程；同一学生的任务用 SUBMIT_SPOOL_DIR/.locks 下的文件锁跨进程串行执行，
+开启去重时只处理最近一次任务，较早的任务轮到时直接标记为 superseded。
+"""
+import fcntl
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from ingest import IngestError, StageTimer
+from state import shared_state
+
+# 任务状态
+QUEUED = 'queued'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+SUPERSEDED = 'superseded'
+
+# 已结束的任务最多保留多少条供 /submit/status 查询
+FINISHED_JOBS_KEPT = 2000
+
+# 两次淘汰旧任务记录之间至少间隔的秒数（在 enqueue 时顺带执行）
+TRIM_INTERVAL = 60
+
+JOB_PREFIX = 'job:'
+LATEST_PREFIX = 'job_latest:'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, student_id, spool_path):
+        self.id = uuid.uuid4().hex
+        self.student_id = student_id
+        self.spool_path = spool_path
+        self.state = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.timings = None
+
+    @property
+    def active(self):
+        return self.state in (QUEUED, PROCESSING)
+
+    def to_dict(self):
+        out = {
+            "job_id": self.id,
+            "student_id": self.student_id,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.error is not None:
+            out["error"] = self.error
+        if self.timings is not None:
+            out["timings_ms"] = self.timings
+        return out
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls.__new__(cls)
+        job.id = data["job_id"]
+        job.student_id = data["student_id"]
+        job.spool_path = None  # 暂存文件只有接收上传的进程知道
+        job.state = data["state"]
+        job.created_at = data["created_at"]
+        job.started_at = data["started_at"]
+        job.finished_at = data["finished_at"]
+        job.error = data.get("error")
+        job.timings = data.get("timings_ms")
+        return job
+
+
+class SubmissionQueue:
+    """
+    有界的作品处理线程池。
+    - SUBMIT_WORKERS: 工作线程数
+    - SUBMIT_QUEUE_DEPTH: 本进程排队+处理中的任务上限，超过则拒绝
+    - SUBMIT_DEDUPE: 同一学生新上传会取代还在排队的旧任务（包括其它 worker 上的）
+    - SUBMIT_JOB_STALE_SECONDS: 超过这个时间还没结束的任务视为所在进程已退出，不再算作处理中
+    """
+
+    def __init__(self, app=None, state=shared_state):
+        self.app = None
+        self.state = state
+        self._executor = None
+        self._lock = threading.Lock()
+        self._active = {}   # 本进程线程池中还没结束的任务：任务号 -> Job
+        self._last_trim = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUBMIT_ASYNC', False)
+        app.config.setdefault('SUBMIT_WORKERS', 4)
+        app.config.setdefault('SUBMIT_QUEUE_DEPTH', 64)
+        app.config.setdefault('SUBMIT_DEDUPE', True)
+        app.config.setdefault('SUBMIT_JOB_STALE_SECONDS', 3600)
+        app.config.setdefault('SUBMIT_SPOOL_DIR', os.path.join(app.root_path, 'uploads', 'spool'))
+        self.app = app
+        app.extensions['submission_queue'] = self
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.app.config['SUBMIT_WORKERS'],
+                        thread_name_prefix='submit-worker',
+                    )
+        return self._executor
+
+    def spool_path(self):
+        spool_dir = self.app.config['SUBMIT_SPOOL_DIR']
+        os.makedirs(spool_dir, exist_ok=True)
+        return os.path.join(spool_dir, f"{uuid.uuid4().hex}.zip")
+
+    # ---------------- 共享的任务记录 ----------------
+
+    def _save(self, job):
+        self.state.write(JOB_PREFIX + job.id, job.to_dict())
+
+    def get(self, job_id):
+        data = self.state.read(JOB_PREFIX + job_id)
+        return None if data is None else Job.from_dict(data)
+
+    def pending_for(self, student_id):
+        job_id = self.state.read(LATEST_PREFIX + str(student_id))
+        if job_id is None:
+            return None
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return None
+        if time.time() - job.created_at > self.app.config['SUBMIT_JOB_STALE_SECONDS']:
+            return None
+        return job
+
+    def state_counts(self):
+        return Counter(data["state"] for data in self.state.scan(JOB_PREFIX).values())
+
+    # ---------------- 入队与执行 ----------------
+
+    def enqueue(self, student_id, spool_path, handler):
+        """
+        handler(student_id, fileobj, timer) 在 app context 中执行，返回耗时字典，失败抛 IngestError。
+        """
+        job = Job(student_id, spool_path)
+        superseded = None
+        with self._lock:
+            active = len(self._active)
+            previous = None
+            if self.app.config['SUBMIT_DEDUPE']:
+                previous = self.pending_for(student_id)
+                if previous is not None and previous.state != QUEUED:
+                    previous = None
+            if previous is not None and previous.id in self._active:
+                active -= 1
+            # 队列满时不能丢掉旧任务，先检查再取代
+            if active >= self.app.config['SUBMIT_QUEUE_DEPTH']:
+                raise QueueFull()
+            self._save(job)
+            self.state.write(LATEST_PREFIX + str(student_id), job.id)
+            if previous is not None:
+                previous.state = SUPERSEDED
+                previous.finished_at = time.time()
+                self._save(previous)
+                superseded = self._active.pop(previous.id, None)
+            self._active[job.id] = job
+
+        # 其它 worker 上的旧任务轮到时会发现自己已不是最近一次，由那个进程删除暂存文件
+        if superseded is not None:
+            _remove(superseded.spool_path)
+        self.trim()
+        self.executor.submit(self._run, job, handler)
+        return job
+
+    @contextmanager
+    def _student_lock(self, student_id):
+        """同一学生的任务跨进程串行执行，保证最后提交的版本生效"""
+        lock_dir = os.path.join(self.app.config['SUBMIT_SPOOL_DIR'], '.locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        name = hashlib.sha1(str(student_id).encode()).hexdigest()
+        with open(os.path.join(lock_dir, f"{name}.lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _run(self, job, handler):
+        # 数据库状态后端也要 app context
+        try:
+            with self.app.app_context(), self._student_lock(job.student_id):
+                current = self.get(job.id)
+                if current is None or current.state != QUEUED:
+                    return
+                if (self.app.config['SUBMIT_DEDUPE']
+                        and self.state.read(LATEST_PREFIX + str(job.student_id)) != job.id):
+                    # 排队期间有了更新的提交（可能在其它 worker 上）
+                    job.state = SUPERSEDED
+                    job.finished_at = time.time()
+                    self._save(job)
+                    return
+                job.state = PROCESSING
+                job.started_at = time.time()
+                self._save(job)
+                try:
+                    with open(job.spool_path, 'rb') as f:
+                        job.timings = handler(job.student_id, f, StageTimer())
+                    job.state = DONE
+                except IngestError as e:
+                    job.error = e.to_dict()
+                    job.state = FAILED
+                except Exception as e:
+                    self.app.logger.exception("submission job %s failed", job.id)
+                    job.error = {"error": f"Internal error: {e.__class__.__name__}"}
+                    job.state = FAILED
+                finally:
+                    job.finished_at = time.time()
+                    self._save(job)
+        finally:
+            with self._lock:
+                self._active.pop(job.id, None)
+            _remove(job.spool_path)
+
+    def trim(self):
+        """距离上次淘汰超过 TRIM_INTERVAL 秒时，只保留最近结束的 FINISHED_JOBS_KEPT 条任务记录"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_trim < TRIM_INTERVAL:
+                return
+            self._last_trim = now
+        finished = sorted(
+            (data for data in self.state.scan(JOB_PREFIX).values() if data["state"] not in (QUEUED, PROCESSING)),
+            key=lambda data: data["finished_at"] or 0,
+        )
+        excess = len(finished) - FINISHED_JOBS_KEPT
+        if excess <= 0:
+            return
+        # job_latest 每个学生只有一条，不删：并发入队时可能刚指向新任务
+        for data in finished[:excess]:
+            self.state.delete(JOB_PREFIX + data["job_id"])
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+submission_queue = SubmissionQueue()
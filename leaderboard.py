@@ -0,0 +1,133 @@
+# leaderboard.py
+"""
+跨轮次的得分统计，全部在数据库里 GROUP BY 完成，不把 Rating 逐行读进 Python：
+    - 作品：每轮 total_score 平均分、评分数，第二轮相对第一轮的变化
+    - 评审人：每轮相对作品平均分的偏差（偏宽 > 0，偏严 < 0），以及两轮之间的漂移
+结果分页、可排序，一页只需一次查询（总数用窗口函数一并取回）。
+"""
+from sqlalchemy import and_, case, func, select
+
+from models import Rating, Student
+
+# 每页最多条数
+MAX_PER_PAGE = 200
+
+
+def total_score_expr():
+    # 与 app.total_score 相同：(1 - (P-1)/4) * P + ((P-1)/4) * I
+    P, I = Rating.professional_score, Rating.innovation_score
+    weight = (P - 1) / 4.0
+    return (1 - weight) * P + weight * I
+
+
+def _round_avg(expr, round_num):
+    return func.avg(case((Rating.round == round_num, expr)))
+
+
+def _round_count(round_num):
+    return func.count(case((Rating.round == round_num, 1)))
+
+
+def target_query(class_id=None):
+    score = total_score_expr()
+    avg1, avg2 = _round_avg(score, 1), _round_avg(score, 2)
+    columns = {
+        "student_id": Rating.target_id,
+        "name": func.max(Student.name),
+        "class_id": func.max(Student.class_id),
+        "group": func.max(Student.group),
+        "round1_avg": avg1,
+        "round1_ratings": _round_count(1),
+        "round2_avg": avg2,
+        "round2_ratings": _round_count(2),
+        "delta": avg2 - avg1,
+    }
+    query = (
+        select(*(col.label(name) for name, col in columns.items()))
+        .select_from(Rating)
+        .outerjoin(Student, Student.id == Rating.target_id)
+        .group_by(Rating.target_id)
+    )
+    if class_id is not None:
+        query = query.where(Rating.reviewer_class == class_id)
+    return query
+
+
+def reviewer_query(class_id=None):
+    score = total_score_expr()
+    # 每个作品每轮的平均分，评审人的偏差 = 自己给的分 - 作品平均分
+    consensus = (
+        select(Rating.target_id, Rating.round, func.avg(score).label("avg"))
+        .group_by(Rating.target_id, Rating.round)
+        .subquery()
+    )
+    bias = score - consensus.c.avg
+    bias1, bias2 = _round_avg(bias, 1), _round_avg(bias, 2)
+    columns = {
+        "reviewer_id": Rating.reviewer_id,
+        "name": func.max(Student.name),
+        "class_id": func.max(Rating.reviewer_class),
+        "group": func.max(Rating.reviewer_group),
+        "round1_given": _round_avg(score, 1),
+        "round1_bias": bias1,
+        "round1_ratings": _round_count(1),
+        "round2_given": _round_avg(score, 2),
+        "round2_bias": bias2,
+        "round2_ratings": _round_count(2),
+        "drift": bias2 - bias1,
+    }
+    query = (
+        select(*(col.label(name) for name, col in columns.items()))
+        .select_from(Rating)
+        .join(consensus, and_(consensus.c.target_id == Rating.target_id, consensus.c.round == Rating.round))
+        .outerjoin(Student, Student.id == Rating.reviewer_id)
+        .group_by(Rating.reviewer_id)
+    )
+    if class_id is not None:
+        query = query.where(Rating.reviewer_class == class_id)
+    return query
+
+
+TARGET_SORTS = ("round1_avg", "round2_avg", "delta", "round1_ratings", "round2_ratings", "student_id")
+REVIEWER_SORTS = ("drift", "round1_bias", "round2_bias", "round1_given", "round2_given", "reviewer_id")
+
+
+def clamp_page(page, per_page):
+    """页码至少为 1，每页条数限制在 1..MAX_PER_PAGE"""
+    return max(1, page), max(1, min(per_page, MAX_PER_PAGE))
+
+
+def paginate(session, query, sort, order, page, per_page, allowed):
+    """
+    按 sort 排序后取第 page 页（从 1 开始），返回 (rows, total)。
+    sort 不在 allowed 中时抛 ValueError。
+    """
+    if sort not in allowed:
+        raise ValueError(f"sort must be one of {', '.join(allowed)}")
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+    page, per_page = clamp_page(page, per_page)
+
+    inner = query.add_columns(func.count().over().label("_total")).subquery()
+    key = inner.c[sort]
+    key = key.desc() if order == 'desc' else key.asc()
+    # 只有一轮数据的行排在最后；同分按学号
+    tie = inner.c[allowed[-1]]
+    rows = session.execute(
+        select(inner).order_by(key.nulls_last(), tie).limit(per_page).offset((page - 1) * per_page)
+    ).mappings().all()
+    if rows:
+        total = rows[0]["_total"]
+    else:
+        # 超出最后一页时窗口函数取不到总数
+        total = session.execute(select(func.count()).select_from(query.subquery())).scalar()
+    return [_clean(row) for row in rows], total
+
+
+def _clean(row):
+    out = {}
+    for name, value in row.items():
+        if name == "_total":
+            continue
+        out[name] = round(value, 4) if isinstance(value, float) else value
+    return out
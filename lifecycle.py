@@ -0,0 +1,394 @@
+# lifecycle.py
+"""
+磁盘清理，供 cron 定期运行：
+    - 上传暂存目录（SUBMIT_SPOOL_DIR）中超过保留天数的压缩包；录制保存的压缩包（REQUEST_RECORD_UPLOADS）
+      默认一直保留，回放需要它们；过期的分块上传会话（uploads.py）
+    - 作品目录 static_pages/class_X/group_Y/<学号>：
+        学生已不在名单中，或没有提交记录                 → 删除
+        学生换了班级/组别，新位置还没有作品              → 搬到新位置（预览链接恢复可用）
+        学生换了班级/组别，新位置已经有新提交的作品      → 删除旧目录
+        整个班级都不在名单中（已结课）                   → 默认保留；LIFECYCLE_REMOVE_CLOSED_CLASSES 打开时
+                                                           先打包到 LIFECYCLE_ARCHIVE_DIR 再删除
+    - 解压中断遗留的 .staging- / .old- 目录和 .link- 临时链接，没有作品链接指向的 .v- 版本目录
+    - 最后回收不再被作品引用的 blob（blobstore.gc）
+最近 LIFECYCLE_GRACE_SECONDS 秒内改动过的目录不处理，避免与正在进行的提交竞争。
+名单为空时拒绝运行（刚 init_db.py --reset、DATABASE_URL 指错等情况下会把所有作品当成孤儿删掉）。
+
+不阻塞请求：数据库只在开始时读一次名单（随即结束读事务），之后只做文件操作；
+作品目录按 LIFECYCLE_BATCH_SIZE 分批处理，批间暂停 LIFECYCLE_BATCH_PAUSE_MS 毫秒，
+单次运行超过 LIFECYCLE_MAX_SECONDS 秒就停下，处理到的位置存在共享状态里，下次从那里继续。
+
+作品文件是指向 blob 的硬链接，只有硬链接数为 1 的文件删除后才真正释放空间和 inode，
+其余的在 blob 回收时释放（计入报告的 blobs 部分）。--dry-run 只统计不删除，
+此时 blob 回收的估算不包含本次将要删除的作品所引用的 blob。
+
+用法：
+    python lifecycle.py run [--dry-run] [--max-seconds N]
+    python lifecycle.py archive <班级> [--dry-run]    把一个已结课班级的作品打包后删除
+"""
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import time
+from datetime import datetime
+
+from ingest import LINK_MARK, version_owner
+from models import db, Project, Student
+from state import shared_state
+from uploads import chunked_uploads
+
+# 共享状态中保存上次处理到的作品目录（相对 STATIC_PAGES_DIR 的路径）
+LIFECYCLE_CURSOR = 'lifecycle_cursor'
+
+CLASS_DIR = re.compile(r'^class_(\d+)$')
+GROUP_DIR = re.compile(r'^group_(\d+)$')
+
+
+class EmptyRoster(Exception):
+    pass
+
+
+class Report:
+    def __init__(self, dry_run):
+        self.dry_run = dry_run
+        self.uploads = {"removed": 0, "bytes": 0, "sessions": 0}
+        self.trees = {"scanned": 0, "removed": 0, "relocated": 0, "leftovers": 0, "skipped_recent": 0,
+                      "closed_classes_kept": 0}
+        self.archives = []
+        self.bytes_freed = 0
+        self.inodes_freed = 0
+        self.shared_links = 0   # 删除的硬链接中 blob 还在的，空间在 blob 回收时释放
+        self.blobs = None
+        self.complete = False
+
+    def free(self, size, inodes=1):
+        self.bytes_freed += size
+        self.inodes_freed += inodes
+
+    def to_dict(self):
+        return {
+            "dry_run": self.dry_run,
+            "complete": self.complete,
+            "uploads": self.uploads,
+            "trees": self.trees,
+            "archives": self.archives,
+            "bytes_freed": self.bytes_freed,
+            "inodes_freed": self.inodes_freed,
+            "shared_links": self.shared_links,
+            "blobs": self.blobs,
+        }
+
+
+def link_target(path):
+    """作品目录是指向版本目录的符号链接时返回版本目录的路径，否则返回 None"""
+    if not os.path.islink(path):
+        return None
+    return os.path.join(os.path.dirname(path), os.readlink(path))
+
+
+def remove_tree(path, report, dry_run):
+    """删除目录树，按硬链接数统计真正释放的字节和 inode；作品链接连同它指向的版本目录一起删除"""
+    target = link_target(path)
+    if target is not None:
+        remove_tree(target, report, dry_run)
+        report.free(0)  # 链接本身
+        if not dry_run:
+            _remove(path)
+        return
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(full)
+            except FileNotFoundError:
+                continue
+            if st.st_nlink > 1:
+                report.shared_links += 1
+            else:
+                report.free(st.st_size)
+            if not dry_run:
+                _remove(full)
+        report.free(0)  # 目录本身
+    if not dry_run:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def expire_uploads(directory, retention_days, report, dry_run):
+    if not retention_days or not directory or not os.path.isdir(directory):
+        return
+    cutoff = time.time() - retention_days * 86400
+    for entry in os.scandir(directory):
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        st = entry.stat(follow_symlinks=False)
+        if st.st_mtime >= cutoff:
+            continue
+        report.uploads["removed"] += 1
+        report.uploads["bytes"] += st.st_size
+        report.free(st.st_size)
+        if not dry_run:
+            _remove(entry.path)
+
+
+def load_roster():
+    """学号 -> (班级, 组别, 是否已提交)，读完立即结束读事务"""
+    rows = (
+        db.session.query(Student.id, Student.class_id, Student.group, Project.submitted)
+        .outerjoin(Project, Project.student_id == Student.id)
+        .all()
+    )
+    db.session.rollback()
+    return {sid: (class_id, group, bool(submitted)) for sid, class_id, group, submitted in rows}
+
+
+def list_units(static_dir, active_classes):
+    """
+    按路径排序列出要检查的单元：不在名单中的班级整个作为一个单元（'class_X'），
+    其余为各作品目录和遗留的暂存目录（'class_X/group_Y/<名字>'）。
+    """
+    units = []
+    if not os.path.isdir(static_dir):
+        return units
+    for class_name in os.listdir(static_dir):
+        match = CLASS_DIR.match(class_name)
+        if not match:
+            continue
+        if int(match.group(1)) not in active_classes:
+            units.append(class_name)
+            continue
+        class_path = os.path.join(static_dir, class_name)
+        if not os.path.isdir(class_path):
+            continue
+        for group_name in os.listdir(class_path):
+            group_path = os.path.join(class_path, group_name)
+            if not GROUP_DIR.match(group_name) or not os.path.isdir(group_path):
+                continue
+            for name in os.listdir(group_path):
+                units.append(f"{class_name}/{group_name}/{name}")
+    units.sort()
+    return units
+
+
+def is_leftover(name):
+    # ingest.make_staging_dir / swap_into_place 的命名
+    return (name.startswith('.') and ('.staging-' in name or LINK_MARK in name)) or '.old-' in name
+
+
+def is_live_version(group_path, name):
+    """name 是否为某个作品链接当前指向的版本目录"""
+    owner = version_owner(name)
+    if owner is None:
+        return False
+    link = os.path.join(group_path, owner)
+    return os.path.islink(link) and os.readlink(link) == name
+
+
+def move_tree(path, dest):
+    """
+    把作品目录搬到 dest；作品链接连同版本目录一起搬，dest 已存在时抛 OSError。
+    链接不能用 rename 搬：rename 会直接覆盖 dest 处学生新提交的链接。
+    """
+    target = link_target(path)
+    if target is None:
+        os.rename(path, dest)
+        return
+    version = os.path.basename(target)
+    moved = os.path.join(os.path.dirname(dest), version)
+    os.rename(target, moved)
+    try:
+        os.symlink(version, dest)
+    except OSError:
+        os.rename(moved, target)
+        raise
+    _remove(path)
+
+
+class LifecycleManager:
+    def __init__(self, app, blob_store=None):
+        self.app = app
+        self.blob_store = blob_store
+        config = app.config
+        self.static_dir = config['STATIC_PAGES_DIR']
+        self.grace = config['LIFECYCLE_GRACE_SECONDS']
+        self.batch_size = config['LIFECYCLE_BATCH_SIZE']
+        self.pause = config['LIFECYCLE_BATCH_PAUSE_MS'] / 1000
+        self.archive_dir = config['LIFECYCLE_ARCHIVE_DIR']
+        self.remove_closed_classes = config['LIFECYCLE_REMOVE_CLOSED_CLASSES']
+
+    def run(self, dry_run=False, max_seconds=None):
+        """执行一轮清理（需要 app context），返回报告；名单为空时抛 EmptyRoster，什么都不做"""
+        config = self.app.config
+        if max_seconds is None:
+            max_seconds = config['LIFECYCLE_MAX_SECONDS']
+        roster = load_roster()
+        if not roster:
+            raise EmptyRoster(f"no students in {config['SQLALCHEMY_DATABASE_URI']}, refusing to clean up")
+        report = Report(dry_run)
+        started = time.monotonic()
+
+        expire_uploads(config.get('SUBMIT_SPOOL_DIR'), config['LIFECYCLE_UPLOAD_RETENTION_DAYS'], report, dry_run)
+        expire_uploads(config.get('REQUEST_RECORD_UPLOADS'), config['LIFECYCLE_RECORD_RETENTION_DAYS'],
+                       report, dry_run)
+        # 过期的分块上传会话（平时在开始新上传时顺带清理，没有新上传时靠这里）
+        if chunked_uploads.app is not None:
+            sessions = chunked_uploads.expire(dry_run=dry_run)
+            report.uploads["sessions"] = sessions["removed"]
+            report.uploads["bytes"] += sessions["bytes"]
+            report.free(sessions["bytes"], sessions["inodes"])
+
+        active_classes = {class_id for class_id, _, _ in roster.values()}
+        cursor = shared_state.get(LIFECYCLE_CURSOR) or ''
+        units = [u for u in list_units(self.static_dir, active_classes) if u > cursor]
+
+        for i in range(0, len(units), self.batch_size):
+            for unit in units[i:i + self.batch_size]:
+                self.check_unit(unit, roster, report)
+            last = units[min(i + self.batch_size, len(units)) - 1]
+            if not dry_run:
+                shared_state.set(LIFECYCLE_CURSOR, last)
+            if max_seconds and time.monotonic() - started > max_seconds:
+                break
+            time.sleep(self.pause)
+        else:
+            # 整个目录都检查完了，下次从头开始，并回收不再引用的 blob
+            report.complete = True
+            if not dry_run:
+                shared_state.set(LIFECYCLE_CURSOR, '')
+                self.prune_empty_dirs()
+            if self.blob_store is not None:
+                report.blobs = self.blob_store.gc(dry_run=dry_run)
+        return report
+
+    def check_unit(self, unit, roster, report):
+        path = os.path.join(self.static_dir, *unit.split('/'))
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return
+        if time.time() - st.st_mtime < self.grace:
+            report.trees["skipped_recent"] += 1
+            return
+        report.trees["scanned"] += 1
+
+        parts = unit.split('/')
+        if len(parts) == 1:
+            # 整个班级都不在名单中：默认保留；打开时先归档，归档失败（抛异常）就不删除
+            if not self.remove_closed_classes:
+                report.trees["closed_classes_kept"] += 1
+                return
+            report.archives.append(archive_tree(path, self.archive_dir, parts[0], report.dry_run))
+            remove_tree(path, report, report.dry_run)
+            report.trees["removed"] += 1
+            return
+
+        class_name, group_name, name = parts
+        if version_owner(name) is not None:
+            # 版本目录随作品链接一起处理，没有链接指向的是发布中断或并发发布留下的
+            if not is_live_version(os.path.dirname(path), name):
+                remove_tree(path, report, report.dry_run)
+                report.trees["leftovers"] += 1
+            return
+        if is_leftover(name):
+            remove_tree(path, report, report.dry_run)
+            report.trees["leftovers"] += 1
+            return
+
+        student = roster.get(name)
+        if student is None or not student[2]:
+            remove_tree(path, report, report.dry_run)
+            report.trees["removed"] += 1
+            return
+        class_id, group, _ = student
+        if (class_name, group_name) == (f"class_{class_id}", f"group_{group}"):
+            return
+        current = os.path.join(self.static_dir, f"class_{class_id}", f"group_{group}", name)
+        if os.path.lexists(current):
+            remove_tree(path, report, report.dry_run)
+            report.trees["removed"] += 1
+            return
+        report.trees["relocated"] += 1
+        if not report.dry_run:
+            os.makedirs(os.path.dirname(current), exist_ok=True)
+            try:
+                move_tree(path, current)
+            except OSError:
+                # 搬运期间学生在新位置提交了作品，保留新作品
+                report.trees["relocated"] -= 1
+                report.trees["removed"] += 1
+                remove_tree(path, report, False)
+
+    def prune_empty_dirs(self):
+        for class_name in os.listdir(self.static_dir):
+            class_path = os.path.join(self.static_dir, class_name)
+            if not CLASS_DIR.match(class_name) or not os.path.isdir(class_path):
+                continue
+            for group_name in os.listdir(class_path):
+                _rmdir(os.path.join(class_path, group_name))
+            _rmdir(class_path)
+
+
+def archive_tree(path, archive_dir, name, dry_run):
+    """打包成 <归档目录>/<名字>-<日期>.tar.gz；同一作品里的硬链接在包内仍是硬链接"""
+    target = os.path.join(archive_dir, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.tar.gz")
+    if dry_run:
+        return {"path": target, "bytes": None}
+    os.makedirs(archive_dir, exist_ok=True)
+    tmp = f"{target}.tmp"
+    with tarfile.open(tmp, 'w:gz') as tar:
+        tar.add(path, arcname=name)
+    os.replace(tmp, target)
+    return {"path": target, "bytes": os.path.getsize(target)}
+
+
+def archive_class(app, class_id, dry_run=False):
+    """把一个已结课班级的作品打包后删除，不管它是否还在名单中"""
+    archive_dir = app.config['LIFECYCLE_ARCHIVE_DIR']
+    name = f"class_{class_id}"
+    path = os.path.join(app.config['STATIC_PAGES_DIR'], name)
+    report = Report(dry_run)
+    if os.path.isdir(path):
+        report.archives.append(archive_tree(path, archive_dir, name, dry_run))
+        remove_tree(path, report, dry_run)
+        report.trees["removed"] += 1
+    report.complete = True
+    return report
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _rmdir(path):
+    try:
+        os.rmdir(path)
+    except OSError:  # 非空或已不存在
+        pass
+
+
+if __name__ == '__main__':
+    from app import app, blob_store
+
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    with app.app_context():
+        if args and args[0] == 'run':
+            max_seconds = None
+            if '--max-seconds' in args:
+                max_seconds = float(args[args.index('--max-seconds') + 1])
+            try:
+                result = LifecycleManager(app, blob_store).run(dry_run=dry_run, max_seconds=max_seconds)
+            except EmptyRoster as e:
+                print(f"error: {e}", file=sys.stderr)
+                sys.exit(2)
+        elif len(args) > 1 and args[0] == 'archive':
+            result = archive_class(app, int(args[1]), dry_run=dry_run)
+        else:
+            print(__doc__)
+            sys.exit(1)
+    print(json.dumps(result.to_dict(), ensure_ascii=False, indent=2))
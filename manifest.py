@@ -0,0 +1,142 @@
+# manifest.py
+"""
+作品清单：解压时记录每个文件的路径、大小、sha256，并检测入口页面，
+保存在 submission_file 表和 Project.entry_page / total_bytes / file_count 中。
+展示接口直接从数据库取入口页面和大小，不需要访问作品目录。
+
+用法：
+    python manifest.py backfill          为清单功能上线前的已提交作品补建清单（扫描一次作品目录）
+    python manifest.py search <路径或sha256>
+"""
+import hashlib
+import os
+import posixpath
+import sys
+from urllib.parse import quote
+
+from sqlalchemy import delete, insert, update
+
+from models import db, Project, Student, SubmissionFile
+
+DEFAULT_ENTRY_PAGE = 'index.html'
+
+# 单个 IN / 插入批次的大小，避免超过 SQLite 参数上限
+CHUNK = 500
+
+
+def detect_entry_page(paths):
+    """
+    入口页面：最浅的 index.html（或 index.htm），没有时取最浅的 .html 文件；
+    同深度按路径排序。学生常把网页放在压缩包里的一个文件夹中，所以不能只看根目录。
+    """
+    html = [p for p in paths if p.lower().endswith(('.html', '.htm'))]
+    if not html:
+        return None
+    index = [p for p in html if posixpath.basename(p).lower() in ('index.html', 'index.htm')]
+    candidates = index or html
+    return min(candidates, key=lambda p: (p.count('/'), p))
+
+
+class Manifest:
+    def __init__(self):
+        self.files = {}   # 路径 -> (大小, sha256)，同名文件后者覆盖前者
+
+    def add(self, path, size, digest):
+        self.files[path] = (size, digest)
+
+    @property
+    def total_bytes(self):
+        return sum(size for size, _ in self.files.values())
+
+    @property
+    def entry_page(self):
+        return detect_entry_page(self.files)
+
+    def to_dict(self):
+        return {
+            "entry_page": self.entry_page,
+            "total_bytes": self.total_bytes,
+            "file_count": len(self.files),
+        }
+
+
+def replace_files(student_id, manifest):
+    """在调用方的事务中替换学生的文件清单，不提交"""
+    db.session.execute(delete(SubmissionFile).where(SubmissionFile.student_id == student_id))
+    rows = [
+        {"student_id": student_id, "path": path, "size": size, "sha256": digest}
+        for path, (size, digest) in sorted(manifest.files.items())
+    ]
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(insert(SubmissionFile), rows[i:i + CHUNK])
+
+
+def save_manifest(student_id, manifest):
+    """替换文件清单并更新 Project 上的汇总字段，不提交"""
+    replace_files(student_id, manifest)
+    db.session.execute(
+        update(Project).where(Project.student_id == student_id).values(**manifest.to_dict())
+    )
+
+
+def preview_path(class_id, group, student_id, entry_page):
+    # 入口页面来自压缩包里的文件名，可能含空格、#、? 或中文，转义后才能直接用作 URL（保留 /）
+    return f"/static/static_pages/class_{class_id}/group_{group}/{student_id}/{quote(entry_page or DEFAULT_ENTRY_PAGE)}"
+
+
+def search(term):
+    """按 sha256（64 位十六进制）或路径（含 % 时按 LIKE，否则匹配路径或文件名）查找作品"""
+    query = db.session.query(SubmissionFile.student_id, SubmissionFile.path, SubmissionFile.size)
+    if len(term) == 64 and all(c in '0123456789abcdef' for c in term.lower()):
+        query = query.filter(SubmissionFile.sha256 == term.lower())
+    elif '%' in term:
+        query = query.filter(SubmissionFile.path.like(term))
+    else:
+        query = query.filter((SubmissionFile.path == term) | SubmissionFile.path.like(f"%/{term}"))
+    return query.order_by(SubmissionFile.student_id, SubmissionFile.path).all()
+
+
+def manifest_from_dir(root):
+    manifest = Manifest()
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            hasher = hashlib.sha256()
+            with open(full, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    hasher.update(chunk)
+            rel = os.path.relpath(full, root).replace(os.sep, '/')
+            manifest.add(rel, os.path.getsize(full), hasher.hexdigest())
+    return manifest
+
+
+def backfill(static_dir):
+    """为已提交但还没有清单的作品扫描目录补建清单，返回补建的数量"""
+    missing = (
+        db.session.query(Project.student_id, Student.class_id, Student.group)
+        .join(Student, Student.id == Project.student_id)
+        .filter(Project.submitted == True, Project.entry_page.is_(None))
+        .all()
+    )
+    done = 0
+    for student_id, class_id, group in missing:
+        root = os.path.join(static_dir, f"class_{class_id}", f"group_{group}", str(student_id))
+        if not os.path.isdir(root):
+            continue
+        save_manifest(student_id, manifest_from_dir(root))
+        db.session.commit()
+        done += 1
+    return done
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        if len(sys.argv) > 1 and sys.argv[1] == 'backfill':
+            print(f"backfilled {backfill(app.config['STATIC_PAGES_DIR'])} submissions")
+        elif len(sys.argv) > 2 and sys.argv[1] == 'search':
+            for student_id, path, size in search(sys.argv[2]):
+                print(f"{student_id}\t{path}\t{size}")
+        else:
+            print(__doc__)
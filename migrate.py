@@ -0,0 +1,103 @@
+# migrate.py
+"""
+轻量级数据库迁移：按顺序执行尚未执行过的迁移，记录在 schema_migrations 表中。
+与 init_db.py 不同，不会删除任何已有数据。
+
+用法：
+    python migrate.py            执行所有未执行的迁移
+    python migrate.py --status   查看迁移状态
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, Project, Rating
+
+MIGRATIONS_TABLE = 'schema_migrations'
+
+
+def create_missing_tables(conn):
+    # create_all 只会创建不存在的表（连同它们的索引）
+    db.metadata.create_all(conn)
+
+
+def add_rating_indexes(conn):
+    # 唯一索引建立前先清理重复评分，保留最后一条（与分析接口“后者生效”一致）
+    conn.execute(text(
+        "DELETE FROM rating WHERE id NOT IN ("
+        " SELECT MAX(id) FROM rating GROUP BY reviewer_id, round, target_id)"
+    ))
+    for index in Rating.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def create_rating_indexes(conn):
+    for index in Rating.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def add_project_manifest(conn):
+    # SQLite 只能逐列 ADD COLUMN；已有的作品入口页面为空，用 manifest.py backfill 补建
+    existing = {col['name'] for col in inspect(conn).get_columns('project')}
+    for name in ('entry_page', 'total_bytes', 'file_count'):
+        if name not in existing:
+            column = Project.__table__.c[name]
+            conn.execute(text(f"ALTER TABLE project ADD COLUMN {name} {column.type.compile(conn.dialect)}"))
+    create_missing_tables(conn)
+
+
+# (版本号, 说明, 函数)，只能在末尾追加
+MIGRATIONS = [
+    ('0001', 'create missing tables', create_missing_tables),
+    ('0002', 'rating composite indexes and unique (reviewer_id, round, target_id)', add_rating_indexes),
+    ('0003', 'app_state table for shared round state', create_missing_tables),
+    ('0004', 'rating (target_id, round) covering index for leaderboard', create_rating_indexes),
+    ('0005', 'project manifest columns and submission_file table', add_project_manifest),
+]
+
+
+def applied_versions(conn):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        " version VARCHAR(20) PRIMARY KEY, description VARCHAR(200), applied_at DATETIME)"
+    ))
+    return {row[0] for row in conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+
+def migrate(engine):
+    """执行未执行过的迁移，每个迁移一个事务，返回本次执行的版本号"""
+    done = []
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    for version, description, func in MIGRATIONS:
+        if version in applied:
+            continue
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text(f"INSERT INTO {MIGRATIONS_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.now()},
+            )
+        done.append(version)
+    return done
+
+
+def status(engine):
+    with engine.begin() as conn:
+        applied = applied_versions(conn)
+    return [(version, description, version in applied) for version, description, _ in MIGRATIONS]
+
+
+if __name__ == '__main__':
+    from app import app
+
+    with app.app_context():
+        engine = db.engine
+        if '--status' in sys.argv:
+            for version, description, applied in status(engine):
+                print(f"{version} [{'x' if applied else ' '}] {description}")
+        else:
+            done = migrate(engine)
+            print(f"applied: {', '.join(done)}" if done else "database is up to date")
+            print("rating indexes:", [ix['name'] for ix in inspect(engine).get_indexes('rating')])
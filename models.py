@@ -1,6 +1,6 @@
 # models.py
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -26,6 +26,9 @@ class Project(db.Model):
     student_id = Column(String(20), ForeignKey('student.id'), primary_key=True)
     submitted = Column(Boolean, default=False)     # 是否已提交作品
     submitted_at = Column(DateTime) # 最近提交时间戳
+    entry_page = Column(String(255))  # 入口页面（相对作品目录），解压时检测
+    total_bytes = Column(Integer)  # 解压后总字节数
+    file_count = Column(Integer)  # 文件个数
     student = relationship("Student", back_populates="project")  # 对应的学生对象
 
 class GroupAssignment(db.Model):
@@ -55,5 +58,59 @@ class Rating(db.Model):
     timestamp = db.Column(DateTime, default=datetime.now)  # 评分时间戳
     round = Column(Integer, nullable=False)  # 评分轮次
     reviewer = relationship("Student", back_populates="ratings_given", foreign_keys=[reviewer_id])  # 评审者对象
+    __table_args__ = (
+        # 同一评审人同一轮对同一作品只能有一条评分；前缀 (reviewer_id, round) 用于重复提交检查和 max(round)
+        Index('uq_rating_reviewer_round_target', 'reviewer_id', 'round', 'target_id', unique=True),
+        # 分析接口按轮次、班级、小组取评分
+        Index('ix_rating_round_class_group', 'round', 'reviewer_class', 'reviewer_group'),
+        # 跨轮次排行榜按作品、轮次聚合，带上分数列使聚合只读索引
+        Index('ix_rating_target_round', 'target_id', 'round', 'professional_score', 'innovation_score'),
+    )
     def __repr__(self):
-        return f"<Rating reviewer_id={self.reviewer_id}, target={self.target_class}-{self.target_group_id}, round={self.round}, scores=({self.innovation_score}, {self.professional_score})>"
\ No newline at end of file
+        return f"<Rating reviewer_id={self.reviewer_id}, target={self.target_class}-{self.target_group_id}, round={self.round}, scores=({self.innovation_score}, {self.professional_score})>"
+
+class ReviewAssignment(db.Model):
+    '''
+    每轮开始时预先生成的评审目标：某班某评审小组要评的第 position 份作品
+    '''
+    __tablename__ = 'review_assignment'
+    round = Column(Integer, primary_key=True)  # 评分轮次
+    class_id = Column(Integer, primary_key=True)  # 班级ID
+    reviewer_group = Column(Integer, primary_key=True)  # 评审组别
+    position = Column(Integer, primary_key=True)  # 在目标列表中的顺序
+    assigned_group = Column(Integer, nullable=False)  # GroupAssignment 指定的被评组别
+    target_id = Column(String(20), nullable=False)  # 被评作品的学生ID
+    target_group = Column(Integer, nullable=False)  # 被评学生实际所在组别（补齐的作品来自其它组）
+
+    def __repr__(self):
+        return f"<ReviewAssignment round={self.round} C{self.class_id} G{self.reviewer_group}#{self.position}→{self.target_id}>"
+
+class AppState(db.Model):
+    '''
+    跨进程共享的运行状态（轮次开关、截止时间等），值为 JSON 文本
+    '''
+    __tablename__ = 'app_state'
+    key = Column(String(100), primary_key=True)  # 状态名
+    value = Column(db.Text, nullable=False)  # JSON 编码的值
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # 最近修改时间
+
+    def __repr__(self):
+        return f"<AppState {self.key}={self.value}>"
+
+class SubmissionFile(db.Model):
+    '''
+    作品清单：每次提交解压出的每个文件，提交时整体替换
+    '''
+    __tablename__ = 'submission_file'
+    student_id = Column(String(20), ForeignKey('project.student_id'), primary_key=True)  # 作品所属学生
+    path = Column(String(500), primary_key=True)  # 相对作品目录的路径
+    size = Column(Integer, nullable=False)  # 字节数
+    sha256 = Column(String(64), nullable=False)  # 内容哈希
+    __table_args__ = (
+        # 按路径或内容查哪些作品包含某个文件
+        Index('ix_submission_file_path', 'path'),
+        Index('ix_submission_file_sha256', 'sha256'),
+    )
+
+    def __repr__(self):
+        return f"<SubmissionFile {self.student_id}:{self.path} {self.size}B>"
@@ -0,0 +1,81 @@
+# preview.py
+"""
+作品预览文件服务：按 Accept-Encoding 选择预压缩副本，内容哈希 ETag，If-None-Match 返回 304。
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from flask import Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+from blobstore import VARIANT_ENCODINGS
+
+# (st_dev, st_ino, st_size, st_mtime_ns) -> sha256，文件内容不变就不用重新计算
+DIGEST_CACHE_SIZE = 20000
+_digest_cache = OrderedDict()
+_digest_lock = threading.Lock()
+
+
+def file_digest(path, st):
+    key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        digest = _digest_cache.get(key)
+        if digest is not None:
+            _digest_cache.move_to_end(key)
+            return digest
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+    with _digest_lock:
+        _digest_cache[key] = digest
+        if len(_digest_cache) > DIGEST_CACHE_SIZE:
+            _digest_cache.popitem(last=False)
+    return digest
+
+
+def choose_encoding(blob_store, digest):
+    """返回客户端可接受且已生成的压缩副本 (encoding, path)，没有则 (None, None)"""
+    accepted = request.accept_encodings
+    for encoding in VARIANT_ENCODINGS:
+        if accepted[encoding] <= 0:
+            continue
+        path = blob_store.variant_path(digest, encoding)
+        if os.path.exists(path):
+            return encoding, path
+    return None, None
+
+
+def send_preview(root, filename, blob_store, max_age):
+    path = safe_join(root, filename)
+    if path is None:
+        abort(404)
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        abort(404)
+    if not os.path.isfile(path):
+        abort(404)
+
+    digest = file_digest(path, st)
+    encoding, variant = choose_encoding(blob_store, digest)
+    # 不同编码是不同的表示，强 ETag 需要区分
+    etag = digest if encoding is None else f"{digest}-{encoding}"
+
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        resp = send_file(variant or path, mimetype=mimetype, conditional=False, etag=False)
+        if encoding is not None:
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(etag)
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.cache_control.public = True
+    resp.cache_control.max_age = max_age
+    resp.cache_control.no_cache = True if max_age == 0 else None
+    return resp
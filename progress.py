@@ -0,0 +1,204 @@
+# progress.py
+"""
+提交与评分进度，供老师端 SSE 实时查看。
+计数放在内存中，submit_work / rate_round 提交后 O(1) 更新并广播给所有监听者；
+监听者连上时先收到一份完整快照，之后只收增量事件，不会因为事件去查库。
+多个 worker 时每个进程只看到自己处理的写入，所以每隔 PROGRESS_RESYNC_SECONDS 秒
+从数据库重新加载一次（同一进程所有监听者共用），并推送新的快照。
+"""
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import func
+
+from models import db, Project, Rating, Student
+
+ROUNDS = (1, 2)
+
+# 每个监听者最多积压的事件数，超过说明客户端已经断开或太慢，直接断开它
+LISTENER_QUEUE_SIZE = 256
+
+
+class ProgressTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._listeners = set()
+        self.loaded_at = None
+
+    # ---------------- 加载 ----------------
+
+    def load(self):
+        """从数据库重建全部计数，需要 app context"""
+        members = defaultdict(int)              # (班级, 组) -> 人数
+        for class_id, group, n in (
+            db.session.query(Student.class_id, Student.group, func.count())
+            .group_by(Student.class_id, Student.group)
+        ):
+            members[(class_id, group)] = n
+        submitted = defaultdict(set)            # (班级, 组) -> 已提交学号
+        for student_id, class_id, group in (
+            db.session.query(Student.id, Student.class_id, Student.group)
+            .join(Project, Project.student_id == Student.id)
+            .filter(Project.submitted == True)
+        ):
+            submitted[(class_id, group)].add(student_id)
+        finished = defaultdict(set)             # (轮次, 班级, 组) -> 已评完的评审人
+        for round_num, reviewer_id, class_id, group in (
+            db.session.query(Rating.round, Rating.reviewer_id, Rating.reviewer_class, Rating.reviewer_group)
+            .distinct()
+        ):
+            finished[(round_num, class_id, group)].add(reviewer_id)
+
+        with self._lock:
+            self.members = members
+            self.submitted = submitted
+            self.finished = finished
+            self.class_submitted = defaultdict(int)
+            for (class_id, _), ids in submitted.items():
+                self.class_submitted[class_id] += len(ids)
+            self.pending = defaultdict(set)     # (轮次, 班级) -> 还没评完的组
+            for (class_id, group), n in members.items():
+                for round_num in ROUNDS:
+                    if len(finished[(round_num, class_id, group)]) < n:
+                        self.pending[(round_num, class_id)].add(group)
+            self.loaded_at = time.monotonic()
+        # SSE 是长连接，不要一直占着读事务
+        db.session.rollback()
+
+    def ensure_loaded(self, max_age=None):
+        """还没加载过，或距离上次加载超过 max_age 秒时重新加载；返回是否重新加载了"""
+        def fresh():
+            return self.loaded_at is not None and (max_age is None or time.monotonic() - self.loaded_at < max_age)
+
+        if fresh():
+            return False
+        # 多个监听者同时到期时只加载一次
+        with self._load_lock:
+            if fresh():
+                return False
+            self.load()
+            return True
+
+    def reset(self):
+        # 名单变了，下次使用时重新加载
+        self.loaded_at = None
+
+    # ---------------- 写入时更新 ----------------
+
+    def record_submission(self, class_id, group, student_id):
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            ids = self.submitted[(class_id, group)]
+            if student_id in ids:
+                return
+            ids.add(student_id)
+            self.class_submitted[class_id] += 1
+            event = {
+                "class_id": class_id,
+                "group": group,
+                "student_id": student_id,
+                "group_submitted": len(ids),
+                "class_submitted": self.class_submitted[class_id],
+            }
+        self.publish('submission', event)
+
+    def record_rating(self, round_num, class_id, group, reviewer_id):
+        if self.loaded_at is None:
+            return
+        with self._lock:
+            ids = self.finished[(round_num, class_id, group)]
+            if reviewer_id in ids:
+                return
+            ids.add(reviewer_id)
+            pending = self.pending[(round_num, class_id)]
+            if len(ids) >= self.members.get((class_id, group), 0):
+                pending.discard(group)
+            event = {
+                "round": round_num,
+                "class_id": class_id,
+                "group": group,
+                "reviewer_id": reviewer_id,
+                "finished": len(ids),
+                "members": self.members.get((class_id, group), 0),
+                "pending_groups": sorted(pending),
+            }
+        self.publish('rating', event)
+
+    # ---------------- 快照与广播 ----------------
+
+    def snapshot(self):
+        with self._lock:
+            classes = {}
+            for (class_id, group), n in sorted(self.members.items()):
+                cls = classes.setdefault(str(class_id), {
+                    "students": 0,
+                    "submitted": self.class_submitted.get(class_id, 0),
+                    "groups": {},
+                    "pending_groups": {
+                        str(r): sorted(self.pending.get((r, class_id), ())) for r in ROUNDS
+                    },
+                })
+                cls["students"] += n
+                cls["groups"][str(group)] = {
+                    "members": n,
+                    "submitted": len(self.submitted.get((class_id, group), ())),
+                    "finished": {str(r): len(self.finished.get((r, class_id, group), ())) for r in ROUNDS},
+                }
+            return {"classes": classes}
+
+    def listen(self):
+        listener = queue.Queue(LISTENER_QUEUE_SIZE)
+        with self._lock:
+            self._listeners.add(listener)
+        return listener
+
+    def unlisten(self, listener):
+        with self._lock:
+            self._listeners.discard(listener)
+
+    def publish(self, kind, data):
+        message = format_event(kind, data)
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.put_nowait(message)
+            except queue.Full:
+                self.unlisten(listener)
+
+    def is_listening(self, listener):
+        return listener in self._listeners
+
+    def listener_count(self):
+        return len(self._listeners)
+
+
+def format_event(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def event_stream(tracker, listener, keepalive, resync):
+    """SSE 响应体：先发快照，之后转发增量事件，空闲时发注释行保活"""
+    try:
+        yield format_event('snapshot', tracker.snapshot())
+        while True:
+            try:
+                yield listener.get(timeout=keepalive)
+            except queue.Empty:
+                if not tracker.is_listening(listener):
+                    # 积压过多被断开
+                    return
+                if tracker.ensure_loaded(max_age=resync):
+                    tracker.publish('snapshot', tracker.snapshot())
+                else:
+                    yield ": keepalive\n\n"
+    finally:
+        tracker.unlisten(listener)
+
+
+progress_tracker = ProgressTracker()
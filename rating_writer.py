@@ -0,0 +1,95 @@
+# rating_writer.py
+"""
+评分的合并提交（group commit）。
+并发的 rate_round 请求把各自的评分行交给后台线程，线程把一段时间内到达的请求
+合并成一个事务插入，每个请求仍然同步等待自己的结果：成功返回，重复评分抛 IntegrityError。
+合并的事务失败时（通常是某个请求重复提交）逐个请求单独重试，不影响其它请求。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from models import Rating
+
+
+class RatingWriter:
+    def __init__(self, engine, max_batch=64, max_wait=0.005):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='rating-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, rows, timeout=30):
+        """阻塞到这批评分写入完成；重复评分时抛 IntegrityError"""
+        self.start()
+        future = Future()
+        self._queue.put((rows, future))
+        return future.result(timeout)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write(batch)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _write(self, batch):
+        rows = [row for item_rows, _ in batch for row in item_rows]
+        try:
+            with self.engine.begin() as conn:
+                if rows:
+                    conn.execute(insert(Rating), rows)
+        except IntegrityError:
+            # 有请求重复提交，逐个重试找出是谁
+            for item_rows, future in batch:
+                try:
+                    with self.engine.begin() as conn:
+                        if item_rows:
+                            conn.execute(insert(Rating), item_rows)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(len(item_rows))
+            self.batches += len(batch)
+        else:
+            for item_rows, future in batch:
+                future.set_result(len(item_rows))
+            self.batches += 1
+        self.requests += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch": round(self.requests / self.batches, 2) if self.batches else None,
+        }
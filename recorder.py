@@ -0,0 +1,172 @@
+# recorder.py
+"""
+请求录制：REQUEST_RECORD_PATH 设置后，每个请求追加一行 JSON，供 benchmarks/replay.py 回放。
+记录内容：时间、方法、路径、接口名、查询参数、会话中的学号、JSON 请求体、上传文件和分块的大小和 sha256、
+响应状态码和耗时、响应里服务端生成的 id（回放时据此改写后续请求路径中的 id），以及当时是否已过截止时间、当前轮次。
+不记录 cookie 和请求头；请求体中看起来像口令的字段替换为 "***"。
+REQUEST_RECORD_UPLOADS 设置后，上传的压缩包和分块按 sha256 另存一份，回放时原样重新上传。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from flask import g, request, session
+
+# 不录制的接口：长连接和监控
+SKIP_ENDPOINTS = {'progress_stream', 'metrics', 'metrics_profile', 'static'}
+
+# 请求体中需要隐去的字段
+SECRET_KEYS = ('password', 'passwd', 'secret', 'token')
+
+# JSON 请求体超过这个大小时只记录长度
+MAX_BODY_BYTES = 64 * 1024
+
+# 响应里由服务端生成、之后的请求路径会用到的 id
+RESPONSE_IDS = {
+    'start_upload': ('upload_id',),
+    'submit_work': ('job_id',),
+    'complete_upload': ('job_id',),
+}
+
+
+def sanitize(value):
+    if isinstance(value, dict):
+        return {
+            k: "***" if any(s in str(k).lower() for s in SECRET_KEYS) else sanitize(v)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [sanitize(v) for v in value]
+    return value
+
+
+def file_digest(storage):
+    """计算上传文件的 sha256 和大小，读完后把流指回开头"""
+    stream = storage.stream
+    hasher = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        size += len(chunk)
+    stream.seek(0)
+    return hasher.hexdigest(), size
+
+
+class RequestRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.path = None
+        self.uploads_dir = None
+        self.state_func = None
+
+    def init_app(self, app, state_func=None):
+        """state_func() 返回 {"deadline_passed": bool, "round": int}，随每条记录保存"""
+        app.config.setdefault('REQUEST_RECORD_PATH', None)
+        app.config.setdefault('REQUEST_RECORD_UPLOADS', None)
+        self.path = app.config['REQUEST_RECORD_PATH']
+        self.uploads_dir = app.config['REQUEST_RECORD_UPLOADS']
+        self.state_func = state_func
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self.uploads_dir:
+            os.makedirs(self.uploads_dir, exist_ok=True)
+
+        @app.before_request
+        def start_recording():
+            if request.endpoint in SKIP_ENDPOINTS:
+                return
+            g._record = {
+                "ts": time.time(),
+                "method": request.method,
+                "path": request.path,
+                "endpoint": request.endpoint,
+                "query": request.args.to_dict(flat=True),
+                "user": session.get('user_id'),
+            }
+            g._record_start = time.perf_counter()
+            g._record.update(self._body())
+
+        @app.after_request
+        def finish_recording(response):
+            record = g.pop('_record', None)
+            if record is None:
+                return response
+            record["status"] = response.status_code
+            record["duration_ms"] = round((time.perf_counter() - g._record_start) * 1000, 3)
+            # 登录请求执行后会话里才有学号
+            record["user"] = record["user"] or session.get('user_id')
+            ids = self._response_ids(response)
+            if ids:
+                record["ids"] = ids
+            if self.state_func is not None:
+                record.update(self.state_func())
+            self.write(record)
+            return response
+
+    def _body(self):
+        out = {}
+        if request.endpoint == 'put_upload_chunk':
+            # 分块的请求体是原始字节；get_data 会缓存请求体，视图函数还能再读到
+            data = request.get_data()
+            digest = hashlib.sha256(data).hexdigest()
+            out["chunk"] = {"size": len(data), "sha256": digest}
+            if self.uploads_dir:
+                self._keep_chunk(data, digest)
+        elif request.is_json:
+            if (request.content_length or 0) > MAX_BODY_BYTES:
+                out["json_bytes"] = request.content_length
+            else:
+                out["json"] = sanitize(request.get_json(silent=True))
+        elif request.form:
+            out["form"] = sanitize(request.form.to_dict(flat=True))
+        if request.files:
+            files = []
+            for field, storage in request.files.items():
+                digest, size = file_digest(storage)
+                files.append({"field": field, "filename": storage.filename, "size": size, "sha256": digest})
+                if self.uploads_dir:
+                    self._keep_upload(storage, digest)
+            out["files"] = files
+        return out
+
+    def _keep_upload(self, storage, digest):
+        path = os.path.join(self.uploads_dir, f"{digest}.zip")
+        if not os.path.exists(path):
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                shutil.copyfileobj(storage.stream, f)
+            os.replace(tmp, path)
+        storage.stream.seek(0)
+
+    def _keep_chunk(self, data, digest):
+        path = os.path.join(self.uploads_dir, f"{digest}.chunk")
+        if not os.path.exists(path):
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def _response_ids(self, response):
+        keys = RESPONSE_IDS.get(request.endpoint)
+        if not keys or not response.is_json:
+            return None
+        body = response.get_json(silent=True)
+        if not isinstance(body, dict):
+            return None
+        return {key: body[key] for key in keys if key in body}
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+request_recorder = RequestRecorder()
@@ -0,0 +1,174 @@
+# roster.py
+"""
+名单增量导入：读取分组表 → 与数据库中的 Student / Project / GroupAssignment 比对 →
+在一个事务中批量执行插入、更新、删除。已有的提交和评分不受影响。
+
+用法：python roster.py [grouped_result.xlsx] [--dry-run]
+"""
+import sys
+import time
+
+import pandas as pd
+from sqlalchemy import bindparam, delete, insert, update
+
+from identity import invalidate_students
+from progress import progress_tracker
+from models import db, GroupAssignment, Project, Student, SubmissionFile
+
+# 分组表的列名
+COL_ID, COL_NAME, COL_GROUP, COL_CLASS, COL_TARGET = 'id', '姓名', 'group_id', 'class', 'assign_work'
+
+# IN 列表分批，避免超过 SQLite 的参数上限
+CHUNK = 500
+
+
+def read_roster(path):
+    if str(path).lower().endswith('.csv'):
+        df = pd.read_csv(path, dtype={COL_ID: str})
+    else:
+        df = pd.read_excel(path, dtype={COL_ID: str})
+    return normalize(df)
+
+
+def normalize(df):
+    """整理成 id / name / group / class_id / target_group 五列，类型与模型一致"""
+    out = pd.DataFrame({
+        'id': df[COL_ID].astype(str).str.strip(),
+        'name': df[COL_NAME].astype(str),
+        'group': df[COL_GROUP].astype(int),
+        'class_id': df[COL_CLASS].astype(int),
+        'target_group': df[COL_TARGET].astype(int),
+    })
+    return out.drop_duplicates('id', keep='first')
+
+
+def diff_students(roster):
+    current = pd.DataFrame(
+        db.session.query(Student.id, Student.name, Student.group, Student.class_id).all(),
+        columns=['id', 'name', 'group', 'class_id'],
+    )
+    merged = roster[['id', 'name', 'group', 'class_id']].merge(
+        current, on='id', how='outer', suffixes=('', '_db'), indicator=True
+    )
+    inserts = merged[merged['_merge'] == 'left_only']
+    deletes = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+    changed = (
+        (both['name'] != both['name_db'])
+        | (both['group'] != both['group_db'])
+        | (both['class_id'] != both['class_id_db'])
+    )
+    updates = both[changed]
+    cols = ['id', 'name', 'group', 'class_id']
+    return (
+        inserts[cols].astype({'group': int, 'class_id': int}).to_dict('records'),
+        updates[cols].astype({'group': int, 'class_id': int}).to_dict('records'),
+        deletes['id'].tolist(),
+    )
+
+
+def diff_group_assignments(roster):
+    # 每个 (班级, 评审组) 只取第一次出现的被评组
+    wanted = roster.drop_duplicates(['class_id', 'group'], keep='first').rename(
+        columns={'group': 'reviewer_group'}
+    )[['class_id', 'reviewer_group', 'target_group']]
+    current = pd.DataFrame(
+        db.session.query(
+            GroupAssignment.class_id, GroupAssignment.reviewer_group, GroupAssignment.target_group
+        ).all(),
+        columns=['class_id', 'reviewer_group', 'target_group'],
+    )
+    merged = wanted.merge(
+        current, on=['class_id', 'reviewer_group'], how='outer', suffixes=('', '_db'), indicator=True
+    )
+    inserts = merged[merged['_merge'] == 'left_only']
+    deletes = merged[merged['_merge'] == 'right_only']
+    both = merged[merged['_merge'] == 'both']
+    updates = both[both['target_group'] != both['target_group_db']]
+    cols = ['class_id', 'reviewer_group', 'target_group']
+    return (
+        inserts[cols].astype(int).to_dict('records'),
+        updates[cols].astype(int).to_dict('records'),
+        deletes[['class_id', 'reviewer_group']].astype(int).to_dict('records'),
+    )
+
+
+def import_roster(roster, dry_run=False):
+    """roster 为 normalize 之后的 DataFrame，返回各表变更数量和耗时"""
+    start = time.perf_counter()
+    stu_ins, stu_upd, stu_del = diff_students(roster)
+    ga_ins, ga_upd, ga_del = diff_group_assignments(roster)
+    diff_ms = (time.perf_counter() - start) * 1000
+
+    stats = {
+        "students": {"insert": len(stu_ins), "update": len(stu_upd), "delete": len(stu_del)},
+        "group_assignments": {"insert": len(ga_ins), "update": len(ga_upd), "delete": len(ga_del)},
+        "diff_ms": round(diff_ms, 3),
+    }
+    if dry_run:
+        db.session.rollback()
+        return stats
+
+    start = time.perf_counter()
+    try:
+        if stu_ins:
+            db.session.execute(insert(Student), stu_ins)
+            # 新学生一律建立未提交的作品记录
+            existing_projects = set()
+            ids = [row['id'] for row in stu_ins]
+            for i in range(0, len(ids), CHUNK):
+                existing_projects.update(
+                    pid for (pid,) in db.session.query(Project.student_id)
+                    .filter(Project.student_id.in_(ids[i:i + CHUNK]))
+                )
+            new_projects = [
+                {"student_id": sid, "submitted": False} for sid in ids if sid not in existing_projects
+            ]
+            if new_projects:
+                db.session.execute(insert(Project), new_projects)
+        if stu_upd:
+            db.session.execute(update(Student), stu_upd)
+        for i in range(0, len(stu_del), CHUNK):
+            chunk = stu_del[i:i + CHUNK]
+            # 只删学生、作品记录和文件清单，评分保留
+            db.session.execute(delete(SubmissionFile).where(SubmissionFile.student_id.in_(chunk)))
+            db.session.execute(delete(Project).where(Project.student_id.in_(chunk)))
+            db.session.execute(delete(Student).where(Student.id.in_(chunk)))
+        if ga_ins:
+            db.session.execute(insert(GroupAssignment), ga_ins)
+        if ga_upd:
+            db.session.execute(update(GroupAssignment), ga_upd)
+        if ga_del:
+            table = GroupAssignment.__table__
+            db.session.execute(
+                table.delete().where(
+                    table.c.class_id == bindparam('b_class_id'),
+                    table.c.reviewer_group == bindparam('b_reviewer_group'),
+                ),
+                [{"b_class_id": r['class_id'], "b_reviewer_group": r['reviewer_group']} for r in ga_del],
+            )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if stu_ins or stu_upd or stu_del or ga_ins or ga_upd or ga_del:
+        # 班级、组别、姓名或互评分组可能变了，身份缓存失效，名单版本号自增
+        invalidate_students()
+        progress_tracker.reset()
+    stats["apply_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    return stats
+
+
+if __name__ == '__main__':
+    from app import app
+
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    path = args[0] if args else 'grouped_result.xlsx'
+    with app.app_context():
+        db.create_all()
+        start = time.perf_counter()
+        roster = read_roster(path)
+        read_ms = (time.perf_counter() - start) * 1000
+        stats = import_roster(roster, dry_run='--dry-run' in sys.argv)
+        stats["read_ms"] = round(read_ms, 3)
+        print(stats)
@@ -0,0 +1,146 @@
+# scoring.py
+"""
+共识排名与评审一致性。
+对每个 (班级, 小组, 轮次)：
+    - 每个作品 total_score 的平均分与方差（只统计有评分记录的格子）
+    - 按平均分降序得到共识排名（平均分相同按学号）
+    - 每个评审人相对共识排名的逆序对数量，归并排序计数 O(n log n)
+"""
+import csv
+import io
+
+import numpy as np
+
+from models import db, Student
+
+# 与 analysis.csv 相同的表头
+CSV_HEADER = ["Student ID", "Name", "Average Score", "Variance", "Rank", "Inversion Count"]
+
+
+def count_inversions(seq):
+    """统计 i < j 且 seq[i] < seq[j] 的对数（共识是降序，升序对就是与共识矛盾的对）"""
+    values = list(seq)
+    count = 0
+    width = 1
+    n = len(values)
+    buf = [None] * n
+    # 自底向上归并，降序合并；右半边元素严格大于左半边剩余元素时累计
+    while width < n:
+        for lo in range(0, n, 2 * width):
+            mid = min(lo + width, n)
+            hi = min(lo + 2 * width, n)
+            i, j, k = lo, mid, lo
+            while i < mid and j < hi:
+                if values[i] >= values[j]:
+                    buf[k] = values[i]
+                    i += 1
+                else:
+                    buf[k] = values[j]
+                    count += mid - i
+                    j += 1
+                k += 1
+            buf[k:hi] = values[i:mid] + values[j:hi]
+        values, buf = buf, values
+        width *= 2
+    return count
+
+
+def score_group(comparison):
+    """返回 (targets, reviewers) 两个列表"""
+    scores, rated = comparison.scores, comparison.rated
+    counts = rated.sum(axis=0)
+    masked = np.where(rated, scores, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = masked.sum(axis=0) / counts
+        variances = (np.where(rated, scores - means, 0.0) ** 2).sum(axis=0) / counts
+
+    # 共识排名：平均分降序，相同按学号；没有评分的作品排最后
+    target_ids = comparison.targets
+    sort_means = np.where(counts > 0, means, -np.inf)
+    order = sorted(range(len(target_ids)), key=lambda t: (-sort_means[t], target_ids[t]))
+    rank_of = {t: rank for rank, t in enumerate(order, start=1)}
+
+    targets = []
+    for t in order:
+        has = bool(counts[t])
+        targets.append({
+            "student_id": target_ids[t],
+            "average": float(means[t]) if has else None,
+            "variance": float(variances[t]) if has else None,
+            "rank": rank_of[t],
+            "ratings": int(counts[t]),
+        })
+
+    reviewers = []
+    for r, reviewer_id in enumerate(comparison.reviewers):
+        rated_targets = [t for t in order if rated[r, t]]
+        # 共识并列的作品按评审人自己的分数降序排，避免把并列算成矛盾
+        rated_targets.sort(key=lambda t: (-sort_means[t], -scores[r, t]))
+        reviewers.append({
+            "reviewer_id": reviewer_id,
+            "inversions": count_inversions(scores[r, t] for t in rated_targets),
+            "rated": len(rated_targets),
+        })
+    return targets, reviewers
+
+
+def score_round(comparisons):
+    """comparisons: {(class_id, group): GroupComparison} → 按班级、小组嵌套的结果"""
+    result = {}
+    for (cls_id, grp), comparison in sorted(comparisons.items()):
+        targets, reviewers = score_group(comparison)
+        result.setdefault(str(cls_id), {})[str(grp)] = {
+            "targets": targets,
+            "reviewers": reviewers,
+        }
+    return result
+
+
+def iter_csv_rows(by_class):
+    """按 analysis.csv 的列输出，每个 (小组, 作品) 一行，逆序对数取该学生作为评审人的值"""
+    inversions = {}
+    student_ids = set()
+    for groups in by_class.values():
+        for group in groups.values():
+            for reviewer in group["reviewers"]:
+                inversions[reviewer["reviewer_id"]] = reviewer["inversions"]
+            student_ids.update(t["student_id"] for t in group["targets"])
+    names = dict(
+        db.session.query(Student.id, Student.name).filter(Student.id.in_(student_ids)).all()
+    ) if student_ids else {}
+
+    yield CSV_HEADER
+    for cls_id in sorted(by_class, key=int):
+        for grp in sorted(by_class[cls_id], key=int):
+            for t in by_class[cls_id][grp]["targets"]:
+                sid = t["student_id"]
+                yield [
+                    sid,
+                    names.get(sid, ""),
+                    "" if t["average"] is None else round(t["average"], 4),
+                    "" if t["variance"] is None else round(t["variance"], 4),
+                    t["rank"],
+                    inversions.get(sid, ""),
+                ]
+
+
+def to_csv(by_class):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerows(iter_csv_rows(by_class))
+    return out.getvalue()
+
+
+if __name__ == '__main__':
+    # python scoring.py [轮次] [输出文件]，默认写第一轮到 analysis.csv
+    import sys
+    from app import app, analysis_cache
+    from analysis_cache import cached_all_group_comparisons
+
+    round_num = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    out_path = sys.argv[2] if len(sys.argv) > 2 else 'analysis.csv'
+    with app.app_context():
+        by_class = score_round(cached_all_group_comparisons(analysis_cache, round_num))
+        with open(out_path, 'w', newline='') as f:
+            f.write(to_csv(by_class))
+    print(f"wrote {out_path}")
@@ -0,0 +1,55 @@
+# sqlite_profile.py
+"""
+截止日并发写入时的 SQLite 设置，在每个新连接建立时执行：
+    - journal_mode=WAL：读写互不阻塞，只有写与写之间排队
+    - synchronous=NORMAL：WAL 模式下只在 checkpoint 时 fsync，断电最多丢最近的事务，不会损坏数据库
+    - busy_timeout：遇到写锁时等待而不是立即报 "database is locked"
+连接池大小也在这里设置。非 SQLite 数据库时只设置连接池。
+"""
+from sqlalchemy import event
+
+
+def engine_options(config):
+    """给 SQLALCHEMY_ENGINE_OPTIONS 用，需在 db.init_app 之前设置"""
+    options = {
+        "pool_size": config['DB_POOL_SIZE'],
+        "max_overflow": config['DB_POOL_MAX_OVERFLOW'],
+        "pool_timeout": config['DB_POOL_TIMEOUT'],
+    }
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # sqlite3 模块自己的等待时间（秒），与 busy_timeout 一致
+        options["connect_args"] = {"timeout": config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    return options
+
+
+def apply_profile(engine, journal_mode='WAL', synchronous='NORMAL', busy_timeout_ms=5000):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        if journal_mode:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        if synchronous:
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+
+
+def init_app(app, db):
+    app.config.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config.setdefault('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('DB_POOL_SIZE', 10)
+    app.config.setdefault('DB_POOL_MAX_OVERFLOW', 20)
+    app.config.setdefault('DB_POOL_TIMEOUT', 10)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    db.init_app(app)
+    with app.app_context():
+        apply_profile(
+            db.engine,
+            journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+            synchronous=app.config['SQLITE_SYNCHRONOUS'],
+            busy_timeout_ms=app.config['SQLITE_BUSY_TIMEOUT_MS'],
+        )
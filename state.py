@@ -0,0 +1,212 @@
+# state.py
+"""
+跨请求、跨进程共享的运行状态（第二轮是否开启、提交截止时间等）。
+多个 gunicorn worker 各有一份模块级变量，所以状态放在共享后端里：
+    - DatabaseStateBackend：app_state 表，不需要额外服务
+    - RedisStateBackend：一个 Redis hash
+前面套一层进程内 TTL 缓存，rate_round 等热点路径只读本地字典，
+其它 worker 改动后最多 STATE_CACHE_TTL 秒生效；本进程的写入立即生效。
+异步提交任务等数量多、要求立即可见的记录用 read / write / delete / scan，不经过缓存。
+"""
+import json
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import Integer, String, cast, delete, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import AppState
+
+# 支持 INSERT ... ON CONFLICT DO UPDATE 的数据库
+UPSERT_DIALECTS = {'sqlite': sqlite_insert, 'postgresql': pg_insert}
+
+REDIS_HASH = 'judge:state'
+
+# 状态名
+SECOND_ROUND_OPEN = 'second_round_open'
+SUBMISSION_DEADLINE = 'submission_deadline'
+
+
+def encode(value):
+    if isinstance(value, datetime):
+        return json.dumps({"__datetime__": value.isoformat()})
+    return json.dumps(value)
+
+
+def decode(text):
+    value = json.loads(text)
+    if isinstance(value, dict) and "__datetime__" in value:
+        return datetime.fromisoformat(value["__datetime__"])
+    return value
+
+
+class DatabaseStateBackend:
+    """
+    存在 app_state 表中。使用独立连接读写，不影响调用方 db.session 中未提交的改动。
+    """
+
+    def __init__(self, engine_getter):
+        # 传入取 engine 的函数，app context 建立后才能拿到 db.engine
+        self._engine_getter = engine_getter
+
+    def get(self, key):
+        with self._engine_getter().connect() as conn:
+            text = conn.execute(select(AppState.value).where(AppState.key == key)).scalar()
+        return None if text is None else decode(text)
+
+    def set(self, key, value):
+        text = encode(value)
+        with self._engine_getter().begin() as conn:
+            result = conn.execute(
+                update(AppState).where(AppState.key == key).values(value=text, updated_at=datetime.now())
+            )
+            if result.rowcount == 0:
+                conn.execute(insert(AppState).values(key=key, value=text, updated_at=datetime.now()))
+
+    def incr(self, key):
+        # 在一个事务内自增，多个 worker 同时自增也不会丢失
+        engine = self._engine_getter()
+        if engine.dialect.name in UPSERT_DIALECTS:
+            # 一条 upsert：第一次自增（创建版本号）也只有一条 SQL，不超出接口的查询预算
+            stmt = UPSERT_DIALECTS[engine.dialect.name](AppState).values(
+                key=key, value='1', updated_at=datetime.now())
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[AppState.key],
+                set_={"value": cast(cast(AppState.value, Integer) + 1, String), "updated_at": datetime.now()},
+            ).returning(AppState.value)
+            with engine.begin() as conn:
+                return int(conn.execute(stmt).scalar())
+        with engine.begin() as conn:
+            value = conn.execute(
+                update(AppState).where(AppState.key == key)
+                .values(value=cast(cast(AppState.value, Integer) + 1, String), updated_at=datetime.now())
+                .returning(AppState.value)
+            ).scalar()
+            if value is None:
+                conn.execute(insert(AppState).values(key=key, value='1', updated_at=datetime.now()))
+                return 1
+            return int(value)
+
+    def delete(self, key):
+        with self._engine_getter().begin() as conn:
+            conn.execute(delete(AppState).where(AppState.key == key))
+
+    def scan(self, prefix):
+        with self._engine_getter().connect() as conn:
+            rows = conn.execute(
+                select(AppState.key, AppState.value).where(AppState.key.startswith(prefix, autoescape=True))
+            )
+            return {k: decode(v) for k, v in rows}
+
+    def all(self):
+        with self._engine_getter().connect() as conn:
+            return {k: decode(v) for k, v in conn.execute(select(AppState.key, AppState.value))}
+
+
+class RedisStateBackend:
+    def __init__(self, url, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key):
+        text = self.client.hget(REDIS_HASH, key)
+        return None if text is None else decode(text)
+
+    def set(self, key, value):
+        self.client.hset(REDIS_HASH, key, encode(value))
+
+    def incr(self, key):
+        return self.client.hincrby(REDIS_HASH, key, 1)
+
+    def delete(self, key):
+        self.client.hdel(REDIS_HASH, key)
+
+    def scan(self, prefix):
+        return {k: v for k, v in self.all().items() if k.startswith(prefix)}
+
+    def all(self):
+        return {k.decode(): decode(v) for k, v in self.client.hgetall(REDIS_HASH).items()}
+
+
+_MISSING = object()
+
+
+class SharedState:
+    """在后端前面加一层进程内 TTL 缓存"""
+
+    def __init__(self, backend=None, ttl=2.0):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._cache = {}   # key -> (value, expires_at)
+
+    def init_app(self, app):
+        app.config.setdefault('STATE_BACKEND', 'database')
+        app.config.setdefault('STATE_CACHE_TTL', 2.0)
+        url = app.config['STATE_BACKEND']
+        if url.startswith(('redis://', 'rediss://', 'unix://')):
+            self.backend = RedisStateBackend(url)
+        else:
+            from models import db
+            self.backend = DatabaseStateBackend(lambda: db.engine)
+        self.ttl = app.config['STATE_CACHE_TTL']
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached is not None and cached[1] > now:
+            value = cached[0]
+        else:
+            value = self.backend.get(key)
+            if value is None:
+                value = _MISSING
+            with self._lock:
+                self._cache[key] = (value, now + self.ttl)
+        return default if value is _MISSING else value
+
+    def set(self, key, value):
+        self.backend.set(key, value)
+        with self._lock:
+            self._cache[key] = (value, time.monotonic() + self.ttl)
+
+    def incr(self, key):
+        """原子自增一个整数状态，返回新值"""
+        if self.backend is None:
+            # 版本号自增丢了，其它 worker 就永远看不到这次变化，不能静默跳过
+            raise RuntimeError("shared_state is not initialised, call shared_state.init_app(app) first")
+        value = self.backend.incr(key)
+        with self._lock:
+            self._cache[key] = (value, time.monotonic() + self.ttl)
+        return value
+
+    def refresh(self):
+        with self._lock:
+            self._cache.clear()
+
+    # ---- 不经过缓存的读写：其它 worker 的改动立即可见，也不占用进程内缓存 ----
+
+    def read(self, key, default=None):
+        value = self.backend.get(key)
+        return default if value is None else value
+
+    def write(self, key, value):
+        self.backend.set(key, value)
+
+    def delete(self, key):
+        self.backend.delete(key)
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def scan(self, prefix):
+        """名字以 prefix 开头的全部状态"""
+        return self.backend.scan(prefix)
+
+    def all(self):
+        return self.backend.all()
+
+
+shared_state = SharedState()
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# app.py 导入时就读取这些环境变量并创建目录，必须在任何测试导入 app 之前设置
+_work_dir = tempfile.mkdtemp(prefix='judge-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_work_dir, 'app.db')}"
+os.environ['STATIC_PAGES_DIR'] = os.path.join(_work_dir, 'static_pages')
+os.environ['BLOB_STORE_DIR'] = os.path.join(_work_dir, 'blobs')
+os.environ['STATE_BACKEND'] = 'database'
+os.environ.pop('REQUEST_RECORD_PATH', None)
@@ -0,0 +1,109 @@
+# tests/state_worker.py
+"""
+测试用的独立进程，模拟另一个 gunicorn worker。环境变量（DATABASE_URL 等）由测试传入，
+输出一行 JSON：
+    python tests/state_worker.py setup <学号>...          建表并导入学生
+    python tests/state_worker.py open-round <截止时间>     开启第二轮并设置截止时间
+    python tests/state_worker.py read-round                读第二轮开关和截止时间
+    python tests/state_worker.py incr <键> <次数>          自增若干次，输出最后的值
+    python tests/state_worker.py submit-held <学号>        异步提交；按住该学生的任务锁，
+                                                           读到标准输入的一行后放开，等任务结束
+    python tests/state_worker.py status <学号> <任务号>    /submit/status 和 /submit/history
+"""
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db, submission_queue  # noqa: E402
+from models import Student  # noqa: E402
+from state import SECOND_ROUND_OPEN, SUBMISSION_DEADLINE, shared_state  # noqa: E402
+
+app.config['SUBMIT_SPOOL_DIR'] = os.environ['SUBMIT_SPOOL_DIR']
+app.config['SUBMISSION_DEADLINE'] = datetime(2999, 1, 1)
+
+
+def archive():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('index.html', '<html><body>hi</body></html>')
+        zf.writestr('style.css', 'body {}')
+        zf.writestr('app.js', 'console.log(1)')
+    buf.seek(0)
+    return buf
+
+
+def login(student_id):
+    client = app.test_client()
+    client.post('/login', json={'student_id': student_id})
+    return client
+
+
+def main(cmd, *args):
+    if cmd == 'setup':
+        with app.app_context():
+            db.create_all()
+            for n, student_id in enumerate(args):
+                db.session.add(Student(id=student_id, name=f"s{student_id}", class_id=1, group=n % 2 + 1))
+            db.session.commit()
+        return {"ok": True}
+
+    if cmd == 'open-round':
+        with app.app_context():
+            shared_state.set(SECOND_ROUND_OPEN, True)
+            shared_state.set(SUBMISSION_DEADLINE, datetime.fromisoformat(args[0]))
+        return {"ok": True}
+
+    if cmd == 'read-round':
+        with app.app_context():
+            deadline = shared_state.get(SUBMISSION_DEADLINE)
+            return {
+                "second_round_open": shared_state.get(SECOND_ROUND_OPEN, False),
+                "deadline": deadline.isoformat() if deadline else None,
+            }
+
+    if cmd == 'incr':
+        key, times = args[0], int(args[1])
+        with app.app_context():
+            for _ in range(times):
+                value = shared_state.incr(key)
+        return {"value": value}
+
+    if cmd == 'submit-held':
+        student_id = args[0]
+        app.config['SUBMIT_ASYNC'] = True
+        client = login(student_id)
+        with app.app_context(), submission_queue._student_lock(student_id):
+            resp = client.post('/submit', data={'file': (archive(), 'work.zip')},
+                               content_type='multipart/form-data')
+            job_id = resp.get_json()["job_id"]
+            print(json.dumps({"job_id": job_id}), flush=True)
+            sys.stdin.readline()
+        deadline = time.time() + 30
+        while client.get(f'/submit/status/{job_id}').get_json()["state"] in ('queued', 'processing'):
+            if time.time() > deadline:
+                raise SystemExit("job did not finish")
+            time.sleep(0.05)
+        return {"state": client.get(f'/submit/status/{job_id}').get_json()["state"]}
+
+    if cmd == 'status':
+        student_id, job_id = args
+        client = login(student_id)
+        status = client.get(f'/submit/status/{job_id}')
+        history = client.get('/submit/history')
+        return {
+            "status_code": status.status_code,
+            "state": (status.get_json() or {}).get("state"),
+            "history": history.get_json(),
+        }
+
+    raise SystemExit(__doc__)
+
+
+if __name__ == '__main__':
+    print(json.dumps(main(*sys.argv[1:])), flush=True)
@@ -0,0 +1,178 @@
+# tests/test_query_budget.py
+"""
+QUERY_BUDGET_STRICT 下跑 /works、/target、/rate/first、/student/info，
+每一步都增加作品、评审目标和评分，SQL 条数应保持不变（超出预算时直接抛 QueryBudgetExceeded）。
+每次测量前先用同一学生请求一次，身份缓存和共享状态缓存都已就绪，只比较稳定状态下的条数。
+"""
+import itertools
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app import app, db
+from assignments import generate_assignments
+from models import GroupAssignment, Project, Rating, Student
+from state import shared_state
+
+FAR_FUTURE = datetime(2999, 1, 1)
+LONG_AGO = datetime(2000, 1, 1)
+
+# 每一步往被评组里加入的作品数
+STEPS = [1, 3, 8]
+
+_class_ids = itertools.count(1)
+
+
+@pytest.fixture(scope='module')
+def strict_app():
+    saved = {key: app.config.get(key) for key in ('QUERY_BUDGET_STRICT', 'PROPAGATE_EXCEPTIONS', 'SUBMISSION_DEADLINE')}
+    saved_ttl = shared_state.ttl
+    app.config.update(QUERY_BUDGET_STRICT=True, PROPAGATE_EXCEPTIONS=True, SUBMISSION_DEADLINE=FAR_FUTURE)
+    # 测试期间共享状态缓存不过期，条数不受缓存过期时刻影响
+    shared_state.ttl = 3600
+    with app.app_context():
+        db.create_all()
+    yield app
+    app.config.update(saved)
+    shared_state.ttl = saved_ttl
+
+
+@contextmanager
+def count_queries():
+    counter = {"n": 0}
+
+    def before_execute(*args):
+        counter["n"] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+
+
+class Cohort:
+    """一个班：1 组评 2 组，2 组评 1 组"""
+
+    def __init__(self):
+        self.class_id = next(_class_ids)
+        self._ids = itertools.count(1)
+        with app.app_context():
+            db.session.add(GroupAssignment(class_id=self.class_id, reviewer_group=1, target_group=2))
+            db.session.add(GroupAssignment(class_id=self.class_id, reviewer_group=2, target_group=1))
+            db.session.commit()
+
+    def add_students(self, group, n, submitted=True):
+        ids = []
+        with app.app_context():
+            for _ in range(n):
+                student_id = f"{self.class_id}{group}{next(self._ids):04d}"
+                db.session.add(Student(id=student_id, name=f"s{student_id}", class_id=self.class_id, group=group))
+                if submitted:
+                    db.session.add(Project(student_id=student_id, submitted=True, submitted_at=datetime.now(),
+                                           entry_page='index.html', total_bytes=1024, file_count=3))
+                ids.append(student_id)
+            db.session.commit()
+        return ids
+
+    def client(self, student_id):
+        client = app.test_client()
+        assert client.post('/login', json={'student_id': student_id}).status_code == 200
+        return client
+
+
+def measure(request):
+    """先请求一次预热缓存，再数第二次请求的 SQL 条数"""
+    assert request().status_code == 200
+    with count_queries() as counter:
+        resp = request()
+    assert resp.status_code == 200, resp.get_json()
+    return counter["n"], resp
+
+
+def rate_all(client, targets):
+    body = {t["student_id"]: {"innovation": "B", "professional": "A"} for t in targets}
+    return client.post('/rate/first', json=body)
+
+
+def test_works_query_count_is_constant(strict_app):
+    cohort = Cohort()
+    viewer = cohort.client(cohort.add_students(1, 1)[0])
+    counts, sizes = [], []
+    for n in STEPS:
+        cohort.add_students(2, n)
+        count, resp = measure(lambda: viewer.get('/works'))
+        counts.append(count)
+        sizes.append(len(resp.get_json()))
+    assert sizes == sorted(sizes) and len(set(sizes)) == len(STEPS)
+    assert len(set(counts)) == 1, counts
+
+
+@pytest.mark.parametrize('deadline', [FAR_FUTURE, LONG_AGO], ids=['sampled', 'assigned'])
+def test_target_query_count_is_constant(strict_app, deadline):
+    cohort = Cohort()
+    reviewer = cohort.client(cohort.add_students(1, 1)[0])
+    strict_app.config['SUBMISSION_DEADLINE'] = deadline
+    try:
+        counts, sizes = [], []
+        for n in STEPS:
+            cohort.add_students(2, n)
+            with app.app_context():
+                generate_assignments(1)
+            count, resp = measure(lambda: reviewer.get('/target?round=1'))
+            counts.append(count)
+            sizes.append(len(resp.get_json()))
+    finally:
+        strict_app.config['SUBMISSION_DEADLINE'] = FAR_FUTURE
+    assert sizes == sorted(sizes) and len(set(sizes)) == len(STEPS)
+    assert len(set(counts)) == 1, counts
+
+
+@pytest.mark.parametrize('deadline', [FAR_FUTURE, LONG_AGO], ids=['sampled', 'assigned'])
+def test_rate_first_query_count_is_constant(strict_app, deadline):
+    cohort = Cohort()
+    strict_app.config['SUBMISSION_DEADLINE'] = deadline
+    try:
+        counts, sizes = [], []
+        for n in STEPS:
+            cohort.add_students(2, n)
+            with app.app_context():
+                generate_assignments(1)
+            # 每一步换一个评审人（同一轮只能评一次），先用 /target 预热身份缓存并拿到目标
+            reviewer = cohort.client(cohort.add_students(1, 1, submitted=False)[0])
+            targets = reviewer.get('/target?round=1').get_json()
+            with count_queries() as counter:
+                resp = rate_all(reviewer, targets)
+            assert resp.status_code == 200, resp.get_json()
+            counts.append(counter["n"])
+            sizes.append(len(targets))
+    finally:
+        strict_app.config['SUBMISSION_DEADLINE'] = FAR_FUTURE
+    assert sizes == sorted(sizes) and len(set(sizes)) == len(STEPS)
+    assert len(set(counts)) == 1, counts
+
+
+def test_student_info_query_count_is_constant(strict_app):
+    cohort = Cohort()
+    student_id = cohort.add_students(1, 1)[0]
+    client = cohort.client(student_id)
+    counts = []
+    for round_num, n in enumerate(STEPS, start=1):
+        # 评分越来越多，轮次越来越大
+        targets = cohort.add_students(2, n)
+        with app.app_context():
+            db.session.add_all(
+                Rating(reviewer_id=student_id, reviewer_class=cohort.class_id, reviewer_group=1,
+                       target_group=2, target_id=target_id, innovation_score=4, professional_score=5,
+                       round=round_num)
+                for target_id in targets
+            )
+            db.session.commit()
+        count, resp = measure(lambda: client.get('/student/info'))
+        assert resp.get_json()["max_rated_round"] == round_num
+        counts.append(count)
+    assert len(set(counts)) == 1, counts
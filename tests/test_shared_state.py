@@ -0,0 +1,249 @@
+# tests/test_shared_state.py
+"""
+共享状态与异步任务记录：
+    - 两个进程共用一个 SQLite 文件（DatabaseStateBackend）
+    - 假的 Redis 客户端（RedisStateBackend），两个 SharedState 实例模拟两个 worker
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from ingest import IngestError
+from jobs import DONE, QUEUED, SUPERSEDED, SubmissionQueue
+from state import SECOND_ROUND_OPEN, SUBMISSION_DEADLINE, RedisStateBackend, SharedState
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state_worker.py')
+
+
+# ---------------- 两个进程共用一个 SQLite 文件 ----------------
+
+@pytest.fixture
+def worker_env(tmp_path):
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': f"sqlite:///{tmp_path / 'app.db'}",
+        'STATIC_PAGES_DIR': str(tmp_path / 'static_pages'),
+        'BLOB_STORE_DIR': str(tmp_path / 'blobs'),
+        'SUBMIT_SPOOL_DIR': str(tmp_path / 'spool'),
+        'STATE_BACKEND': 'database',
+    })
+    env.pop('REQUEST_RECORD_PATH', None)
+    run_worker(env, 'setup', '1001', '1002')
+    return env
+
+
+def run_worker(env, *args):
+    out = subprocess.run(
+        [sys.executable, WORKER, *args], env=env, capture_output=True, text=True, timeout=60
+    )
+    assert out.returncode == 0, out.stderr
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def test_round_state_is_visible_to_another_process(worker_env):
+    assert run_worker(worker_env, 'read-round') == {"second_round_open": False, "deadline": None}
+    run_worker(worker_env, 'open-round', '2025-06-01T08:30:00')
+    assert run_worker(worker_env, 'read-round') == {
+        "second_round_open": True, "deadline": "2025-06-01T08:30:00",
+    }
+
+
+def test_concurrent_incr_from_two_processes_loses_nothing(worker_env):
+    procs = [
+        subprocess.Popen([sys.executable, WORKER, 'incr', 'v:test', '40'],
+                         env=worker_env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        for _ in range(2)
+    ]
+    for proc in procs:
+        _, err = proc.communicate(timeout=60)
+        assert proc.returncode == 0, err
+    assert run_worker(worker_env, 'incr', 'v:test', '1') == {"value": 81}
+
+
+def test_job_status_is_visible_to_another_process(worker_env):
+    # 第一个进程提交后按住任务，第二个进程查状态
+    holder = subprocess.Popen([sys.executable, WORKER, 'submit-held', '1001'], env=worker_env,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        line = holder.stdout.readline()
+        assert line, holder.stderr.read()
+        job_id = json.loads(line)["job_id"]
+
+        pending = run_worker(worker_env, 'status', '1001', job_id)
+        assert pending["status_code"] == 200
+        assert pending["state"] == QUEUED
+        assert pending["history"]["status"] == "处理中"
+        assert pending["history"]["job_id"] == job_id
+        # 别人的任务看不到
+        assert run_worker(worker_env, 'status', '1002', job_id)["status_code"] == 404
+
+        holder.stdin.write("go\n")
+        holder.stdin.flush()
+        out, err = holder.communicate(timeout=60)
+        assert holder.returncode == 0, err
+        assert json.loads(out.strip().splitlines()[-1]) == {"state": DONE}
+    finally:
+        if holder.poll() is None:
+            holder.kill()
+
+    done = run_worker(worker_env, 'status', '1001', job_id)
+    assert done["state"] == DONE
+    assert done["history"]["status"] != "处理中"
+
+
+# ---------------- 假的 Redis 客户端 ----------------
+
+class FakeRedis:
+    """RedisStateBackend 用到的 hash 命令，键值按 redis-py 的习惯返回 bytes"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    def hget(self, name, key):
+        return self.hashes.get(name, {}).get(key.encode())
+
+    def hset(self, name, key, value):
+        with self.lock:
+            self.hashes.setdefault(name, {})[key.encode()] = value.encode()
+
+    def hincrby(self, name, key, amount=1):
+        with self.lock:
+            h = self.hashes.setdefault(name, {})
+            value = int(h.get(key.encode(), b'0')) + amount
+            h[key.encode()] = str(value).encode()
+            return value
+
+    def hdel(self, name, key):
+        with self.lock:
+            self.hashes.get(name, {}).pop(key.encode(), None)
+
+    def hgetall(self, name):
+        return dict(self.hashes.get(name, {}))
+
+
+@pytest.fixture
+def redis_client():
+    return FakeRedis()
+
+
+def worker_state(client, ttl=0):
+    return SharedState(RedisStateBackend('redis://fake', client=client), ttl=ttl)
+
+
+def test_redis_round_state_and_deadline(redis_client):
+    a, b = worker_state(redis_client), worker_state(redis_client)
+    assert b.get(SECOND_ROUND_OPEN, False) is False
+    deadline = datetime(2025, 6, 1, 8, 30)
+    a.set(SECOND_ROUND_OPEN, True)
+    a.set(SUBMISSION_DEADLINE, deadline)
+    assert b.get(SECOND_ROUND_OPEN, False) is True
+    assert b.get(SUBMISSION_DEADLINE) == deadline
+
+
+def test_redis_cache_ttl(redis_client):
+    a, b = worker_state(redis_client), worker_state(redis_client, ttl=0.2)
+    assert b.get(SECOND_ROUND_OPEN, False) is False
+    a.set(SECOND_ROUND_OPEN, True)
+    # b 的本地缓存还没过期
+    assert b.get(SECOND_ROUND_OPEN, False) is False
+    # 不经过缓存的读立即可见
+    assert b.read(SECOND_ROUND_OPEN) is True
+    time.sleep(0.25)
+    assert b.get(SECOND_ROUND_OPEN, False) is True
+
+
+def test_redis_incr_is_shared(redis_client):
+    a, b = worker_state(redis_client), worker_state(redis_client, ttl=60)
+    assert a.incr('v:test') == 1
+    assert b.incr('v:test') == 2
+    assert a.incr('v:test') == 3
+    # incr 同时刷新本地缓存
+    assert b.get('v:test') == 2
+    assert a.get('v:test') == 3
+
+
+def test_incr_without_backend_fails_loudly():
+    with pytest.raises(RuntimeError):
+        SharedState().incr('v:test')
+
+
+# ---------------- 两个 worker 的提交队列共用一个后端 ----------------
+
+def make_queue(redis_client, tmp_path):
+    app = Flask(__name__)
+    app.config['SUBMIT_SPOOL_DIR'] = str(tmp_path / 'spool')
+    queue = SubmissionQueue(state=worker_state(redis_client))
+    queue.init_app(app)
+    return queue
+
+
+def spooled(queue, content=b'zip'):
+    path = queue.spool_path()
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def wait_finished(queue, job_id):
+    deadline = time.time() + 10
+    while queue.get(job_id).active:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return queue.get(job_id)
+
+
+def test_job_state_is_shared_between_workers(redis_client, tmp_path):
+    a, b = make_queue(redis_client, tmp_path), make_queue(redis_client, tmp_path)
+    release = threading.Event()
+
+    def handler(student_id, fileobj, timer):
+        release.wait(5)
+        return {"read": len(fileobj.read())}
+
+    job = a.enqueue('1001', spooled(a), handler)
+    assert b.get(job.id).student_id == '1001'
+    assert b.pending_for('1001').id == job.id
+    release.set()
+    assert wait_finished(b, job.id).state == DONE
+    assert b.get(job.id).timings == {"read": 3}
+    assert b.pending_for('1001') is None
+    assert b.state_counts()[DONE] == 1
+
+
+def test_newer_upload_on_another_worker_supersedes_queued_job(redis_client, tmp_path):
+    a, b = make_queue(redis_client, tmp_path), make_queue(redis_client, tmp_path)
+    processed = []
+
+    def handler(student_id, fileobj, timer):
+        processed.append(fileobj.read())
+        return {}
+
+    # 按住该学生的任务锁，a 上的任务只能排队
+    with a.app.app_context(), a._student_lock('1001'):
+        old = a.enqueue('1001', spooled(a, b'old'), handler)
+        new = b.enqueue('1001', spooled(b, b'new'), handler)
+        assert a.get(old.id).state == SUPERSEDED
+        assert a.pending_for('1001').id == new.id
+    assert wait_finished(a, new.id).state == DONE
+    assert wait_finished(a, old.id).state == SUPERSEDED
+    assert processed == [b'new']
+
+
+def test_failed_job_reports_error_to_other_worker(redis_client, tmp_path):
+    a, b = make_queue(redis_client, tmp_path), make_queue(redis_client, tmp_path)
+
+    def handler(student_id, fileobj, timer):
+        raise IngestError("Missing required file types")
+
+    job = a.enqueue('1001', spooled(a), handler)
+    finished = wait_finished(b, job.id)
+    assert finished.state == 'failed'
+    assert finished.error["error"] == "Missing required file types"
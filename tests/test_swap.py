@@ -0,0 +1,142 @@
+# tests/test_swap.py
+"""作品目录的发布（ingest.swap_into_place）和 lifecycle 对版本目录的处理"""
+import os
+import threading
+
+import pytest
+
+import ingest
+from ingest import make_staging_dir, swap_into_place
+from lifecycle import Report, is_live_version, move_tree, remove_tree
+
+
+def publish(dest_dir, content):
+    staging = make_staging_dir(dest_dir)
+    with open(os.path.join(staging, 'index.html'), 'w') as f:
+        f.write(content)
+    swap_into_place(staging, dest_dir)
+
+
+def broken_replace(src, dst):
+    raise OSError("disk on fire")
+
+
+def read(dest_dir):
+    with open(os.path.join(dest_dir, 'index.html')) as f:
+        return f.read()
+
+
+def test_publish_replaces_link_and_keeps_previous_version(tmp_path):
+    dest = str(tmp_path / 'group_1' / '1001')
+    publish(dest, 'v1')
+    assert os.path.islink(dest) and read(dest) == 'v1'
+    first = os.readlink(dest)
+
+    publish(dest, 'v2')
+    assert read(dest) == 'v2'
+    second = os.readlink(dest)
+    assert second != first
+    # 换下的版本暂时保留，正在读它的请求不受影响
+    assert sorted(os.listdir(tmp_path / 'group_1')) == sorted(['1001', first, second])
+
+
+def test_publish_prunes_versions_retired_earlier(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, 'RETIRED_VERSION_SECONDS', -1)
+    dest = str(tmp_path / 'group_1' / '1001')
+    publish(dest, 'v1')
+    publish(dest, 'v2')
+    previous = os.readlink(dest)
+    publish(dest, 'v3')
+    # v1 已删除，刚换下的 v2 保留
+    assert sorted(os.listdir(tmp_path / 'group_1')) == sorted(['1001', previous, os.readlink(dest)])
+
+
+def test_dest_never_missing_during_republish(tmp_path):
+    dest = str(tmp_path / 'group_1' / '1001')
+    publish(dest, 'v0')
+    stop = threading.Event()
+    misses = []
+
+    def poll():
+        while not stop.is_set():
+            try:
+                read(dest)
+            except FileNotFoundError:
+                misses.append(1)
+
+    reader = threading.Thread(target=poll)
+    reader.start()
+    try:
+        for n in range(200):
+            publish(dest, f"v{n}")
+    finally:
+        stop.set()
+        reader.join()
+    assert misses == []
+    assert read(dest) == 'v199'
+
+
+def test_legacy_directory_is_migrated_to_a_link(tmp_path):
+    dest = tmp_path / 'group_1' / '1001'
+    dest.mkdir(parents=True)
+    (dest / 'index.html').write_text('old')
+    publish(str(dest), 'new')
+    assert os.path.islink(dest) and read(str(dest)) == 'new'
+    names = os.listdir(tmp_path / 'group_1')
+    assert len(names) == 3 and '1001' in names and os.readlink(dest) in names
+
+
+def test_failed_publish_keeps_previous_version(tmp_path, monkeypatch):
+    dest = str(tmp_path / 'group_1' / '1001')
+    publish(dest, 'v1')
+    monkeypatch.setattr(os, 'replace', broken_replace)
+    with pytest.raises(OSError):
+        publish(dest, 'v2')
+    monkeypatch.undo()
+    assert read(dest) == 'v1'
+    assert sorted(os.listdir(tmp_path / 'group_1')) == sorted(['1001', os.readlink(dest)])
+
+
+def test_failed_migration_restores_legacy_directory(tmp_path, monkeypatch):
+    dest = tmp_path / 'group_1' / '1001'
+    dest.mkdir(parents=True)
+    (dest / 'index.html').write_text('old')
+    monkeypatch.setattr(os, 'replace', broken_replace)
+    with pytest.raises(OSError):
+        publish(str(dest), 'new')
+    monkeypatch.undo()
+    assert not os.path.islink(dest) and read(str(dest)) == 'old'
+    assert os.listdir(tmp_path / 'group_1') == ['1001']
+
+
+def test_remove_tree_removes_link_and_version(tmp_path):
+    group = tmp_path / 'group_1'
+    dest = str(group / '1001')
+    publish(dest, 'v1')
+    version = os.readlink(dest)
+    assert is_live_version(str(group), version)
+    report = Report(dry_run=False)
+    remove_tree(dest, report, False)
+    assert os.listdir(group) == []
+    assert report.bytes_freed == 2
+
+
+def test_move_tree_moves_version_with_link(tmp_path):
+    src = str(tmp_path / 'group_1' / '1001')
+    dest = str(tmp_path / 'group_2' / '1001')
+    publish(src, 'v1')
+    os.makedirs(os.path.dirname(dest))
+    move_tree(src, dest)
+    assert read(dest) == 'v1'
+    assert os.listdir(tmp_path / 'group_1') == []
+
+
+def test_move_tree_does_not_overwrite_new_submission(tmp_path):
+    src = str(tmp_path / 'group_1' / '1001')
+    dest = str(tmp_path / 'group_2' / '1001')
+    publish(src, 'old')
+    publish(dest, 'new')
+    with pytest.raises(OSError):
+        move_tree(src, dest)
+    assert read(dest) == 'new'
+    assert read(src) == 'old'
@@ -0,0 +1,125 @@
+# tests/test_uploads.py
+"""分块续传：complete 在队列满或发布出错时保留会话，重试不必重新上传"""
+import hashlib
+import io
+import time
+import zipfile
+from datetime import datetime
+
+import pytest
+
+import app as app_module
+from app import app, db, submission_queue
+from models import Student
+
+
+def archive():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('index.html', '<html><body>chunked</body></html>')
+        zf.writestr('style.css', 'body {}')
+        zf.writestr('app.js', 'console.log(1)')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def upload_app(tmp_path):
+    keys = ('SUBMIT_ASYNC', 'SUBMIT_QUEUE_DEPTH', 'SUBMIT_SPOOL_DIR', 'SUBMIT_UPLOAD_DIR',
+            'SUBMIT_UPLOAD_CHUNK_BYTES', 'SUBMISSION_DEADLINE')
+    saved = {key: app.config[key] for key in keys}
+    app.config.update(
+        SUBMIT_SPOOL_DIR=str(tmp_path / 'spool'), SUBMIT_UPLOAD_DIR=str(tmp_path / 'chunks'),
+        SUBMIT_UPLOAD_CHUNK_BYTES=256, SUBMISSION_DEADLINE=datetime(2999, 1, 1),
+    )
+    with app.app_context():
+        db.create_all()
+        for student_id in ('u001', 'u002'):
+            db.session.merge(Student(id=student_id, name=student_id, class_id=900, group=1))
+        db.session.commit()
+    yield app
+    app.config.update(saved)
+
+
+def login(student_id):
+    client = app.test_client()
+    assert client.post('/login', json={'student_id': student_id}).status_code == 200
+    return client
+
+
+def upload_all_chunks(client, data):
+    resp = client.post('/submit/uploads', json={'filename': 'work.zip', 'size': len(data)})
+    assert resp.status_code == 201, resp.get_json()
+    upload = resp.get_json()
+    size = upload["chunk_size"]
+    for n in range(upload["chunk_count"]):
+        chunk = data[n * size:(n + 1) * size]
+        resp = client.put(f"/submit/uploads/{upload['upload_id']}/chunks/{n}", data=chunk,
+                          headers={'X-Chunk-Sha256': hashlib.sha256(chunk).hexdigest()})
+        assert resp.status_code == 200, resp.get_json()
+    return upload["upload_id"]
+
+
+def wait_done(client, job_id):
+    deadline = time.time() + 10
+    while True:
+        state = client.get(f'/submit/status/{job_id}').get_json()["state"]
+        if state not in ('queued', 'processing'):
+            return state
+        assert time.time() < deadline
+        time.sleep(0.02)
+
+
+def test_complete_can_be_retried_after_queue_full(upload_app):
+    upload_app.config.update(SUBMIT_ASYNC=True, SUBMIT_QUEUE_DEPTH=1)
+    other = login('u002')
+    client = login('u001')
+    upload_id = upload_all_chunks(client, archive())
+
+    # 另一个学生的任务占满队列：按住他的任务锁，任务只能排队
+    with app.app_context(), submission_queue._student_lock('u002'):
+        resp = other.post('/submit', data={'file': (io.BytesIO(archive()), 'w.zip')},
+                          content_type='multipart/form-data')
+        assert resp.status_code == 202
+        blocker = resp.get_json()["job_id"]
+
+        resp = client.post(f'/submit/uploads/{upload_id}/complete')
+        assert resp.status_code == 503
+        # 会话和已上传的块都还在
+        status = client.get(f'/submit/uploads/{upload_id}').get_json()
+        assert status["missing"] == []
+
+    assert wait_done(other, blocker) == 'done'
+    resp = client.post(f'/submit/uploads/{upload_id}/complete')
+    assert resp.status_code == 202, resp.get_json()
+    assert wait_done(client, resp.get_json()["job_id"]) == 'done'
+    # 成功后会话才删除
+    assert client.get(f'/submit/uploads/{upload_id}').status_code == 404
+
+
+def test_complete_can_be_retried_after_transient_publish_error(upload_app, monkeypatch):
+    upload_app.config.update(SUBMIT_ASYNC=False)
+    client = login('u001')
+    upload_id = upload_all_chunks(client, archive())
+
+    publish = app_module.publish_submission
+    calls = []
+
+    def flaky(student_id, fileobj, timer):
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("database is locked")
+        return publish(student_id, fileobj, timer)
+
+    monkeypatch.setattr(app_module, 'publish_submission', flaky)
+    assert client.post(f'/submit/uploads/{upload_id}/complete').status_code == 500
+    resp = client.post(f'/submit/uploads/{upload_id}/complete')
+    assert resp.status_code == 200, resp.get_json()
+    assert client.get(f'/submit/uploads/{upload_id}').status_code == 404
+
+
+def test_invalid_archive_ends_the_session(upload_app):
+    upload_app.config.update(SUBMIT_ASYNC=False)
+    client = login('u001')
+    upload_id = upload_all_chunks(client, b'not a zip file at all')
+    assert client.post(f'/submit/uploads/{upload_id}/complete').status_code == 400
+    assert client.get(f'/submit/uploads/{upload_id}').status_code == 404
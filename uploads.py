@@ -0,0 +1,282 @@
+# uploads.py
+"""
+分块续传：大作品在截止前上传失败时只需补传缺少的块，每个请求也只占用 worker 传一块的时间。
+    POST /submit/uploads                     {"filename", "size", "sha256"(可选)} → upload_id、块大小、块数
+    PUT  /submit/uploads/<id>/chunks/<n>     请求体为第 n 块（从 0 开始），X-Chunk-Sha256 头为这一块的 sha256
+    GET  /submit/uploads/<id>                已收到和缺少的块
+    POST /submit/uploads/<id>/complete       块齐全后交给与 /submit 相同的处理流程（同步发布或进入异步队列）；
+                                             队列满或发布时出现临时错误时会话保留，可以直接重试
+每个会话一个目录：data.part 按偏移写入各块，收齐后就是完整的压缩包；meta.json 记录各块的 sha256。
+状态都在磁盘上，多个 worker 可以处理同一会话的不同请求，修改 meta.json 时用文件锁互斥。
+同一块重复上传且内容相同时直接返回成功，内容不同时覆盖（客户端重传了修正后的块）。
+超过 SUBMIT_UPLOAD_TTL_SECONDS 秒没有任何请求的会话自动删除。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from ingest import IngestError
+
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+# 两次过期清理之间至少间隔的秒数（在 initiate 时顺带执行）
+SWEEP_INTERVAL = 60
+
+
+class UploadError(IngestError):
+    pass
+
+
+def retryable(exc):
+    """压缩包本身有问题（4xx 的 IngestError）重试也没用，其余异常重试 complete 可能成功"""
+    return not isinstance(exc, IngestError) or exc.status >= 500
+
+
+def sha256_hex(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class ChunkedUploads:
+    """
+    - SUBMIT_UPLOAD_DIR: 会话目录的存放位置
+    - SUBMIT_UPLOAD_CHUNK_BYTES: 块大小（最后一块可以更小）
+    - SUBMIT_UPLOAD_MAX_BYTES: 压缩包总大小上限
+    - SUBMIT_UPLOAD_TTL_SECONDS: 会话闲置多久后过期
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUBMIT_UPLOAD_DIR', os.path.join(app.root_path, 'uploads', 'chunks'))
+        app.config.setdefault('SUBMIT_UPLOAD_CHUNK_BYTES', 4 * 1024 * 1024)
+        app.config.setdefault('SUBMIT_UPLOAD_MAX_BYTES', 50 * 1024 * 1024)
+        app.config.setdefault('SUBMIT_UPLOAD_TTL_SECONDS', 2 * 3600)
+        self.app = app
+        app.extensions['chunked_uploads'] = self
+
+    @property
+    def root(self):
+        return self.app.config['SUBMIT_UPLOAD_DIR']
+
+    def _dir(self, upload_id):
+        if not UPLOAD_ID.match(upload_id or ''):
+            raise UploadError("Upload not found", status=404)
+        return os.path.join(self.root, upload_id)
+
+    # ---------------- 会话元数据 ----------------
+
+    @contextmanager
+    def _locked(self, upload_id, student_id):
+        """加锁读取会话元数据，只能操作自己的会话；过期的会话视为不存在"""
+        session_dir = self._dir(upload_id)
+        try:
+            lock = open(os.path.join(session_dir, 'lock'), 'a')
+        except FileNotFoundError:
+            raise UploadError("Upload not found", status=404)
+        with lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            meta = self._read_meta(session_dir)
+            if meta is None or meta["student_id"] != student_id:
+                raise UploadError("Upload not found", status=404)
+            if self._expired(session_dir):
+                shutil.rmtree(session_dir, ignore_errors=True)
+                raise UploadError("Upload expired, please start again", status=410)
+            yield session_dir, meta
+
+    def _read_meta(self, session_dir):
+        try:
+            with open(os.path.join(session_dir, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, session_dir, meta):
+        path = os.path.join(session_dir, 'meta.json')
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, path)  # 同时刷新 mtime，作为最近活动时间
+
+    def _seconds_left(self, session_dir):
+        """距离过期还有多少秒，会话目录已不存在时返回 0"""
+        try:
+            mtime = os.stat(os.path.join(session_dir, 'meta.json')).st_mtime
+        except FileNotFoundError:
+            # 刚创建还没写 meta.json，或创建到一半中断的会话，按目录时间算
+            try:
+                mtime = os.stat(session_dir).st_mtime
+            except FileNotFoundError:
+                return 0
+        return self.app.config['SUBMIT_UPLOAD_TTL_SECONDS'] - (time.time() - mtime)
+
+    def _expired(self, session_dir):
+        return self._seconds_left(session_dir) <= 0
+
+    def describe(self, upload_id, meta, session_dir):
+        received = {int(n) for n in meta["chunks"]}
+        return {
+            "upload_id": upload_id,
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "chunk_size": meta["chunk_size"],
+            "chunk_count": meta["chunk_count"],
+            "received": len(received),
+            "missing": [n for n in range(meta["chunk_count"]) if n not in received],
+            "expires_in": max(0, int(self._seconds_left(session_dir))),
+        }
+
+    # ---------------- 协议操作 ----------------
+
+    def initiate(self, student_id, filename, size, sha256=None):
+        config = self.app.config
+        # JSON 的 true 在 Python 里也是 int
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError("size must be a positive integer")
+        if size > config['SUBMIT_UPLOAD_MAX_BYTES']:
+            raise UploadError("File too large", detail={"max_bytes": config['SUBMIT_UPLOAD_MAX_BYTES']}, status=413)
+        if sha256 is not None and not SHA256.match(str(sha256).lower()):
+            raise UploadError("sha256 must be 64 hex characters")
+        self.sweep()
+
+        upload_id = uuid.uuid4().hex
+        session_dir = os.path.join(self.root, upload_id)
+        os.makedirs(session_dir)
+        chunk_size = config['SUBMIT_UPLOAD_CHUNK_BYTES']
+        with open(os.path.join(session_dir, 'data.part'), 'wb') as f:
+            f.truncate(size)  # 稀疏文件，各块按偏移写入
+        meta = {
+            "student_id": student_id,
+            "filename": filename,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "chunk_size": chunk_size,
+            "chunk_count": -(-size // chunk_size),
+            "chunks": {},
+            "created_at": time.time(),
+        }
+        self._write_meta(session_dir, meta)
+        return self.describe(upload_id, meta, session_dir)
+
+    def put_chunk(self, upload_id, student_id, index, data, checksum):
+        """写入第 index 块，返回会话状态；checksum 不对或长度不对时抛 UploadError"""
+        if not checksum or not SHA256.match(checksum.lower()):
+            raise UploadError("X-Chunk-Sha256 header must be the chunk's sha256")
+        checksum = checksum.lower()
+        # 在锁外算哈希，同一会话的多个块可以并行上传
+        digest = sha256_hex(data)
+        with self._locked(upload_id, student_id) as (session_dir, meta):
+            if not 0 <= index < meta["chunk_count"]:
+                raise UploadError(f"chunk must be between 0 and {meta['chunk_count'] - 1}")
+            offset = index * meta["chunk_size"]
+            expected = min(meta["chunk_size"], meta["size"] - offset)
+            if len(data) != expected:
+                raise UploadError("Chunk size mismatch", detail={"expected": expected, "received": len(data)})
+            if digest != checksum:
+                raise UploadError("Chunk checksum mismatch", detail={"chunk": index})
+            # 重传同一块：内容相同则什么都不做，只刷新活动时间
+            if meta["chunks"].get(str(index)) != checksum:
+                fd = os.open(os.path.join(session_dir, 'data.part'), os.O_WRONLY)
+                try:
+                    os.pwrite(fd, data, offset)
+                finally:
+                    os.close(fd)
+                meta["chunks"][str(index)] = checksum
+            self._write_meta(session_dir, meta)
+            return self.describe(upload_id, meta, session_dir)
+
+    def status(self, upload_id, student_id):
+        with self._locked(upload_id, student_id) as (session_dir, meta):
+            return self.describe(upload_id, meta, session_dir)
+
+    @contextmanager
+    def claim(self, upload_id, student_id, dest_path):
+        """
+        块齐全时把拼好的压缩包移到 dest_path，with 块内交给调用方发布或入队，产出原文件名。
+        with 块正常结束才删除会话，重复 complete 得到 404，不会重复发布；
+        队列满、磁盘或数据库出错等可以重试的异常把压缩包移回会话，学生重试 complete 即可，不必重新上传。
+        整个过程持有会话锁，同一会话的并发 complete 排队执行。
+        """
+        with self._locked(upload_id, student_id) as (session_dir, meta):
+            status = self.describe(upload_id, meta, session_dir)
+            if status["missing"]:
+                raise UploadError("Upload incomplete", detail={"missing": status["missing"]}, status=409)
+            data_path = os.path.join(session_dir, 'data.part')
+            if meta["sha256"] and file_sha256(data_path) != meta["sha256"]:
+                raise UploadError("File checksum mismatch", status=422)
+            shutil.move(data_path, dest_path)
+            try:
+                yield meta["filename"]
+            except Exception as e:
+                if retryable(e) and os.path.exists(dest_path):
+                    shutil.move(dest_path, data_path)
+                    self._write_meta(session_dir, meta)  # 刷新活动时间，留出重试的时间
+                else:
+                    shutil.rmtree(session_dir, ignore_errors=True)
+                raise
+            shutil.rmtree(session_dir, ignore_errors=True)
+
+    def cancel(self, upload_id, student_id):
+        with self._locked(upload_id, student_id) as (session_dir, _):
+            shutil.rmtree(session_dir, ignore_errors=True)
+
+    # ---------------- 过期清理 ----------------
+
+    def sweep(self):
+        """距离上次清理超过 SWEEP_INTERVAL 秒时清理过期会话"""
+        now = time.monotonic()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        with self._sweep_lock:
+            if now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        self.expire()
+
+    def expire(self, dry_run=False):
+        """删除过期会话，返回删除的会话数、字节数和 inode 数"""
+        stats = {"removed": 0, "bytes": 0, "inodes": 0}
+        if not os.path.isdir(self.root):
+            return stats
+        for upload_id in os.listdir(self.root):
+            session_dir = os.path.join(self.root, upload_id)
+            if not UPLOAD_ID.match(upload_id) or not self._expired(session_dir):
+                continue
+            try:
+                names = os.listdir(session_dir)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                try:
+                    # data.part 是稀疏文件，按实际占用的块计算
+                    stats["bytes"] += os.stat(os.path.join(session_dir, name)).st_blocks * 512
+                except FileNotFoundError:
+                    pass
+            stats["removed"] += 1
+            stats["inodes"] += len(names) + 1
+            if not dry_run:
+                shutil.rmtree(session_dir, ignore_errors=True)
+        return stats
+
+
+chunked_uploads = ChunkedUploads()
@@ -0,0 +1,101 @@
+# versions.py
+"""
+数据版本号与 HTTP 条件请求。
+Project / Rating / 评审分配写入后自增对应范围的版本号（存在共享状态里，多个 worker 一致）：
+    v:submissions             全年级的提交（/works）
+    v:submissions:<班级>       某班的提交（/submit/history、截止前的 /target）
+    v:ratings:<班级>:<组>:<轮>  某组某轮的评分（/analysis）
+    v:assignments:<轮>         预先生成的评审目标（截止后的 /target）
+读接口用这些版本号拼出弱 ETag，If-None-Match 命中时直接返回 304，不查库也不序列化 JSON。
+版本号读取走共享状态的进程内缓存，其它 worker 的写入最多 STATE_CACHE_TTL 秒后反映到 ETag 上。
+"""
+import hashlib
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+from identity import ROSTER_VERSION
+from state import shared_state
+
+
+def _version(key):
+    return shared_state.get(key, 0)
+
+
+def _bump(key):
+    shared_state.incr(key)
+
+
+def is_version_key(key):
+    return key.startswith('v:') or key == ROSTER_VERSION
+
+
+def carry_forward(previous):
+    """
+    清空数据库重建后调用：previous 是重建前 shared_state.all() 的结果。
+    版本号不能归零，否则客户端手里的 ETag、其它 worker 缓存的版本号可能正好对上旧数据，
+    所以在原值上 +1 写回。
+    """
+    for key, value in previous.items():
+        if is_version_key(key):
+            shared_state.set(key, int(value) + 1)
+
+
+def submissions_version(class_id=None):
+    return _version('v:submissions' if class_id is None else f'v:submissions:{class_id}')
+
+
+def ratings_version(class_id, group, round_num):
+    return _version(f'v:ratings:{class_id}:{group}:{round_num}')
+
+
+def assignments_version(round_num):
+    return _version(f'v:assignments:{round_num}')
+
+
+def roster_version():
+    return _version(ROSTER_VERSION)
+
+
+def bump_submissions(class_id):
+    _bump('v:submissions')
+    _bump(f'v:submissions:{class_id}')
+
+
+def bump_ratings(class_id, group, round_num):
+    _bump(f'v:ratings:{class_id}:{group}:{round_num}')
+
+
+def bump_assignments(round_num):
+    _bump(f'v:assignments:{round_num}')
+
+
+def weak_etag(parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def etag_versioned(parts_func):
+    """
+    parts_func() 返回决定响应内容的各项（版本号、参数等），返回 None 表示这次不缓存。
+    200 响应带弱 ETag，浏览器每次都要重新验证（no-cache）。
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            parts = parts_func()
+            if parts is None:
+                return func(*args, **kwargs)
+            # 链接里带主机名，一并算进去
+            etag = weak_etag((request.endpoint, request.host_url) + tuple(parts))
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(func(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+